@@ -0,0 +1,39 @@
+"""Envelope encryption columns for user_credentials
+
+Revision ID: 0001_credentials_envelope
+Revises:
+Create Date: 2026-10-19 10:00:00
+
+Existing rows keep 'rsa-oaep' and stay readable, they are moved over in
+batches by `python -m src.app.database.migrate_credentials test`.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '0001_credentials_envelope'
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # A constant server default is a catalog-only change, no table rewrite
+    op.add_column('user_credentials', sa.Column('encryption_scheme', sa.String(length=20), nullable=False, server_default='rsa-oaep'))
+    op.add_column('user_credentials', sa.Column('wrapped_data_key', sa.LargeBinary(), nullable=True))
+
+
+def downgrade() -> None:
+    # Envelope rows can't be read by the RSA-only code, refuse instead of losing credentials
+    op.execute("""
+        DO $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM user_credentials WHERE encryption_scheme <> 'rsa-oaep') THEN
+                RAISE EXCEPTION 'user_credentials still holds envelope-encrypted rows';
+            END IF;
+        END $$;
+    """)
+    op.drop_column('user_credentials', 'wrapped_data_key')
+    op.drop_column('user_credentials', 'encryption_scheme')
@@ -0,0 +1,101 @@
+"""Range-partition the history tables by month
+
+Revision ID: 0002_partition_history
+Revises: 0001_credentials_envelope
+Create Date: 2026-10-19 12:00:00
+
+balance_account_history, spot_history and futures_history become
+PARTITION BY RANGE (timestamp) tables with one partition per month, named
+<table>_pYYYYMM. Existing rows are copied over, retention afterwards is
+handled by detaching and dropping whole partitions (src/app/database/partitions.py).
+The primary key becomes (id, timestamp) since it must contain the partition key.
+
+The copy holds the tables for its duration, run it outside the hourly snapshot.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+revision: str = '0002_partition_history'
+down_revision: Union[str, Sequence[str], None] = '0001_credentials_envelope'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+HISTORY_TABLES = ('balance_account_history', 'spot_history', 'futures_history')
+MONTHS_AHEAD = 3
+
+COLUMNS = """
+    id UUID NOT NULL,
+    account_id VARCHAR(255) NOT NULL,
+    timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
+    asset VARCHAR(255) NOT NULL,
+    balance DOUBLE PRECISION NOT NULL,
+    usd_value DOUBLE PRECISION NOT NULL,
+    eur_value DOUBLE PRECISION NOT NULL,
+    gbp_value DOUBLE PRECISION NOT NULL,
+    btc_value DOUBLE PRECISION NOT NULL,
+    mxn_value DOUBLE PRECISION NOT NULL
+"""
+
+
+def _create_monthly_partitions(table: str, source: str) -> str:
+    """
+    One partition per month from the oldest row in `source` up to MONTHS_AHEAD months from now.
+    Months and bounds are UTC whatever the session TimeZone, like the rollup buckets.
+    """
+    return f"""
+        DO $$
+        DECLARE
+            month DATE := date_trunc('month', COALESCE((SELECT min(timestamp) FROM {source}), now()) AT TIME ZONE 'UTC');
+            last_month DATE := date_trunc('month', now() AT TIME ZONE 'UTC') + INTERVAL '{MONTHS_AHEAD} months';
+        BEGIN
+            WHILE month <= last_month LOOP
+                EXECUTE format(
+                    'CREATE TABLE IF NOT EXISTS %I PARTITION OF {table} FOR VALUES FROM (%L) TO (%L)',
+                    '{table}_p' || to_char(month, 'YYYYMM'),
+                    to_char(month, 'YYYY-MM-DD') || 'T00:00:00+00',
+                    to_char(month + INTERVAL '1 month', 'YYYY-MM-DD') || 'T00:00:00+00'
+                );
+                month := month + INTERVAL '1 month';
+            END LOOP;
+        END $$;
+    """
+
+
+def upgrade() -> None:
+    for table in HISTORY_TABLES:
+        legacy = f"{table}_legacy"
+
+        op.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+        op.execute(f"ALTER TABLE {legacy} RENAME CONSTRAINT {table}_pkey TO {legacy}_pkey")
+
+        op.execute(f"""
+            CREATE TABLE {table} (
+                {COLUMNS},
+                CONSTRAINT {table}_pkey PRIMARY KEY (id, timestamp),
+                CONSTRAINT {table}_account_id_fkey FOREIGN KEY (account_id) REFERENCES accounts (account_id)
+            ) PARTITION BY RANGE (timestamp)
+        """)
+        op.execute(_create_monthly_partitions(table, legacy))
+
+        op.execute(f"INSERT INTO {table} SELECT id, account_id, timestamp, asset, balance, usd_value, eur_value, gbp_value, btc_value, mxn_value FROM {legacy}")
+        op.execute(f"DROP TABLE {legacy}")
+
+
+def downgrade() -> None:
+    for table in HISTORY_TABLES:
+        partitioned = f"{table}_partitioned"
+
+        op.execute(f"ALTER TABLE {table} RENAME TO {partitioned}")
+        op.execute(f"ALTER TABLE {partitioned} RENAME CONSTRAINT {table}_pkey TO {partitioned}_pkey")
+
+        op.execute(f"""
+            CREATE TABLE {table} (
+                {COLUMNS},
+                CONSTRAINT {table}_pkey PRIMARY KEY (id),
+                CONSTRAINT {table}_account_id_fkey FOREIGN KEY (account_id) REFERENCES accounts (account_id)
+            )
+        """)
+        op.execute(f"INSERT INTO {table} SELECT id, account_id, timestamp, asset, balance, usd_value, eur_value, gbp_value, btc_value, mxn_value FROM {partitioned}")
+        op.execute(f"DROP TABLE {partitioned}")
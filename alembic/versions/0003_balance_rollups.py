@@ -0,0 +1,82 @@
+"""OHLC chart rollups of the snapshot history
+
+Revision ID: 0003_balance_rollups
+Revises: 0002_partition_history
+Create Date: 2026-10-19 14:00:00
+
+Creates balance_rollups and backfills it from the raw history tables.
+Bucket boundaries match src/app/database/rollups.py (UTC aligned).
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '0003_balance_rollups'
+down_revision: Union[str, Sequence[str], None] = '0002_partition_history'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SOURCES = {
+    'balance': 'balance_account_history',
+    'spot': 'spot_history',
+    'futures': 'futures_history',
+}
+
+BUCKETS = {
+    '1h': "date_trunc('hour', timestamp AT TIME ZONE 'UTC')",
+    '4h': "date_trunc('day', timestamp AT TIME ZONE 'UTC') + floor(extract(hour FROM timestamp AT TIME ZONE 'UTC') / 4) * INTERVAL '4 hours'",
+    '1d': "date_trunc('day', timestamp AT TIME ZONE 'UTC')",
+    '1w': "date_trunc('week', timestamp AT TIME ZONE 'UTC')",
+}
+
+
+def upgrade() -> None:
+    op.create_table(
+        'balance_rollups',
+        sa.Column('account_id', sa.String(length=255), sa.ForeignKey('accounts.account_id'), nullable=False),
+        sa.Column('kind', sa.String(length=10), nullable=False),
+        sa.Column('interval', sa.String(length=3), nullable=False),
+        sa.Column('bucket_start', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('open_balance', sa.Float(), nullable=False),
+        sa.Column('high_balance', sa.Float(), nullable=False),
+        sa.Column('low_balance', sa.Float(), nullable=False),
+        sa.Column('close_balance', sa.Float(), nullable=False),
+        sa.Column('open_usd_value', sa.Float(), nullable=False),
+        sa.Column('high_usd_value', sa.Float(), nullable=False),
+        sa.Column('low_usd_value', sa.Float(), nullable=False),
+        sa.Column('close_usd_value', sa.Float(), nullable=False),
+        sa.Column('first_timestamp', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('last_timestamp', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('samples', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('account_id', 'kind', 'interval', 'bucket_start', name='balance_rollups_pkey'),
+    )
+
+    for kind, table in SOURCES.items():
+        for interval, bucket in BUCKETS.items():
+            op.execute(f"""
+                INSERT INTO balance_rollups
+                SELECT
+                    account_id,
+                    '{kind}',
+                    '{interval}',
+                    ({bucket}) AT TIME ZONE 'UTC',
+                    (array_agg(balance ORDER BY timestamp))[1],
+                    max(balance),
+                    min(balance),
+                    (array_agg(balance ORDER BY timestamp DESC))[1],
+                    (array_agg(usd_value ORDER BY timestamp))[1],
+                    max(usd_value),
+                    min(usd_value),
+                    (array_agg(usd_value ORDER BY timestamp DESC))[1],
+                    min(timestamp),
+                    max(timestamp),
+                    count(*)
+                FROM {table}
+                GROUP BY account_id, {bucket}
+            """)
+
+
+def downgrade() -> None:
+    op.drop_table('balance_rollups')
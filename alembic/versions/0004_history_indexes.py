@@ -0,0 +1,83 @@
+"""Composite indexes for the hot history and account queries
+
+Revision ID: 0004_history_indexes
+Revises: 0003_balance_rollups
+Create Date: 2026-10-19 15:00:00
+
+History tables get (account_id, timestamp DESC) INCLUDE (balance, usd_value), so
+the per-account chart read is an index-only range scan. The lookups joining
+through accounts.user_id and <table>.account_id get plain btree indexes.
+
+Nothing here locks the tables against the hourly snapshot writes: the plain
+indexes are built CONCURRENTLY, the partitioned ones are created ON ONLY the
+parent and then built CONCURRENTLY per partition and attached. Partitions
+created afterwards inherit the index.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '0004_history_indexes'
+down_revision: Union[str, Sequence[str], None] = '0003_balance_rollups'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+HISTORY_TABLES = ('balance_account_history', 'spot_history', 'futures_history')
+
+PLAIN_INDEXES = {
+    'ix_accounts_user_id': ('accounts', 'user_id'),
+    'ix_user_credentials_account_id': ('user_credentials', 'account_id'),
+    'ix_risk_management_account_id': ('risk_management', 'account_id'),
+}
+
+
+def _history_index(table: str) -> str:
+    return f"ix_{table}_account_id_timestamp"
+
+
+def _partitions(table: str) -> list[str]:
+    result = op.get_bind().execute(
+        sa.text("""
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = :table
+            ORDER BY child.relname
+        """),
+        {"table": table}
+    )
+    return [row.relname for row in result]
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, (table, column) in PLAIN_INDEXES.items():
+            op.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{name}" ON "{table}" ("{column}")')
+
+        for table in HISTORY_TABLES:
+            index = _history_index(table)
+            op.execute(
+                f'CREATE INDEX IF NOT EXISTS "{index}" ON ONLY "{table}" '
+                f'(account_id, timestamp DESC) INCLUDE (balance, usd_value)'
+            )
+
+            for partition in _partitions(table):
+                partition_index = f"{partition}_account_id_timestamp_idx"
+                op.execute(
+                    f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{partition_index}" ON "{partition}" '
+                    f'(account_id, timestamp DESC) INCLUDE (balance, usd_value)'
+                )
+                op.execute(f'ALTER INDEX "{index}" ATTACH PARTITION "{partition_index}"')
+
+
+def downgrade() -> None:
+    for table in HISTORY_TABLES:
+        # Dropping the parent index drops the attached partition indexes with it
+        op.execute(f'DROP INDEX IF EXISTS "{_history_index(table)}"')
+
+    with op.get_context().autocommit_block():
+        for name in PLAIN_INDEXES:
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"')
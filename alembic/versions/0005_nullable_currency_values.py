@@ -0,0 +1,39 @@
+"""Non-USD history values may be NULL
+
+Revision ID: 0005_nullable_currency_values
+Revises: 0004_history_indexes
+Create Date: 2026-10-19 18:00:00
+
+The hourly snapshot values every row in usd, eur, gbp, btc and mxn from one
+CoinGecko snapshot. When a quote is missing (CoinGecko down or rate limiting a
+cold worker) the row is still written: usd_value falls back to the USDT peg and
+the currencies without a price are stored as NULL instead of a made up 0.
+
+Dropping NOT NULL on the partitioned parent applies to every partition and
+only touches the catalog, the tables are not rewritten.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+revision: str = '0005_nullable_currency_values'
+down_revision: Union[str, Sequence[str], None] = '0004_history_indexes'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+HISTORY_TABLES = ('balance_account_history', 'spot_history', 'futures_history')
+CURRENCY_COLUMNS = ('eur_value', 'gbp_value', 'btc_value', 'mxn_value')
+
+
+def upgrade() -> None:
+    for table in HISTORY_TABLES:
+        for column in CURRENCY_COLUMNS:
+            op.alter_column(table, column, nullable=True)
+
+
+def downgrade() -> None:
+    for table in HISTORY_TABLES:
+        for column in CURRENCY_COLUMNS:
+            op.execute(f'UPDATE "{table}" SET "{column}" = 0 WHERE "{column}" IS NULL')
+            op.alter_column(table, column, nullable=False)
@@ -0,0 +1,65 @@
+"""
+Event loop lag while decrypting exchange credentials, inline vs on the crypto pool.
+
+    python scripts/benchmarks/crypto_loop_lag.py [accounts]
+
+Uses the keys in src/security, CRYPTO_EXECUTOR / CRYPTO_WORKERS select the pool.
+"""
+import asyncio, base64, os, sys, time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+import numpy as np
+
+from src.app.security import encrypt_fields, decrypt_fields, decrypt_fields_async, shutdown_crypto_executor
+from src.config import CRYPTO_EXECUTOR, CRYPTO_WORKERS
+
+TICK = 0.001
+
+
+async def measure_lag(stop: asyncio.Event, samples: list):
+    """Sleep for TICK repeatedly and record how late each wake-up is"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        samples.append(time.perf_counter() - start - TICK)
+
+
+async def run(label: str, work):
+    stop, samples = asyncio.Event(), []
+    ticker = asyncio.create_task(measure_lag(stop, samples))
+    await asyncio.sleep(0.05)
+
+    start = time.perf_counter()
+    await work()
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await ticker
+
+    lag = np.array(samples) * 1000
+    print(f"{label:<10} wall {elapsed * 1000:8.1f} ms | loop lag p50 {np.percentile(lag, 50):6.2f} ms  p99 {np.percentile(lag, 99):7.2f} ms  max {lag.max():7.2f} ms")
+
+
+async def main(accounts: int):
+    encrypted = [
+        tuple(base64.b64decode(value) for value in encrypt_fields(f"apikey-{i}", f"secret-{i}", f"passphrase-{i}"))
+        for i in range(accounts)
+    ]
+
+    async def inline():
+        for fields in encrypted:
+            decrypt_fields(*fields)
+            await asyncio.sleep(0)
+
+    async def pooled():
+        await asyncio.gather(*(decrypt_fields_async(*fields) for fields in encrypted))
+
+    print(f"{accounts} accounts, 3 fields each, executor={CRYPTO_EXECUTOR} workers={CRYPTO_WORKERS}")
+    await run("inline", inline)
+    await run("pooled", pooled)
+    shutdown_crypto_executor()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 500))
@@ -0,0 +1,133 @@
+"""
+EXPLAIN ANALYZE of the hot history and account queries, without and with the
+indexes from migration 0004_history_indexes.
+
+    python scripts/benchmarks/history_explain.py [--seed] [--users 200] [--accounts 3] [--days 90]
+
+Run it against a local database only. --seed inserts synthetic users, accounts,
+credentials and hourly balance_account_history rows. The "before" plans run in a
+transaction that drops the indexes and is rolled back afterwards.
+"""
+import argparse, asyncio, os, sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.config import DB_HOST, DB_NAME, DB_PASS, DB_USER
+
+INDEXES = (
+    'ix_balance_account_history_account_id_timestamp',
+    'ix_spot_history_account_id_timestamp',
+    'ix_futures_history_account_id_timestamp',
+    'ix_accounts_user_id',
+    'ix_user_credentials_account_id',
+    'ix_risk_management_account_id',
+)
+
+QUERIES = {
+    "balance history (crud.get_balance_history)": """
+        SELECT timestamp, balance, usd_value
+        FROM balance_account_history
+        WHERE account_id = :account_id AND timestamp >= now() - INTERVAL '365 days'
+        ORDER BY timestamp DESC
+        LIMIT 500
+    """,
+    "accounts of a user (crud.get_accounts)": """
+        SELECT * FROM accounts WHERE user_id = :user_id
+    """,
+    "accounts with credentials (crud.get_accounts_with_credentials)": """
+        SELECT accounts.account_id, user_credentials.exchange_name, user_credentials.encrypted_apikey, risk_management.leverage_limit
+        FROM accounts
+        LEFT OUTER JOIN user_credentials ON user_credentials.account_id = accounts.account_id
+        LEFT OUTER JOIN risk_management ON risk_management.account_id = accounts.account_id
+        WHERE accounts.user_id = :user_id
+    """,
+}
+
+SEED = """
+    INSERT INTO users (id, username, name, email, role, joined_at)
+    SELECT ('00000000-0000-4000-8000-' || lpad(to_hex(u), 12, '0'))::uuid, 'explain-' || u, 'explain', 'explain-' || u || '@example.com', 'user', now()
+    FROM generate_series(1, :users) AS u;
+
+    INSERT INTO accounts (account_id, user_id, account_name, type)
+    SELECT 'explain-' || u || '-' || a, ('00000000-0000-4000-8000-' || lpad(to_hex(u), 12, '0'))::uuid, 'account ' || a, 'main-account'
+    FROM generate_series(1, :users) AS u, generate_series(1, :accounts) AS a;
+
+    INSERT INTO user_credentials (id, account_id, exchange_name)
+    SELECT gen_random_uuid(), account_id, 'bitget' FROM accounts WHERE account_id LIKE 'explain-%';
+
+    INSERT INTO risk_management (id, account_id)
+    SELECT gen_random_uuid(), account_id FROM accounts WHERE account_id LIKE 'explain-%';
+
+    DO $$
+    DECLARE
+        month DATE := date_trunc('month', now() - INTERVAL ':days days');
+    BEGIN
+        WHILE month <= date_trunc('month', now()) LOOP
+            EXECUTE format(
+                'CREATE TABLE IF NOT EXISTS %I PARTITION OF balance_account_history FOR VALUES FROM (%L) TO (%L)',
+                'balance_account_history_p' || to_char(month, 'YYYYMM'), month, month + INTERVAL '1 month'
+            );
+            month := month + INTERVAL '1 month';
+        END LOOP;
+    END $$;
+
+    INSERT INTO balance_account_history (id, account_id, timestamp, asset, balance, usd_value, eur_value, gbp_value, btc_value, mxn_value)
+    SELECT gen_random_uuid(), accounts.account_id, ts, 'USDT', v, v, v, v, v, v
+    FROM accounts,
+         generate_series(date_trunc('hour', now()) - INTERVAL ':days days', date_trunc('hour', now()), INTERVAL '1 hour') AS ts,
+         LATERAL (SELECT random() * 10000 AS v) AS value
+    WHERE accounts.account_id LIKE 'explain-%';
+"""
+
+
+async def explain(conn, label: str) -> None:
+    user_id = (await conn.execute(text("SELECT user_id FROM accounts WHERE account_id LIKE 'explain-%' ORDER BY account_id LIMIT 1"))).scalar()
+    account_id = (await conn.execute(text("SELECT account_id FROM accounts WHERE user_id = :user_id LIMIT 1"), {"user_id": user_id})).scalar()
+    if user_id is None:
+        sys.exit("No seeded accounts, run with --seed first")
+
+    for name, query in QUERIES.items():
+        plan = await conn.execute(
+            text(f"EXPLAIN (ANALYZE, BUFFERS) {query}"),
+            {"user_id": user_id, "account_id": account_id}
+        )
+        print(f"\n=== {label}: {name}")
+        print("\n".join(row[0] for row in plan))
+
+
+async def main(args) -> None:
+    engine = create_async_engine(f'postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:5432/{DB_NAME}')
+
+    if args.seed:
+        async with engine.begin() as conn:
+            for statement in SEED.replace(":days", str(args.days)).split(";\n\n"):
+                await conn.execute(text(statement), {"users": args.users, "accounts": args.accounts})
+
+    # Fresh statistics and visibility map, index-only scans need both
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("VACUUM ANALYZE"))
+
+    async with engine.connect() as conn:
+        transaction = await conn.begin()
+        for index in INDEXES:
+            await conn.execute(text(f'DROP INDEX IF EXISTS "{index}"'))
+        await explain(conn, "before")
+        await transaction.rollback()
+
+    async with engine.connect() as conn:
+        await explain(conn, "after")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", action="store_true", help="insert synthetic rows first")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--accounts", type=int, default=3, help="accounts per user")
+    parser.add_argument("--days", type=int, default=90, help="days of hourly balance history per account")
+    asyncio.run(main(parser.parse_args()))
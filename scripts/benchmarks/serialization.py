@@ -0,0 +1,85 @@
+"""
+Serialization time of a large synthetic /accounts/overview and /balance/overview response.
+
+    python scripts/benchmarks/serialization.py [--accounts 20] [--assets 500] [--runs 20]
+
+default JSONResponse     no response_model: jsonable_encoder, then json.dumps (the old routes)
+ORJSONResponse           jsonable_encoder, then orjson (what an orjson default class does)
+response_model           validated and written by pydantic-core, FastAPI's path for typed routes
+orjson only              lower bound, no validation or conversion at all
+"""
+import argparse, json, os, random, statistics, sys, time
+from typing import List
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+import orjson
+
+from src.app.schemas import AccountOverview, BalanceOverviewResponse
+
+
+def accounts_overview(accounts: int, assets: int) -> list[dict]:
+    return [
+        {
+            "id": f"account-{account}",
+            "account_name": f"account {account}",
+            "exchange_name": "bitget",
+            "assets": [
+                {"symbol": f"COIN{asset}", "available": f"{random.random():.8f}", "limitAvailable": "0", "frozen": "0", "locked": "0"}
+                for asset in range(assets)
+            ],
+            "balance": {"total": random.random() * 10000, "accounts": {"spot": random.random() * 5000, "futures": random.random() * 5000}},
+            "version": f"{random.getrandbits(64):016x}",
+        }
+        for account in range(accounts)
+    ]
+
+def balance_overview(accounts: int) -> dict:
+    return {
+        "total": 1.0, "24h_change": 0.0, "24h_change_percentage": 0.0, "partial": False,
+        "accounts": [
+            {
+                "id": f"account-{account}", "total": random.random() * 10000, "24h_change": 1.0,
+                "24h_change_percentage": 0.1, "exchange": "bitget", "account_name": f"account {account}",
+                "accounts": {"spot": 1.0, "futures": 2.0}, "stale": False,
+            }
+            for account in range(accounts)
+        ],
+    }
+
+
+def measure(label: str, serialize, runs: int):
+    size = len(serialize())  # warm up
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        serialize()
+        timings.append(time.perf_counter() - start)
+    print(f"  {label:<22} mean {statistics.mean(timings) * 1000:8.2f} ms  p50 {statistics.median(timings) * 1000:8.2f} ms  {size / 1024:8.1f} KiB")
+
+
+def compare(name: str, payload, model, runs: int):
+    adapter = TypeAdapter(model)
+    print(name)
+    measure("default JSONResponse", lambda: json.dumps(jsonable_encoder(payload), ensure_ascii=False, separators=(",", ":")).encode(), runs)
+    measure("ORJSONResponse", lambda: orjson.dumps(jsonable_encoder(payload)), runs)
+    measure("response_model", lambda: adapter.dump_json(adapter.validate_python(payload), by_alias=True), runs)
+    measure("orjson only", lambda: orjson.dumps(payload), runs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--accounts", type=int, default=20)
+    parser.add_argument("--assets", type=int, default=500, help="assets per account")
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    random.seed(0)
+    compare(f"/accounts/overview, {args.accounts} accounts x {args.assets} assets", accounts_overview(args.accounts, args.assets), List[AccountOverview], args.runs)
+    compare(f"/balance/overview, {args.accounts} accounts", balance_overview(args.accounts), BalanceOverviewResponse, args.runs * 50)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+get_accounts and get_balance_history latency per DB_CONNECTION_MODE.
+
+    python scripts/benchmarks/statement_cache.py [calls] [--pgbouncer-host HOST]
+
+direct           prepared statements cached per connection (DB_STATEMENT_CACHE_SIZE)
+direct no cache  same pool, every call prepares again
+pgbouncer        no statement cache, unique statement names, no client pool
+
+Each mode runs in its own process since the engines read their settings at import.
+Needs the rows seeded by history_explain.py --seed. Without --pgbouncer-host the
+pgbouncer mode talks to Postgres directly, which still measures its client side cost.
+"""
+import argparse, asyncio, os, statistics, subprocess, sys, time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, ROOT)
+
+MODES = {
+    "direct": {"DB_CONNECTION_MODE": "direct"},
+    "direct no cache": {"DB_CONNECTION_MODE": "direct", "DB_STATEMENT_CACHE_SIZE": "0"},
+    "pgbouncer": {"DB_CONNECTION_MODE": "pgbouncer"},
+}
+
+
+def report(label: str, timings: list[float]):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"  {label:<22} mean {statistics.mean(timings) * 1000:7.3f} ms  p50 {statistics.median(timings) * 1000:7.3f} ms  p95 {p95 * 1000:7.3f} ms")
+
+
+async def run(calls: int):
+    from src.app.database import crud
+    from src.app.database.database import dispose_engines
+
+    user_ids = [f"00000000-0000-4000-8000-{user:012x}" for user in range(1, 51)]
+    account_ids = [f"explain-{user}-1" for user in range(1, 51)]
+
+    # Warm up the pool, the compiled cache and the statement cache
+    for user_id, account_id in zip(user_ids, account_ids):
+        await crud.get_accounts(user_id=user_id)
+        await crud.get_balance_history(account_id=account_id, limit=168)
+
+    for label, call in (
+        ("get_accounts", lambda i: crud.get_accounts(user_id=user_ids[i % len(user_ids)])),
+        ("get_balance_history", lambda i: crud.get_balance_history(account_id=account_ids[i % len(account_ids)], limit=168)),
+    ):
+        timings = []
+        for i in range(calls):
+            start = time.perf_counter()
+            await call(i)
+            timings.append(time.perf_counter() - start)
+        report(label, timings)
+
+    await dispose_engines()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("calls", type=int, nargs="?", default=2000)
+    parser.add_argument("--pgbouncer-host", help="host of a PgBouncer in transaction mode")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(run(args.calls))
+        return
+
+    for mode, env in MODES.items():
+        env = {**os.environ, **env}
+        if mode == "pgbouncer" and args.pgbouncer_host:
+            env["LOCAL_DB_HOST"] = args.pgbouncer_host
+        print(mode)
+        subprocess.run([sys.executable, __file__, str(args.calls), "--child"], env=env, check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+import asyncio, itertools, logging, threading, time
+
+logger = logging.getLogger(__name__)
+
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    In-process LRU cache whose entries also expire `ttl` seconds after being set.
+    Values only live in memory, nothing is ever persisted.
+    """
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None, valid: Optional[Callable[[Any], bool]] = None) -> Any:
+        """Value of `key`, `default` (a miss) when absent, expired or rejected by `valid`"""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            if valid is not None and not valid(value):
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class SWRCache:
+    """
+    Async stale-while-revalidate cache for responses, keys are tuples starting with the user ID.
+
+    Up to `fresh_ttl` seconds old an entry is served as is. Until `fresh_ttl + stale_ttl` it is
+    still served right away while a single background refresh runs. Older or missing entries are
+    loaded inline, concurrent callers of the same key share that one load.
+
+    With a `shared` utils.RedisClient, loads go through Redis first and only one replica at a time
+    runs the loader for a key, the others pick up its result. Invalidations reach every replica.
+    """
+    INVALIDATE_CHANNEL = "swr:invalidate"
+
+    def __init__(self, maxsize: int = 10_000, fresh_ttl: float = 15.0, stale_ttl: float = 120.0, shared: Optional[Any] = None) -> None:
+        self.maxsize = maxsize
+        self.fresh_ttl = fresh_ttl
+        self.stale_ttl = stale_ttl
+        self.shared = shared
+        self._data: OrderedDict = OrderedDict()   # key -> (stored_at, value), stored_at is wall clock so replicas agree on ages
+        self._loading: dict[Hashable, asyncio.Task] = {}
+        self._refreshing: dict[Hashable, asyncio.Task] = {}
+        self._generations: dict[Hashable, int] = {}  # user -> invalidation count, only while a load of theirs runs
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.refresh_errors = 0
+
+    async def get(self, key: tuple, loader: Callable[[], Awaitable[Any]]) -> tuple[Any, float, str]:
+        """Return (value, age in seconds, 'hit' | 'stale' | 'shared' | 'miss')"""
+        entry = self._data.get(key)
+        if entry is not None:
+            stored_at, value = entry
+            age = max(time.time() - stored_at, 0.0)
+
+            if age < self.fresh_ttl:
+                self.hits += 1
+                self._data.move_to_end(key)
+                return value, age, "hit"
+
+            if age < self.fresh_ttl + self.stale_ttl:
+                self.stale_hits += 1
+                self._data.move_to_end(key)
+                if key not in self._refreshing:
+                    task = asyncio.create_task(self._refresh(key, loader, stored_at))
+                    self._refreshing[key] = task
+                    task.add_done_callback(lambda _: self._refreshed(key))
+                return value, age, "stale"
+
+        stored_at, value, state = await self._load(key, loader)
+        if state == "shared":
+            self.shared_hits += 1
+        else:
+            self.misses += 1
+        return value, max(time.time() - stored_at, 0.0), state
+
+    async def invalidate(self, user_id: Any):
+        """Drop every entry of a user, here and with a shared tier on every replica"""
+        user_id = str(user_id)
+        self.forget(user_id)
+        if self.shared is not None:
+            await self.shared.delete(f"swr:{user_id}")
+            await self.shared.publish(self.INVALIDATE_CHANNEL, user_id)
+
+    def forget(self, user_id: Any):
+        """Drop the local entries of a user, loads already running for them won't be stored"""
+        user_id = str(user_id)
+        self._generations[user_id] = self._generations.get(user_id, 0) + 1
+        for key in [key for key in self._data if key[0] == user_id]:
+            del self._data[key]
+        self._release_generation(user_id)
+
+    async def listen(self):
+        """Apply the invalidations of the other replicas, run it as a background task"""
+        if self.shared is not None:
+            await self.shared.listen(self.INVALIDATE_CHANNEL, self.forget)
+
+    def clear(self):
+        for user_id in {key[0] for key in self._data}:
+            self.forget(user_id)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    async def _load(self, key: tuple, loader: Callable[[], Awaitable[Any]]) -> tuple[float, Any, str]:
+        task = self._loading.get(key)
+        if task is None:
+            task = asyncio.create_task(self._load_entry(key, loader, self._generations.get(key[0], 0)))
+            self._loading[key] = task
+            task.add_done_callback(lambda done: self._loaded(key, done))
+        # The load runs in its own task: a caller that gets cancelled leaves it running for the others
+        return await asyncio.shield(task)
+
+    async def _load_entry(self, key: tuple, loader: Callable[[], Awaitable[Any]], generation: int) -> tuple[float, Any, str]:
+        entry = await self._fetch(key, loader, generation)
+        self._store(key, entry, generation)
+        return entry
+
+    def _loaded(self, key: tuple, task: asyncio.Task):
+        self._loading.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # retrieved, every caller may be gone
+        self._release_generation(key[0])
+
+    def _refreshed(self, key: tuple):
+        self._refreshing.pop(key, None)
+        self._release_generation(key[0])
+
+    def _release_generation(self, user_id: str):
+        """Generations only fence the loads in flight, a user without any needs no entry"""
+        if not any(key[0] == user_id for key in itertools.chain(self._loading, self._refreshing)):
+            self._generations.pop(user_id, None)
+
+    async def _refresh(self, key: tuple, loader: Callable[[], Awaitable[Any]], stored_at: float):
+        generation = self._generations.get(key[0], 0)
+        try:
+            entry = await self._fetch(key, loader, generation, newer_than=stored_at)
+        except Exception as e:
+            self.refresh_errors += 1
+            logger.warning(f"Background refresh of {key} failed, serving the stale entry: {e}")
+            return
+        self._store(key, entry, generation)
+
+    async def _fetch(self, key: tuple, loader: Callable[[], Awaitable[Any]], generation: int, newer_than: float = 0.0) -> tuple[float, Any, str]:
+        """(stored_at, value, 'shared' | 'miss'): a fresh entry of another replica, else the loader's"""
+        async def load():
+            return time.time(), await loader(), "miss"
+
+        if self.shared is None:
+            return await load()
+
+        user_id, field = key[0], ":".join(map(str, key[1:]))
+        shared_key = f"swr:{user_id}"
+
+        entry = await self.shared.hget(shared_key, field)
+        if entry is not None and entry[0] > newer_than and time.time() - entry[0] < self.fresh_ttl:
+            return entry[0], entry[1], "shared"
+        if entry is not None:
+            newer_than = max(newer_than, entry[0])
+
+        async def read():
+            entry = await self.shared.hget(shared_key, field)
+            return (entry[0], entry[1], "shared") if entry is not None and entry[0] > newer_than else None
+
+        async def write(entry):
+            if self._generations.get(user_id, 0) == generation:
+                await self.shared.hset(shared_key, field, entry[:2], ttl=self.fresh_ttl + self.stale_ttl)
+
+        return await self.shared.single_flight(f"{shared_key}:{field}", load, read, write)
+
+    def _store(self, key: tuple, entry: tuple, generation: int):
+        if self._generations.get(key[0], 0) != generation:
+            return  # invalidated while loading
+        self._data[key] = (entry[0], entry[1])
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.stale_hits + self.shared_hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "fresh_ttl": self.fresh_ttl,
+            "stale_ttl": self.stale_ttl,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "refresh_errors": self.refresh_errors,
+            "hit_rate": (self.hits + self.stale_hits + self.shared_hits) / lookups if lookups else 0.0,
+        }
@@ -1,126 +1,135 @@
 # src/app/celery/async_tasks.py
 
 import logging
-import sys
-
-if len(sys.argv) > 1 and sys.argv[1] == "test":
-    from src.app.database.crud import (
-        get_all_users,
-        get_user_accounts,
-        get_account_credentials,
-        add_spot_historical_metadata,
-        add_futures_historical_metadata,
-        add_balance_historical_metadata,
-        trim_balance_history_per_user
-    )
-
-    from src.app.exchanges.exchange_utils import get_account_balance_, get_asset_price_in_usd 
-    from src.app.proxy import BrightProxy
-else:
-    from app.database.crud import (
-        get_all_users,
-        get_user_accounts,
-        get_account_credentials,
-        add_spot_historical_metadata,
-        add_futures_historical_metadata,
-        add_balance_historical_metadata,
-        trim_balance_history_per_user
-    )
-
-    from app.exchanges.exchange_utils import get_account_balance_, get_asset_price_in_usd 
-    from app.proxy import BrightProxy
-    
+
+from src.app.database.crud import (
+    get_accounts_with_credentials,
+    get_user_accounts
+)
+from src.app.database.history_writer import HistoryWriter
+from src.app.database.partitions import ensure_history_partitions, maintain_history_partitions
+from src.app.database.rollups import trim_rollups
+
+from src.app.exchanges.exchange_utils import get_account_balance_
+from src.app.proxy import BrightProxy
+from src.app.live import live_hub
+from src.app.metrics import SNAPSHOT_DURATION, SNAPSHOT_ACCOUNT_DURATION, SNAPSHOT_ACCOUNTS, SNAPSHOT_RETRIES
+from src.app.ratelimit import RateLimited
+from src.app.tracing import traced
+from src.app.valuation import CURRENCIES, get_price_snapshot, value_holdings, as_float
+
 import asyncio
 import aiohttp
+import time
+import numpy as np
 from asyncio import Semaphore
+from typing import Optional
 
 # Initialize logger
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)  # Adjust as needed
 
 # Configuration
-MAX_ROWS_PER_USER = 13140
 BATCH_SIZE = 100
 MAX_CONCURRENT_API_CALLS = 50  # Adjust based on proxy and API limits
 API_RETRY_ATTEMPTS = 3
 API_RETRY_DELAY = 2  # seconds
 
-# Initialize a semaphore for controlling concurrency
+# Bounds this worker's open connections. The exchange rate limits themselves are shared with
+# the API replicas, curl_api waits on the token buckets in app.ratelimit
 semaphore = Semaphore(MAX_CONCURRENT_API_CALLS)
 
+@traced("snapshot.run")
 async def _fetch_user_assets_task():
     """
     Fetch all necessary data before processing assets concurrently.
     """
     logger.info("Starting to fetch user assets...")
+    start = time.perf_counter()
     try:
-        users = await get_all_users()
-        logger.info(f"Fetched {len(users)} users.")
+        # Accounts of every user, with credentials, in a single query
+        accounts = await get_accounts_with_credentials()
+        logger.info(f"Total accounts fetched: {len(accounts)}")
 
         # Initialize the proxy once
         proxy = await BrightProxy().create()
         logger.info("Proxy initialized.")
 
-        # Fetch asset price in USD once
-        asset_price_usd = await get_asset_price_in_usd("usd")
-        logger.info(f"Asset price fetched: USD {asset_price_usd}")
-
-        # Gather all accounts across all users
-        accounts = []
-        for user in users:
-            user_accounts = await get_user_accounts(user_id=user['id'])
-            for account in user_accounts:
-                accounts.append({
-                    "user_id": user['id'],
-                    **account
-                })
-        logger.info(f"Total accounts fetched: {len(accounts)}")
+        # One price/FX snapshot values the whole run
+        prices = await get_price_snapshot()
+        logger.info(f"Price snapshot taken at {prices.taken_at}")
 
-        # Prepare detailed account information with credentials
         detailed_accounts = []
         for account in accounts:
-            credentials = await get_account_credentials(account_id=account['id'])
-            if not credentials:
-                logger.warning(f"No credentials found for account {account['id']}. Skipping.")
+            if account.exchange is None:
+                logger.warning(f"No credentials found for account {account.account_id}. Skipping.")
                 continue  # Skip accounts without credentials
-            detailed_accounts.append({
-                "user_id": account['user_id'],
-                "account_id": account['id'],
-                "exchange": credentials.get('exchange'),
-                "proxy": credentials.get('proxy'),
-                "apikey": credentials.get('apikey'),
-                "secret_key": credentials.get('secret_key'),
-                "passphrase": credentials.get('passphrase'),
-                "proxy_ip": account.get('proxy_ip')
-            })
+            detailed_accounts.append(account)
         logger.info(f"Detailed accounts prepared: {len(detailed_accounts)}")
 
         # Split into batches for processing
         batches = [detailed_accounts[i:i + BATCH_SIZE] for i in range(0, len(detailed_accounts), BATCH_SIZE)]
         logger.info(f"Total batches to process: {len(batches)}")
 
+        # Make sure this hour's rows have a partition to land in
+        await ensure_history_partitions()
+
+        history_writer = HistoryWriter()
+        history_writer.start()
+
         for index, batch in enumerate(batches, start=1):
             logger.info(f"Processing batch {index}/{len(batches)} with {len(batch)} accounts.")
             tasks = [
                 _fetch_assets_for_user(
-                    user_id=account['user_id'],
-                    account_id=account['account_id'],
-                    exchange=account['exchange'], 
+                    user_id=account.user_id,
+                    account_id=account.account_id,
+                    exchange=account.exchange,
                     proxy=proxy,
-                    apikey=account['apikey'],
-                    secret_key=account['secret_key'],
-                    passphrase=account['passphrase'],
-                    proxy_ip=account['proxy_ip'],
-                    asset_price_usd=asset_price_usd
+                    apikey=account.apikey,
+                    secret_key=account.secret_key,
+                    passphrase=account.passphrase,
+                    proxy_ip=account.proxy_ip
                 )
                 for account in batch
             ]
             # Gather tasks with concurrency control
-            await asyncio.gather(*tasks, return_exceptions=True)  # Handle exceptions within tasks
+            balances = await asyncio.gather(*tasks, return_exceptions=True)  # Handle exceptions within tasks
+            balances = [balance for balance in balances if isinstance(balance, dict)]
+
+            # Value the whole batch in every currency at once, then write its snapshot rows
+            await _write_valued_balances(history_writer, balances, prices)
+            await history_writer.flush()
+
+        await history_writer.close()
+        logger.info(f"History rows written: {history_writer.rows_written}, dropped: {history_writer.rows_dropped}")
 
     except Exception as e:
         logger.error(f"Error in _fetch_user_assets_task: {e}", exc_info=True)
-
+    finally:
+        SNAPSHOT_DURATION.observe(time.perf_counter() - start)
+
+# History kinds of one account's snapshot, each written as one row
+SNAPSHOT_KINDS = ('spot', 'futures', 'balance')
+
+async def _write_valued_balances(history_writer: HistoryWriter, balances: list[dict], prices):
+    """Buffer the history rows of `balances`, valued in every currency with one pass over the batch"""
+    # Exchange balances are USDT amounts
+    holdings = [{"USDT": balance[kind]} for balance in balances for kind in SNAPSHOT_KINDS]
+    values = value_holdings(holdings, prices).reshape(len(balances), len(SNAPSHOT_KINDS), len(CURRENCIES))
+
+    unpriced = np.isnan(values).any(axis=(1, 2)).sum()
+    if unpriced:
+        logger.warning(f"{unpriced} of {len(balances)} accounts written without some currency values, prices are missing")
+
+    for balance, account_values in zip(balances, values):
+        for kind, kind_values in zip(SNAPSHOT_KINDS, account_values):
+            currency_values = {f"{currency}_value": as_float(value) for currency, value in zip(CURRENCIES, kind_values)}
+            # usd_value is NOT NULL and feeds the rollups: without a USDT quote take the peg
+            if currency_values["usd_value"] is None:
+                currency_values["usd_value"] = float(balance[kind])
+            await history_writer.add(kind, account_id=balance["account_id"], asset="usd", balance=balance[kind], **currency_values)
+
+@traced("snapshot.account")
 async def _fetch_assets_for_user(
     user_id: str,
     account_id: str,
@@ -129,17 +138,14 @@ async def _fetch_assets_for_user(
     apikey: str = None,
     secret_key: str = None,
     passphrase: str = None,
-    proxy_ip: str = None,
-    asset_price_usd: float = None,
-    asset_price_eur: float = None,
-    asset_price_gbp: float = None,
-    asset_price_btc: float = None,
-    asset_price_mxn: float = None
-):
+    proxy_ip: str = None
+) -> Optional[dict]:
     """
-    Fetch assets for a single user account using the API.
+    Fetch the spot, futures and total balance of a single user account using the API.
+    None when every attempt failed.
     """
     async with semaphore:
+        start = time.perf_counter()
         for attempt in range(1, API_RETRY_ATTEMPTS + 1):
             try:
                 logger.debug(f"Attempt {attempt}: Fetching assets for account {account_id}.")
@@ -158,39 +164,48 @@ async def _fetch_assets_for_user(
                 if not assets:
                     raise ValueError("Received empty assets data.")
 
-                # Process assets
+                # Process assets, valued with the rest of the batch
                 spot_balance = float(assets['accounts'].get('spot', 0.0))
-                spot_usd_value = spot_balance * asset_price_usd
-
                 future_balance = float(assets['accounts'].get('futures', 0.0))
-                future_usd_value = future_balance * asset_price_usd
-
                 total_balance = float(assets.get('total', 0.0))
-                total_usd_value = total_balance * asset_price_usd
 
-                # Proces Diferent currencies
-
-
-                # Save assets to historical metadata
-                await asyncio.gather(
-                    add_spot_historical_metadata(account_id=account_id, asset="usd", balance=spot_balance, usd_value=spot_usd_value, eur_value=None, gbp_value=None, btc_value=None, mxn_value=None),
-                    add_futures_historical_metadata(account_id=account_id, asset="usd", balance=future_balance, usd_value=future_usd_value, eur_value=None, gbp_value=None, btc_value=None, mxn_value=None),
-                    add_balance_historical_metadata(account_id=account_id, asset="usd", balance=total_balance, usd_value=total_usd_value, eur_value=None, gbp_value=None, btc_value=None, mxn_value=None)
-                )
-
-                # Trim balance history to maintain record limits per user
-                await trim_balance_history_per_user(user_id=user_id, max_records=MAX_ROWS_PER_USER)
+                # Push the new snapshot to the user's open dashboards
+                await live_hub.publish(user_id, account_id, {
+                    "total": total_balance,
+                    "accounts": {"spot": spot_balance, "futures": future_balance},
+                })
 
                 logger.info(f"Successfully processed account {account_id} for user {user_id}.")
-                break  # Exit the retry loop upon success
+                SNAPSHOT_ACCOUNTS.labels(exchange=exchange, outcome="ok").inc()
+                SNAPSHOT_ACCOUNT_DURATION.labels(exchange=exchange).observe(time.perf_counter() - start)
+                return {"account_id": account_id, "spot": spot_balance, "futures": future_balance, "balance": total_balance}
 
             except Exception as e:
                 logger.warning(f"Attempt {attempt} failed for account {account_id}: {e}")
                 if attempt < API_RETRY_ATTEMPTS:
-                    await asyncio.sleep(API_RETRY_DELAY)
+                    SNAPSHOT_RETRIES.labels(exchange=exchange).inc()
+                    # Rate limited: try again once the exchange bucket has a token
+                    await asyncio.sleep(e.retry_after if isinstance(e, RateLimited) else API_RETRY_DELAY)
                 else:
+                    outcome = "rate_limited" if isinstance(e, RateLimited) else "failed"
+                    SNAPSHOT_ACCOUNTS.labels(exchange=exchange, outcome=outcome).inc()
                     logger.error(f"All retry attempts failed for account {account_id}: {e}", exc_info=True)
 
+        SNAPSHOT_ACCOUNT_DURATION.labels(exchange=exchange).observe(time.perf_counter() - start)
+        return None
+
+
+async def _maintain_history_partitions_task():
+    """Create upcoming history partitions, drop the ones past retention and trim old rollups."""
+    try:
+        dropped = await maintain_history_partitions()
+        logger.info(f"History partitions maintained, dropped: {dropped}")
+
+        await trim_rollups()
+        logger.info("Expired chart rollups trimmed.")
+    except Exception as e:
+        logger.error(f"Error in _maintain_history_partitions_task: {e}", exc_info=True)
+
 
 # Entry point for testing
 async def database_crud_testing():
@@ -1,6 +1,5 @@
 # src/app/celery_app/celery_config.py
 
-import sys
 import celery as celery_lib
 from celery.schedules import crontab
 import logging
@@ -9,16 +8,13 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-if len(sys.argv) > 1 and sys.argv[1] == "test":
-    from src.config import REDIS_URL
-else:
-    from config import REDIS_URL
+from src.config import REDIS_URL
 
 celery_app = celery_lib.Celery(
     'tasks',
     broker=REDIS_URL,
     backend=REDIS_URL,
-    include=['app.celery_app.tasks'] 
+    include=['src.app.celery_app.tasks'] 
 )
 
 # General Configuration
@@ -35,6 +31,11 @@ celery_app.conf.beat_schedule = {
         'schedule': crontab(minute=0, hour='*'),  # Runs at minute 0 of every hour
         'options': {'queue': 'once_off_queue'},    # Ensures it uses the correct queue
     },
+    'maintain-history-partitions-daily': {
+        'task': 'app.celery_app.tasks.maintain_history_partitions',
+        'schedule': crontab(minute=30, hour=0),  # Runs once a day, away from the hourly snapshot
+        'options': {'queue': 'once_off_queue'},
+    },
 }
 
 logger.info("Celery app configured with beat schedule for every hour.")
@@ -1,37 +1,36 @@
 # src/app/celery_app/tasks.py
 
 import logging
-import sys
 import asyncio
 import threading
 
 from celery.signals import worker_init, worker_shutdown
-from sqlalchemy.ext.asyncio import create_async_engine
+from prometheus_client import start_http_server
 
-from .db_engine_holder import engine as global_engine
-
-if len(sys.argv) > 1 and sys.argv[1] == "test":
-    from src.app.celery_app.celery_config import celery_app
-    from src.app.celery_app.async_tasks import _fetch_user_assets_task
-else:
-    from app.celery_app.celery_config import celery_app
-    from app.celery_app.async_tasks import _fetch_user_assets_task
+from src.app.celery_app.celery_config import celery_app
+from src.app.celery_app.async_tasks import _fetch_user_assets_task, _maintain_history_partitions_task
+from src.app.database.database import init_engines, dispose_engines
+from src.app.metrics import metrics_registry
+from src.app.tracing import configure_tracing
+from src.config import CELERY_METRICS_PORT
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 persistent_loop = None
+tracer_provider = None
 
 @worker_init.connect
 def init_persistent_loop(**kwargs):
     """
     Runs once when the Celery worker process boots up.
-    We create a single event loop and the DB engine here,
+    We create a single event loop and bind the DB engines to it,
     both living as long as the worker.
     """
-    global persistent_loop, global_engine
+    global persistent_loop, tracer_provider
 
-    logger.info("Initializing persistent loop + DB engine in worker_init...")
+    logger.info("Initializing persistent loop + DB engines in worker_init...")
+    tracer_provider = configure_tracing("fundy-worker")
 
     # Create the persistent loop
     persistent_loop = asyncio.new_event_loop()
@@ -46,47 +45,38 @@ def init_persistent_loop(**kwargs):
     t.start()
     logger.info("Persistent loop thread started.")
 
-    # Create the async engine on the new loop
-    def create_engine_sync():
-        # e.g. read DB credentials from config
-        from config import DB_HOST, DB_NAME, DB_PASS, DB_USER
-
-        db_url = f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:5432/{DB_NAME}"
-        logger.info("Creating async engine on persistent loop.")
-        new_engine = create_async_engine(
-            db_url,
-            echo=False,
-            future=True,
-            pool_size=10,
-            max_overflow=20,
-            pool_timeout=30
-        )
-        return new_engine
-
-    async def async_wrapper():
-        return create_engine_sync()
+    # Same engine factory as the API, bound to the loop every task runs on
+    async def bind_engines():
+        init_engines()
 
-    future = asyncio.run_coroutine_threadsafe(async_wrapper(), persistent_loop)
-    new_engine = future.result()  # block until engine is created
+    asyncio.run_coroutine_threadsafe(bind_engines(), persistent_loop).result()
+    logger.info("Async engines created on the persistent loop.")
 
-    global_engine = new_engine
-    logger.info("Async engine created and stored globally.")
+    # Snapshot duration/throughput, exchange and DB metrics of this worker for Prometheus
+    if CELERY_METRICS_PORT:
+        start_http_server(CELERY_METRICS_PORT, registry=metrics_registry())
+        logger.info(f"Metrics served on port {CELERY_METRICS_PORT}.")
 
 @worker_shutdown.connect
 def shutdown_persistent_loop(**kwargs):
     """
-    Optionally close the loop & engine when the worker shuts down.
+    Close the pooled connections on their own loop, then stop the loop.
     """
-    global persistent_loop, global_engine
+    global persistent_loop
 
     if persistent_loop is not None:
+        logger.info("Disposing DB engines.")
+        try:
+            asyncio.run_coroutine_threadsafe(dispose_engines(), persistent_loop).result(timeout=30)
+        except Exception as e:
+            logger.error(f"Error while disposing DB engines: {e}", exc_info=True)
+
         logger.info("Shutting down persistent loop.")
         persistent_loop.call_soon_threadsafe(persistent_loop.stop)
         persistent_loop = None
 
-    if global_engine is not None:
-        logger.info("Nulling out the global engine reference.")
-        global_engine = None
+    if tracer_provider is not None:
+        tracer_provider.shutdown()
 
 @celery_app.task(name='app.celery_app.tasks.fetch_user_assets_concurrently')
 def fetch_user_assets_concurrently():
@@ -111,3 +101,25 @@ def fetch_user_assets_concurrently():
 
     logger.info("Finished fetch_user_assets_concurrently task...")
     return result
+
+@celery_app.task(name='app.celery_app.tasks.maintain_history_partitions')
+def maintain_history_partitions():
+    """
+    Celery task that keeps the monthly history partitions ahead of time
+    and drops the expired ones, on the persistent loop.
+    """
+    logger.info("Starting maintain_history_partitions task...")
+
+    global persistent_loop
+    if not persistent_loop:
+        logger.error("No persistent event loop is running!")
+        return
+
+    future = asyncio.run_coroutine_threadsafe(_maintain_history_partitions_task(), persistent_loop)
+
+    try:
+        future.result()
+    except Exception as e:
+        logger.error(f"Error while running _maintain_history_partitions_task: {e}", exc_info=True)
+
+    logger.info("Finished maintain_history_partitions task...")
@@ -0,0 +1,109 @@
+from typing import Callable, Optional
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+import gzip
+
+from src.config import COMPRESSION_MIN_SIZE, COMPRESSION_THREAD_SIZE, GZIP_LEVEL, BROTLI_QUALITY
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/x-ndjson", "application/javascript", "application/xml")
+
+ENCODERS: dict[str, Callable[[bytes], bytes]] = {"gzip": lambda body: gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)}
+if brotli is not None:
+    ENCODERS["br"] = lambda body: brotli.compress(body, quality=BROTLI_QUALITY)
+
+# Preferred first when the client accepts several equally
+PREFERENCE = ("br", "gzip")
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """Best encoding of ENCODERS the Accept-Encoding header allows, None for identity"""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    wildcard = accepted.get("*", 0.0)
+    candidates = [(accepted.get(name, wildcard), -PREFERENCE.index(name), name) for name in PREFERENCE if name in ENCODERS]
+    quality, _, name = max(candidates)
+    return name if quality > 0 else None
+
+
+class CompressionMiddleware:
+    """
+    Negotiated br/gzip for complete responses of at least `minimum_size` bytes. Bodies from
+    `thread_size` bytes are compressed in the thread pool so they don't stall the event loop.
+    Streamed responses (SSE, history exports) are passed through as they are.
+    """
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESSION_MIN_SIZE, thread_size: int = COMPRESSION_THREAD_SIZE) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.thread_size = thread_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+        streaming = False
+
+        async def send_compressed(message: Message):
+            nonlocal start, streaming
+            if message["type"] == "http.response.start":
+                start = message  # held back until the body shows whether to compress
+                return
+            if message["type"] != "http.response.body" or streaming:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            if message.get("more_body", False):
+                streaming = True
+                await send(start)
+                await send(message)
+                return
+
+            headers = MutableHeaders(scope=start)
+            if self._should_compress(start["status"], headers, body):
+                encoder = ENCODERS[encoding]
+                body = await run_in_threadpool(encoder, body) if len(body) >= self.thread_size else encoder(body)
+
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+                headers.add_vary_header("Accept-Encoding")
+                # The compressed bytes differ from the identity ones, a strong ETag would claim otherwise
+                etag = headers.get("ETag")
+                if etag and not etag.startswith("W/"):
+                    headers["ETag"] = f"W/{etag}"
+                message = {**message, "body": body}
+
+            await send(start)
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
+
+    def _should_compress(self, status: int, headers: MutableHeaders, body: bytes) -> bool:
+        if status < 200 or status in (204, 304) or len(body) < self.minimum_size:
+            return False
+        if "content-encoding" in headers:
+            return False
+        content_type = headers.get("content-type", "")
+        return any(content_type.startswith(compressible) for compressible in COMPRESSIBLE_TYPES)
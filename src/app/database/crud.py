@@ -1,39 +1,136 @@
 from fastapi import HTTPException
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, NamedTuple, AsyncIterator
 from functools import wraps
+from contextlib import contextmanager
 from uuid import UUID
-import asyncio
+import asyncio, base64, hashlib, inspect, time
 import numpy as np
 
-from sqlalchemy import select, update, insert, delete, join, and_, func, case
+from sqlalchemy import event, select, update, insert, delete, join, and_, func, case, cast, type_coerce, lambda_stmt, BigInteger, Interval
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError, DBAPIError, NoResultFound
 
-from .database import async_engine
+from .database import get_engine, get_read_engine, mark_write
 from .models import *
+from .rollups import ROLLUP_INTERVALS, ROLLUP_POINTS
+from .history_writer import HISTORY_TABLES
+from ..cache import TTLCache
+from ..metrics import DB_QUERY_DURATION, DB_QUERY_ERRORS
+from ..tracing import span
+from ..security import decrypt_credentials_async, decrypt_fields, encrypt_credentials_envelope, run_crypto, invalidate_auth_context, RSA_SCHEME, ENVELOPE_SCHEME
+from src.config import CREDENTIALS_CACHE_SIZE, CREDENTIALS_CACHE_TTL, HISTORY_STREAM_FETCH_SIZE
 
 
 
-def db_connection(func):
+def _routing_keys(signature: inspect.Signature, args: tuple, kwargs: dict) -> tuple:
+    """user_id/account_id arguments of a crud call, they decide the replica routing"""
+    arguments = signature.bind_partial(None, *args, **kwargs).arguments
+    return arguments.get("user_id"), arguments.get("account_id")
+
+
+@contextmanager
+def _timed(function: str, engine: str):
+    """db_query_duration_seconds and a trace span of one crud call, errors counted apart"""
+    start = time.perf_counter()
+    try:
+        with span(f"crud.{function}", **{"db.system": "postgresql", "db.operation.name": function, "db.engine": engine}):
+            yield
+    except Exception:
+        DB_QUERY_ERRORS.labels(function=function, engine=engine).inc()
+        raise
+    finally:
+        DB_QUERY_DURATION.labels(function=function, engine=engine).observe(time.perf_counter() - start)
+
+
+def db_connection(func=None, *, write: bool = True):
+    """
+    Run `func` in a transaction on the primary. After a write its user/account reads from the primary
+    for a while, `@db_connection(write=False)` is for reads that must see the primary without pinning it.
+    """
+    if func is None:
+        return lambda func: db_connection(func, write=write)
+    signature = inspect.signature(func)
+
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        with _timed(func.__name__, "primary"):
+            async with AsyncSession(get_engine()) as session:
+                async with session.begin():
+                    try:
+                        result = await func(session, *args, **kwargs)
+                    except IntegrityError as e:
+                        await session.rollback()
+                        raise HTTPException(status_code=400, detail=str(e))
+                    # except DBAPIError as e:
+                    #     await session.rollback()
+                    #     raise HTTPException(status_code=400, detail="There is probably a wrong data type")
+        if write:
+            mark_write(*_routing_keys(signature, args, kwargs))
+        return result
+    return wrapper
+
+
+def _after_commit(session: AsyncSession, callback, *args):
+    """Run `callback(*args)` once the session's transaction committed, skipped on rollback"""
+    event.listen(session.sync_session, "after_commit", lambda _: callback(*args), once=True)
+
+
+def db_read(func):
+    """Run a read-only `func` on a replica when one is configured, see database.get_read_engine"""
+    signature = inspect.signature(func)
+
     @wraps(func)
     async def wrapper(*args, **kwargs):
-        async with AsyncSession(async_engine) as session:
-            async with session.begin():
-                try:
-                    result = await func(session, *args, **kwargs)
-                    return result
-                except IntegrityError as e:
-                    await session.rollback()
-                    raise HTTPException(status_code=400, detail=str(e))
-                # except DBAPIError as e:
-                #     await session.rollback()
-                #     raise HTTPException(status_code=400, detail="There is probably a wrong data type")
+        engine = get_read_engine(*_routing_keys(signature, args, kwargs))
+        with _timed(func.__name__, "primary" if engine is get_engine() else "replica"):
+            async with AsyncSession(engine) as session:
+                async with session.begin():
+                    return await func(session, *args, **kwargs)
     return wrapper
 
 
+# - - - CREDENTIALS CACHE - - - 
+credentials_cache = TTLCache(maxsize=CREDENTIALS_CACHE_SIZE, ttl=CREDENTIALS_CACHE_TTL)
+
+def _credentials_fingerprint(*encrypted_values: Optional[bytes]) -> bytes:
+    """Digest of the stored ciphertexts, so a rotated credential never matches a cached entry"""
+    digest = hashlib.blake2b(digest_size=16)
+    for value in encrypted_values:
+        digest.update(value or b"")
+        digest.update(b"\x00")
+    return digest.digest()
+
+async def _decrypt_credentials_cached(account_id: str, encryption_scheme: Optional[str], wrapped_data_key: Optional[bytes], encrypted_apikey: Optional[bytes], encrypted_secret_key: Optional[bytes], encrypted_passphrase: Optional[bytes]) -> tuple:
+    """Return (apikey, secret_key, passphrase), decrypting off the event loop only on a cache miss"""
+    fingerprint = _credentials_fingerprint(wrapped_data_key, encrypted_apikey, encrypted_secret_key, encrypted_passphrase)
+
+    # A rotated credential (other fingerprint) counts as a miss
+    cached = credentials_cache.get(account_id, valid=lambda entry: entry[0] == fingerprint)
+    if cached is not None:
+        return cached[1]
+
+    decrypted = await decrypt_credentials_async(
+        account_id, encryption_scheme, wrapped_data_key,
+        encrypted_apikey, encrypted_secret_key, encrypted_passphrase
+    )
+    credentials_cache.set(account_id, (fingerprint, decrypted))
+    return decrypted
+
+def purge_credentials_cache(account_id: Optional[str] = None):
+    """Drop the decrypted credentials of one account, or of every account"""
+    if account_id is None:
+        credentials_cache.clear()
+    else:
+        credentials_cache.pop(account_id)
+
+def credentials_cache_stats() -> dict:
+    """Hit rate and size of the decrypted credentials cache"""
+    return credentials_cache.stats()
+
+
 # - - - PROXY - - - 
-@db_connection
+@db_connection(write=False)
 async def get_used_ips(session: AsyncSession):
     """Select used proxies IPs"""
     result = await session.execute(
@@ -93,7 +190,7 @@ async def register_new_account(session: AsyncSession, user_id: str, account_id:
     await session.refresh(account)  
     return account.account_id
 
-@db_connection
+@db_read
 async def get_main_account(session: AsyncSession, user_id: str) -> str:
     """Get main trading account"""
     result = await session.execute(
@@ -114,6 +211,27 @@ async def get_main_account(session: AsyncSession, user_id: str) -> str:
     return main_account.account_id, main_account.proxy_ip
 
 @db_connection
+async def set_main_account(session: AsyncSession, user_id: str, account_id: str) -> str:
+    """Make `account_id` the user's main account, the previous main account becomes a sub-account"""
+    result = await session.execute(
+        select(Account)
+        .where(Account.user_id == user_id)
+    )
+    accounts = result.scalars().all()
+
+    if account_id not in {account.account_id for account in accounts}:
+        raise HTTPException(status_code=404, detail=f"No account found with ID: {account_id}")
+
+    for account in accounts:
+        if account.account_id == account_id:
+            account.type = 'main-account'
+        elif account.type == 'main-account':
+            account.type = 'sub-account'
+
+    _after_commit(session, invalidate_auth_context, user_id)
+    return account_id
+
+@db_read
 async def get_account_credentials(session: AsyncSession, account_id: str):
     """Get exchange credentials """
     result = await session.execute(
@@ -126,16 +244,25 @@ async def get_account_credentials(session: AsyncSession, account_id: str):
     if not credentials:
         raise HTTPException(status_code=404, detail="Credentials not found")
 
+    apikey, secret_key, passphrase = await _decrypt_credentials_cached(
+        account_id,
+        credentials.encryption_scheme,
+        credentials.wrapped_data_key,
+        credentials.encrypted_apikey,
+        credentials.encrypted_secret_key,
+        credentials.encrypted_passphrase
+    )
+
     return {
-        "apikey": credentials.get_apikey(),
-        "secret_key": credentials.get_secret_key(),
-        "passphrase": credentials.get_passphrase(),
+        "apikey": apikey,
+        "secret_key": secret_key,
+        "passphrase": passphrase,
         "exchange": credentials.exchange_name
     }
 
     
 
-@db_connection
+@db_read
 async def get_accounts(session: AsyncSession, user_id: str):
     """Get user accounts"""
 
@@ -145,9 +272,9 @@ async def get_accounts(session: AsyncSession, user_id: str):
         raise HTTPException(status_code=400, detail="Invalid user ID")
 
 
+    # Hot path: lambda_stmt skips rebuilding the select and its cache key on every call
     result = await session.execute(
-        select(Account)
-        .where(Account.user_id == user_id)
+        lambda_stmt(lambda: select(Account).where(Account.user_id == user_id))
     )
 
     result = result.scalars().all()
@@ -155,26 +282,107 @@ async def get_accounts(session: AsyncSession, user_id: str):
     accounts = [{"id": account.account_id, "proxy_ip": account.proxy_ip, "account_name": account.account_name} for account in result]  
     return accounts
 
-@db_connection
-async def get_accounts_detailed(session: AsyncSession, user_id: str):
-    """Get accounts with credentials embedded as separate fields"""
-    accounts = await get_accounts( user_id)
-
-    credentials = await asyncio.gather(
-        *(get_account_credentials(account["id"]) for account in accounts)
+class AccountCredentialsRow(NamedTuple):
+    """Account joined with its decrypted credentials and risk settings"""
+    account_id: str
+    user_id: UUID
+    account_name: str
+    type: str
+    proxy_ip: Optional[str]
+    exchange: Optional[str]
+    apikey: Optional[str]
+    secret_key: Optional[str]
+    passphrase: Optional[str]
+    max_drawdown: Optional[float]
+    position_size_limit: Optional[float]
+    leverage_limit: Optional[float]
+    stop_loss: Optional[float]
+    take_profit: Optional[float]
+    daily_loss_limit: Optional[float]
+
+
+_accounts_table = Account.__table__
+_credentials_table = UserCredentials.__table__
+_risk_table = RiskManagement.__table__
+
+_accounts_with_credentials_query = (
+    select(
+        _accounts_table.c.account_id,
+        _accounts_table.c.user_id,
+        _accounts_table.c.account_name,
+        _accounts_table.c.type,
+        _accounts_table.c.proxy_ip,
+        _credentials_table.c.exchange_name,
+        _credentials_table.c.encryption_scheme,
+        _credentials_table.c.wrapped_data_key,
+        _credentials_table.c.encrypted_apikey,
+        _credentials_table.c.encrypted_secret_key,
+        _credentials_table.c.encrypted_passphrase,
+        _risk_table.c.max_drawdown,
+        _risk_table.c.position_size_limit,
+        _risk_table.c.leverage_limit,
+        _risk_table.c.stop_loss,
+        _risk_table.c.take_profit,
+        _risk_table.c.daily_loss_limit,
     )
+    .select_from(
+        _accounts_table
+        .outerjoin(_credentials_table, _credentials_table.c.account_id == _accounts_table.c.account_id)
+        .outerjoin(_risk_table, _risk_table.c.account_id == _accounts_table.c.account_id)
+    )
+    .order_by(_accounts_table.c.user_id, _accounts_table.c.account_id)
+)
 
-    for account, credential in zip(accounts, credentials):
-        account.update(credential)
-
-    return accounts
-
+@db_read
+async def get_accounts_with_credentials(session: AsyncSession, user_id: Optional[str] = None) -> list[AccountCredentialsRow]:
+    """Get accounts, decrypted credentials and risk settings in one joined query (all users when user_id is None)"""
+    query = _accounts_with_credentials_query
 
+    if user_id is not None:
+        try:
+            UUID(str(user_id))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid user ID")
 
+        query = query.where(_accounts_table.c.user_id == user_id)
 
+    result = await session.execute(query)
+    rows = result.all()
+
+    # One crypto-pool dispatch per account, all accounts in flight at once
+    decrypted = await asyncio.gather(*(
+        _decrypt_credentials_cached(
+            row.account_id,
+            row.encryption_scheme,
+            row.wrapped_data_key,
+            row.encrypted_apikey,
+            row.encrypted_secret_key,
+            row.encrypted_passphrase
+        )
+        for row in rows
+    ))
+
+    return [
+        AccountCredentialsRow(
+            row.account_id,
+            row.user_id,
+            row.account_name,
+            row.type,
+            row.proxy_ip,
+            row.exchange_name,
+            *credentials,
+            row.max_drawdown,
+            row.position_size_limit,
+            row.leverage_limit,
+            row.stop_loss,
+            row.take_profit,
+            row.daily_loss_limit,
+        )
+        for row, credentials in zip(rows, decrypted)
+    ]
 
 
-@db_connection
+@db_read
 async def get_account(session: AsyncSession, account_id: str):
     """Get account"""
     result = await session.execute(
@@ -190,7 +398,7 @@ async def get_account(session: AsyncSession, account_id: str):
     return {"id": result.account_id, "proxy_ip": result.proxy_ip, "account_name": result.account_name}
 
 # - - - USER - - -
-@db_connection
+@db_read
 async def get_user_data(session: AsyncSession, user_id: str):
     """Get user information (User table)"""
     result = await session.execute(
@@ -205,7 +413,7 @@ async def get_user_data(session: AsyncSession, user_id: str):
     
     return {"username": user.username, "name": user.name, "email": user.email, "role": user.role}
 
-@db_connection
+@db_read
 async def get_all_users(session: AsyncSession):
     """Get all users"""
     result = await session.execute(
@@ -217,7 +425,7 @@ async def get_all_users(session: AsyncSession):
     users = [{"id": user.id, "username": user.username} for user in result]  
     return users
     
-@db_connection
+@db_read
 async def get_user_accounts(session: AsyncSession, user_id: str):
     """Get user accounts"""
     result = await session.execute(
@@ -232,29 +440,88 @@ async def get_user_accounts(session: AsyncSession, user_id: str):
 
 # - - - CREDENTIALS - - - 
 @db_connection
-async def add_user_credentials(session: AsyncSession, account_id: str, exchange: str, encrypted_apikey: str = None, encrypted_secretkey = None, encrypted_passphrase = None, encrypted_oauth2_token = None):
-    """Add user credentials associated with a user account."""
+async def add_user_credentials(session: AsyncSession, account_id: str, exchange: str, encrypted_apikey: str = None, encrypted_secretkey = None, encrypted_passphrase = None, encrypted_oauth2_token = None, wrapped_data_key: str = None):
+    """Add user credentials associated with a user account (envelope encrypted when a wrapped data key is given)."""
     credentials = UserCredentials(
         account_id=account_id,
         exchange_name=exchange
     )
 
+    if wrapped_data_key:
+        credentials.set_wrapped_data_key(wrapped_data_key, ENVELOPE_SCHEME)
+
     if encrypted_apikey:
         credentials.set_encrypted_apikey(encrypted_apikey)
     if encrypted_secretkey:
         credentials.set_encrypted_secret_key(encrypted_secretkey)
     if encrypted_passphrase:
         credentials.set_encrypted_passphrase(encrypted_passphrase)
-    credentials.set_encrypted_passphrase(encrypted_passphrase)
     if encrypted_oauth2_token:
         credentials.set_encrypted_oauth2_token(encrypted_oauth2_token)
     
     session.add(credentials)
     await session.flush()
     await session.refresh(credentials)
+
+    purge_credentials_cache(account_id)
+
+    # The owner's cached auth context may hold the previous credentials
+    user_id = await session.scalar(select(Account.user_id).where(Account.account_id == account_id))
+    if user_id is not None:
+        _after_commit(session, invalidate_auth_context, str(user_id))
     return credentials.id
 
 
+def _reencrypt_credentials_row(account_id: str, encrypted_apikey: Optional[bytes], encrypted_secret_key: Optional[bytes], encrypted_passphrase: Optional[bytes]) -> list:
+    """RSA-decrypt one legacy row and envelope-encrypt it again, returns raw column values"""
+    plain_texts = decrypt_fields(encrypted_apikey, encrypted_secret_key, encrypted_passphrase)
+    encrypted = encrypt_credentials_envelope(account_id, *plain_texts)
+    return [base64.b64decode(value) if value else None for value in encrypted]
+
+@db_connection
+async def reencrypt_credentials_batch(session: AsyncSession, batch_size: int = 100) -> int:
+    """
+    Move up to `batch_size` legacy RSA rows to envelope encryption, returns the number of rows done.
+    Rows are locked with SKIP LOCKED so several runners (and live traffic) never wait on each other,
+    and readers handle both schemes, so the migration needs no downtime.
+    """
+    result = await session.execute(
+        select(
+            UserCredentials.id,
+            UserCredentials.account_id,
+            UserCredentials.encrypted_apikey,
+            UserCredentials.encrypted_secret_key,
+            UserCredentials.encrypted_passphrase,
+        )
+        .where(UserCredentials.encryption_scheme == RSA_SCHEME)
+        .order_by(UserCredentials.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    rows = result.all()
+
+    reencrypted = await asyncio.gather(*(
+        run_crypto(_reencrypt_credentials_row, row.account_id, row.encrypted_apikey, row.encrypted_secret_key, row.encrypted_passphrase)
+        for row in rows
+    ))
+
+    for row, (wrapped_data_key, apikey, secret_key, passphrase) in zip(rows, reencrypted):
+        await session.execute(
+            update(UserCredentials)
+            .where(UserCredentials.id == row.id)
+            .values(
+                encryption_scheme=ENVELOPE_SCHEME,
+                wrapped_data_key=wrapped_data_key,
+                encrypted_apikey=apikey,
+                encrypted_secret_key=secret_key,
+                encrypted_passphrase=passphrase,
+            )
+        )
+        purge_credentials_cache(row.account_id)
+
+    return len(rows)
+
+
 # - - - HISTORICAL METADATA - - - 
 
 @db_connection
@@ -311,79 +578,131 @@ async def add_balance_historical_metadata(session: AsyncSession, account_id: str
     await session.flush()    
     return balance_historical_metadata.id
 
-# - - - USER BALANCE - - - 
-@db_connection
-async def trim_balance_history_per_user(session: AsyncSession, user_id: str, max_records: int = 13140):
-    """
-    Trim the BalanceAccountHistory table for a specific user_id to ensure
-    that only the latest `max_records` are retained across all accounts.
-    """
-    try:
-        # Subquery to select IDs of records to keep (latest `max_records` across all accounts)
-        subquery = (
-            select(BalanceAccountHistory.id)
-            .join(Account, BalanceAccountHistory.account_id == Account.account_id)
-            .where(Account.user_id == user_id)
-            .order_by(BalanceAccountHistory.timestamp.desc())
-            .limit(max_records)
-            .subquery()
-        )
-
-        # Delete records not in the subquery (i.e., older records)
-        delete_stmt = (
-            delete(BalanceAccountHistory)
-            .where(
-                BalanceAccountHistory.account_id.in_(
-                    select(Account.account_id).where(Account.user_id == user_id)
-                ),
-                BalanceAccountHistory.id.notin_(select(subquery.c.id))
-            )
-        )
-
-        await session.execute(delete_stmt)
-        await session.commit()
-    except Exception as e:
-        await session.rollback()
-        raise
-
-
 # - - - BALANCE HISTORY - - -
 
-@db_connection
-async def get_balance_history(session: AsyncSession, account_id: str, limit: int = None, offset: int = None) -> np.ndarray:
-    """Get balance history for an account not older than 1 year as a NumPy array with optional limit and offset."""
+BALANCE_HISTORY_DTYPE = np.dtype([
+    ('timestamp', 'datetime64[us]'),
+    ('balance', 'f8'),
+    ('usd_value', 'f8'),
+])
 
-    one_year_ago = datetime.now() - timedelta(days=365)
-
-    query = (
-        select(BalanceAccountHistory)
+@db_read
+async def get_balance_history(session: AsyncSession, account_id: str, limit: int = None, offset: int = None) -> np.ndarray:
+    """
+    Get balance history for an account not older than 1 year, newest first, with optional limit and offset.
+    Returns a structured array of BALANCE_HISTORY_DTYPE, timestamps are UTC.
+    """
+    # Epoch microseconds straight into datetime64, no datetime objects or ORM rows built per row.
+    # Hot path: lambda_stmt skips rebuilding the select and its cache key on every call
+    one_year = timedelta(days=365)
+    query = lambda_stmt(lambda: (
+        select(
+            cast(func.extract('epoch', BalanceAccountHistory.timestamp) * 1_000_000, BigInteger),
+            BalanceAccountHistory.balance,
+            BalanceAccountHistory.usd_value
+        )
         .where(
             BalanceAccountHistory.account_id == account_id,
-            BalanceAccountHistory.timestamp >= one_year_ago
+            BalanceAccountHistory.timestamp >= func.now() - type_coerce(one_year, Interval)
         )
         .order_by(BalanceAccountHistory.timestamp.desc())
-    )
+    ))
 
     if offset is not None:
-        query = query.offset(offset)
+        query += lambda q: q.offset(offset)
     if limit is not None:
-        query = query.limit(limit)
+        query += lambda q: q.limit(limit)
 
     result = await session.execute(query)
+    rows = result.all()
+
+    return np.fromiter(map(tuple, rows), dtype=BALANCE_HISTORY_DTYPE, count=len(rows))
+
+HISTORY_EXPORT_COLUMNS = (
+    'account_id', 'timestamp', 'asset', 'balance',
+    'usd_value', 'eur_value', 'gbp_value', 'btc_value', 'mxn_value',
+)
+
+async def stream_history(kind: str, account_ids: list[str], since: Optional[datetime] = None, fetch_size: int = HISTORY_STREAM_FETCH_SIZE) -> AsyncIterator[list]:
+    """
+    Yield the history rows of `kind` ('balance', 'spot', 'futures') in chunks of at most `fetch_size`,
+    oldest first per account. Reads through a server-side cursor, so only one chunk is held in memory.
+    """
+    if kind not in HISTORY_TABLES:
+        raise HTTPException(status_code=400, detail=f"Invalid history kind {kind}, use one of {', '.join(HISTORY_TABLES)}")
+
+    table = HISTORY_TABLES[kind]
+    columns = [table.c[name] for name in HISTORY_EXPORT_COLUMNS]
+
+    async with get_read_engine(*account_ids).connect() as conn:
+        # One range scan of (account_id, timestamp) per account instead of a sort over all of them
+        for account_id in account_ids:
+            query = (
+                select(*columns)
+                .where(table.c.account_id == account_id)
+                .order_by(table.c.timestamp)
+                .execution_options(yield_per=fetch_size)
+            )
+            if since is not None:
+                query = query.where(table.c.timestamp >= since)
+
+            result = await conn.stream(query)
+            async for rows in result.partitions():
+                yield rows
+
+# - - - CHART ROLLUPS - - -
+
+# Chart point field -> rollup column
+ROLLUP_FIELDS = {
+    "open": "open_balance",
+    "high": "high_balance",
+    "low": "low_balance",
+    "close": "close_balance",
+    "usd_open": "open_usd_value",
+    "usd_high": "high_usd_value",
+    "usd_low": "low_usd_value",
+    "usd_close": "close_usd_value",
+}
+
+@db_read
+async def get_balance_rollups(session: AsyncSession, account_ids: list[str], interval: str, kind: str = 'balance', layout: str = 'rows') -> dict:
+    """
+    Get the latest OHLC buckets of `interval` for each account, oldest first, bounded by ROLLUP_POINTS.
+    layout 'rows' gives a list of points, 'columns' one array per field (timestamp, open, high...)
+    """
+    if interval not in ROLLUP_INTERVALS:
+        raise HTTPException(status_code=400, detail=f"Invalid interval {interval}, use one of {', '.join(ROLLUP_INTERVALS)}")
 
-    balance_history = result.scalars().all()
+    points = {account_id: [] for account_id in account_ids}
 
-    # Convert to a NumPy array with timestamps in ISO format
-    balance_array = np.array([
-        (
-            balance.timestamp.isoformat(),  
-            balance.balance,
-            balance.usd_value
+    for account_id in account_ids:
+        result = await session.execute(
+            select(
+                BalanceRollup.bucket_start,
+                *(getattr(BalanceRollup, column) for column in ROLLUP_FIELDS.values())
+            )
+            .where(
+                BalanceRollup.account_id == account_id,
+                BalanceRollup.kind == kind,
+                BalanceRollup.interval == interval
+            )
+            .order_by(BalanceRollup.bucket_start.desc())
+            .limit(ROLLUP_POINTS[interval])
         )
-        for balance in balance_history
-    ], dtype=object)
+        rows = result.all()[::-1]
+
+        if layout == 'columns':
+            points[account_id] = {
+                "timestamp": [row.bucket_start.isoformat() for row in rows],
+                **{field: [getattr(row, column) for row in rows] for field, column in ROLLUP_FIELDS.items()}
+            }
+        else:
+            points[account_id] = [
+                {"timestamp": row.bucket_start.isoformat(), **{field: getattr(row, column) for field, column in ROLLUP_FIELDS.items()}}
+                for row in rows
+            ]
 
-    return balance_array
+    return points
 
 # - - - USER CONFIGURATION - - - 
 @db_connection
@@ -411,12 +730,20 @@ async def update_register_status(session: AsyncSession, user_id: str, register_s
         await session.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
+@db_read
+async def get_user_currency(session: AsyncSession, user_id: str) -> str:
+    """Display currency of a user (UserConfiguration.currency), 'usd' when not configured"""
+    result = await session.execute(
+        select(UserConfiguration.currency).where(UserConfiguration.user_id == user_id)
+    )
+    return (result.scalars().first() or 'usd').lower()
+
 
 async def database_crud_testing():
     user_id = "2141ec7d-8156-4462-9a8e-0cf37b11997d"
     account_id = "1530240371"
 
-    result = await get_accounts_detailed("94615a24-5243-41a3-8f27-5dae288d2c7e")
+    result = await get_accounts_with_credentials("94615a24-5243-41a3-8f27-5dae288d2c7e")
     print(result)
 
 if __name__ == "__main__":
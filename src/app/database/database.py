@@ -1,33 +1,316 @@
-from sqlalchemy.ext.asyncio import create_async_engine
-from sqlalchemy import inspect
-import asyncio, sys, os
-
-if len(sys.argv) > 1 and sys.argv[1] == "test":
-    from src.config import DB_HOST, DB_NAME, DB_PASS, DB_USER, BASE_DIR
-    # from .models import Base
-else:
-    from config import DB_HOST, DB_NAME, DB_PASS, DB_USER, BASE_DIR
-
-# Database engine 
-if BASE_DIR.startswith('/home/mrpau'):
-    async_engine = create_async_engine(f'postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:5432/{DB_NAME}')
-else:
-    async_engine = create_async_engine(
-        f'postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:5432/{DB_NAME}',
-        echo=False,
-        future=True,
-        pool_size=10,        
-        max_overflow=20,
-        pool_timeout=30
-        )
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy import inspect, event
+from typing import Optional
+import asyncio, itertools, logging, threading, time, uuid, os
+
+from ..cache import TTLCache
+
+from src.config import (
+    DB_HOST, DB_NAME, DB_PASS, DB_USER, DB_REPLICA_HOSTS, REPLICA_READ_AFTER_WRITE_SECONDS,
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+    DB_CONNECTION_MODE, DB_STATEMENT_CACHE_SIZE, DB_COMPILED_CACHE_SIZE
+)
+# from .models import Base
+
+logger = logging.getLogger(__name__)
+
+
+# - - - POOL INSTRUMENTATION - - -
+
+class PoolStats:
+    """Checkout wait, saturation and connection age of one engine's pool"""
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._connected_at: dict[int, float] = {}
+        self._records: dict[int, object] = {}
+
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.checkout_errors = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.checked_out_peak = 0
+
+    def observe_wait(self, seconds: float, timed_out: bool = False, failed: bool = False):
+        with self._lock:
+            if timed_out:
+                self.checkout_timeouts += 1
+                return
+            if failed:  # the connect itself failed: refused, auth, DNS...
+                self.checkout_errors += 1
+                return
+            self.checkouts += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+    def observe_checked_out(self, checked_out: int):
+        with self._lock:
+            self.checked_out_peak = max(self.checked_out_peak, checked_out)
+
+    def connected(self, record):
+        with self._lock:
+            self._connected_at[id(record)] = time.monotonic()
+            self._records[id(record)] = record
+
+    def closed(self, record):
+        with self._lock:
+            self._connected_at.pop(id(record), None)
+            self._records.pop(id(record), None)
+
+    def records(self) -> list:
+        with self._lock:
+            return list(self._records.values())
+
+    def connection_ages(self) -> list[float]:
+        now = time.monotonic()
+        with self._lock:
+            return [now - connected_at for connected_at in self._connected_at.values()]
+
+
+class _TimedCheckout:
+    """Times every checkout, including the wait for a free slot or a new connection"""
+    stats: PoolStats
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except PoolTimeoutError:
+            self.stats.observe_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        except Exception:
+            self.stats.observe_wait(time.perf_counter() - start, failed=True)
+            raise
+        self.stats.observe_wait(time.perf_counter() - start)
+        if hasattr(self, "checkedout"):
+            self.stats.observe_checked_out(self.checkedout())
+        return record
+
+class InstrumentedQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+class InstrumentedNullPool(_TimedCheckout, NullPool):
+    pass
+
+
+def _pgbouncer_statement_name() -> str:
+    # Unique per statement, a server connection may have served another client's prepare
+    return f"__asyncpg_{uuid.uuid4()}__"
+
+def create_engine(host: str, mode: str = DB_CONNECTION_MODE, pool_size: int = DB_POOL_SIZE, max_overflow: int = DB_MAX_OVERFLOW, pool_timeout: float = DB_POOL_TIMEOUT, pool_recycle: int = DB_POOL_RECYCLE) -> AsyncEngine:
+    """
+    The one place engines get built, API and Celery workers alike.
+
+    mode 'direct': asyncpg keeps up to DB_STATEMENT_CACHE_SIZE prepared statements per connection.
+    mode 'pgbouncer': no prepared statement cache, unique statement names and no client side pool,
+    PgBouncer (transaction mode, server_reset_query DISCARD ALL) does the pooling.
+    """
+    url = f'postgresql+asyncpg://{DB_USER}:{DB_PASS}@{host}:5432/{DB_NAME}'
+
+    if mode == 'pgbouncer':
+        engine = create_async_engine(
+            url,
+            echo=False,
+            poolclass=InstrumentedNullPool,
+            query_cache_size=DB_COMPILED_CACHE_SIZE,
+            connect_args={
+                "statement_cache_size": 0,
+                "prepared_statement_cache_size": 0,
+                "prepared_statement_name_func": _pgbouncer_statement_name,
+            },
+            )
+    elif mode == 'direct':
+        engine = create_async_engine(
+            url,
+            echo=False,
+            poolclass=InstrumentedQueuePool,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=pool_timeout,
+            pool_recycle=pool_recycle,
+            query_cache_size=DB_COMPILED_CACHE_SIZE,
+            connect_args={"prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE},
+            )
+    else:
+        raise ValueError(f"Unknown DB_CONNECTION_MODE: {mode}")
+
+    stats = PoolStats()
+    engine.pool.stats = stats
+    event.listen(engine.sync_engine.pool, "connect", lambda dbapi_connection, record: stats.connected(record))
+    event.listen(engine.sync_engine.pool, "close", lambda dbapi_connection, record: stats.closed(record))
+    event.listen(engine.sync_engine.pool, "invalidate", lambda dbapi_connection, record, exception: stats.closed(record))
+    return engine
+
+
+# - - - ENGINES - - -
+
+class EngineSet:
+    """
+    Primary and replica engines of one event loop. asyncpg connections can't move
+    between loops, so each loop that touches the database gets its own set.
+    """
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop]) -> None:
+        self.loop = loop
+        self.primary = create_engine(DB_HOST)
+        # Read replicas, dashboard reads go here when configured
+        self.replicas = [create_engine(host) for host in DB_REPLICA_HOSTS]
+        self._replica_cycle = itertools.cycle(self.replicas) if self.replicas else None
+
+    def next_replica(self) -> Optional[AsyncEngine]:
+        return next(self._replica_cycle) if self._replica_cycle is not None else None
+
+    def named(self) -> dict[str, AsyncEngine]:
+        engines = {"primary": self.primary}
+        engines.update({f"replica-{i}": engine for i, engine in enumerate(self.replicas)})
+        return engines
+
+    async def dispose(self):
+        for engine in self.named().values():
+            await engine.dispose()
+
+    def retire(self):
+        """
+        Release the connections of a set another loop replaced. asyncpg closes them on the loop that
+        opened them; once that loop is closed (asyncio.run returned) only their sockets can be closed.
+        """
+        loop = self.loop
+        if loop is not None and not loop.is_closed():
+            if loop.is_running():  # in another thread
+                asyncio.run_coroutine_threadsafe(self.dispose(), loop)
+            else:
+                threading.Thread(target=loop.run_until_complete, args=(self.dispose(),), daemon=True).start()
+            return
+
+        closed = 0
+        for engine in self.named().values():
+            for record in engine.pool.stats.records():
+                transport = getattr(record.driver_connection, "_transport", None)
+                sock = getattr(transport, "_sock", None)
+                if sock is not None:
+                    sock.close()
+                    closed += 1
+            engine.sync_engine.dispose(close=False)
+        if closed:
+            logger.warning(f"Closed {closed} database connections left open by a closed event loop")
+
+
+_engines: Optional[EngineSet] = None
+_engines_lock = threading.Lock()
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+def get_engines() -> EngineSet:
+    """Engines of the running loop, built on first use and rebuilt if a different loop shows up"""
+    global _engines
+    loop = _running_loop()
+
+    retired = None
+    with _engines_lock:
+        if _engines is None or (loop is not None and _engines.loop is not None and _engines.loop is not loop):
+            retired, _engines = _engines, EngineSet(loop)
+        elif _engines.loop is None:
+            _engines.loop = loop
+        engines = _engines
+
+    if retired is not None:
+        retired.retire()
+    return engines
+
+def get_engine() -> AsyncEngine:
+    """Primary engine, every write goes here"""
+    return get_engines().primary
+
+def init_engines() -> EngineSet:
+    """Bind a fresh set of engines to the running loop, call it from the loop that will use them"""
+    global _engines
+    with _engines_lock:
+        retired, _engines = _engines, EngineSet(_running_loop())
+        engines = _engines
+
+    if retired is not None:
+        retired.retire()
+    return engines
+
+async def dispose_engines():
+    """Close every pooled connection, on the loop that opened them"""
+    global _engines
+    with _engines_lock:
+        engines, _engines = _engines, None
+    if engines is not None:
+        await engines.dispose()
+
+
+# Users/accounts that wrote recently read from the primary until the replicas caught up.
+# Tracked per process: a write handled by another worker isn't seen here.
+recent_writes = TTLCache(maxsize=100_000, ttl=REPLICA_READ_AFTER_WRITE_SECONDS)
+
+
+def mark_write(*keys: Optional[str]):
+    """Pin the reads of these user/account IDs to the primary for the read-after-write window"""
+    for key in keys:
+        if key is not None:
+            recent_writes.set(str(key), True)
+
+def get_read_engine(*keys: Optional[str]) -> AsyncEngine:
+    """Engine for a read: a replica, unless there is none or one of `keys` wrote recently"""
+    engines = get_engines()
+    if not engines.replicas:
+        return engines.primary
+
+    if any(key is not None and recent_writes.get(str(key)) for key in keys):
+        return engines.primary
+
+    return engines.next_replica()
+
+def pool_status() -> dict:
+    """Pool usage of every engine: occupancy, saturation, checkout wait and connection age"""
+    status = {}
+    for name, engine in get_engines().named().items():
+        pool = engine.pool
+        stats: PoolStats = pool.stats
+        ages = stats.connection_ages()
+
+        if isinstance(pool, AsyncAdaptedQueuePool):
+            capacity = pool.size() + max(pool._max_overflow, 0)
+            status[name] = {
+                "size": pool.size(),
+                "max_overflow": pool._max_overflow,
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": pool.overflow(),
+                "saturation": pool.checkedout() / capacity if capacity else None,
+            }
+        else:
+            status[name] = {"size": None, "saturation": None} # no client side pool, see DB_CONNECTION_MODE
+
+        status[name].update({
+            "mode": DB_CONNECTION_MODE,
+            "checked_out_peak": stats.checked_out_peak,
+            "checkouts": stats.checkouts,
+            "checkout_timeouts": stats.checkout_timeouts,
+            "checkout_errors": stats.checkout_errors,
+            "checkout_wait_avg_ms": stats.wait_seconds_total / stats.checkouts * 1000 if stats.checkouts else 0.0,
+            "checkout_wait_max_ms": stats.wait_seconds_max * 1000,
+            "connections": len(ages),
+            "connection_age_max_s": max(ages, default=0.0),
+            "connection_age_avg_s": sum(ages) / len(ages) if ages else 0.0,
+        })
+    return status
 
 
 async def get_all_tables():
-    async with async_engine.begin() as conn:
+    async with get_engine().begin() as conn:
         def sync_get_table_names(connection):
             inspector = inspect(connection)
             return inspector.get_table_names()
-        
+
         table_names = await conn.run_sync(sync_get_table_names)
         print("table names -> ",table_names)
     return table_names
@@ -0,0 +1,170 @@
+# src/app/database/history_writer.py
+
+import asyncio, logging, uuid
+from datetime import datetime, timezone
+from typing import Literal, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+
+from .database import get_engine
+from .models import SpotHistory, FuturesHistory, BalanceAccountHistory
+from .rollups import upsert_rollups
+from src.config import HISTORY_FLUSH_ROWS, HISTORY_FLUSH_INTERVAL, HISTORY_USE_COPY, HISTORY_FLUSH_RETRIES, HISTORY_FLUSH_BACKOFF
+
+logger = logging.getLogger(__name__)
+
+HistoryKind = Literal['spot', 'futures', 'balance']
+
+HISTORY_TABLES = {
+    'spot': SpotHistory.__table__,
+    'futures': FuturesHistory.__table__,
+    'balance': BalanceAccountHistory.__table__,
+}
+
+HISTORY_COLUMNS = (
+    'id', 'account_id', 'timestamp', 'asset', 'balance',
+    'usd_value', 'eur_value', 'gbp_value', 'btc_value', 'mxn_value',
+)
+
+# SQLSTATE classes worth a retry: connection exception, insufficient resources, operator
+# intervention (server shutting down), transaction rollback (serialization failure, deadlock)
+TRANSIENT_SQLSTATE_CLASSES = ('08', '53', '57', '40')
+
+
+def is_transient(error: BaseException) -> bool:
+    """Whether a failed write may succeed as is on a retry"""
+    if isinstance(error, (PoolTimeoutError, OSError, asyncio.TimeoutError)):
+        return True
+    if isinstance(error, DBAPIError) and error.connection_invalidated:
+        return True
+    # SQLAlchemy wraps the driver error in .orig, the raw asyncpg COPY raises it directly
+    sqlstate = getattr(getattr(error, "orig", None), "sqlstate", None) or getattr(error, "sqlstate", None)
+    return sqlstate is not None and sqlstate[:2] in TRANSIENT_SQLSTATE_CLASSES
+
+
+class HistoryWriter:
+    """
+    Buffers hourly snapshot rows and writes each history table in one statement per flush:
+    asyncpg COPY by default, a multi-row INSERT otherwise. The chart rollups are updated
+    in the same transaction.
+
+    A flush happens when `max_rows` rows are buffered or every `flush_interval` seconds.
+    The producer that fills the buffer awaits the flush, so writers can't run ahead of the database.
+    """
+    def __init__(self, max_rows: int = HISTORY_FLUSH_ROWS, flush_interval: float = HISTORY_FLUSH_INTERVAL, use_copy: bool = HISTORY_USE_COPY, retries: int = HISTORY_FLUSH_RETRIES, backoff: float = HISTORY_FLUSH_BACKOFF) -> None:
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval
+        self.use_copy = use_copy
+        self.retries = retries
+        self.backoff = backoff
+
+        self._buffers: dict[str, list[tuple]] = {kind: [] for kind in HISTORY_TABLES}
+        self._buffered = 0
+        self._flush_lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+
+        self.rows_written = 0
+        self.rows_dropped = 0
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def start(self):
+        if self._timer is None:
+            self._timer = asyncio.create_task(self._flush_periodically())
+
+    async def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            try:
+                await self._timer
+            except asyncio.CancelledError:
+                pass
+            self._timer = None
+        await self.flush()
+
+    async def add(self, kind: HistoryKind, account_id: str, asset: str, balance: float, usd_value: float, eur_value: Optional[float], gbp_value: Optional[float], btc_value: Optional[float], mxn_value: Optional[float], timestamp: Optional[datetime] = None):
+        """Buffer one history row, waits for a flush when the buffer is full. Non-USD values are None when unpriced"""
+        self._buffers[kind].append((
+            uuid.uuid4(),
+            account_id,
+            timestamp or datetime.now(timezone.utc),
+            asset,
+            balance,
+            usd_value,
+            eur_value,
+            gbp_value,
+            btc_value,
+            mxn_value,
+        ))
+        self._buffered += 1
+
+        if self._buffered >= self.max_rows:
+            await self.flush(only_if_full=True)
+
+    async def flush(self, only_if_full: bool = False):
+        """Write everything buffered so far, one transaction per table"""
+        async with self._flush_lock:
+            if only_if_full and self._buffered < self.max_rows:
+                return  # another producer flushed while we were waiting
+
+            buffers = self._buffers
+            self._buffers = {kind: [] for kind in HISTORY_TABLES}
+            self._buffered = 0
+
+            for kind, records in buffers.items():
+                if records:
+                    await self._write_with_retries(kind, records)
+
+    async def _write_with_retries(self, kind: str, records: list[tuple]):
+        """
+        Write one table's batch, retrying transient errors with a doubling backoff. Each attempt is
+        its own transaction, a failed one leaves nothing behind.
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                await self._write(kind, records)
+                self.rows_written += len(records)
+                return
+            except Exception as e:
+                if attempt < self.retries and is_transient(e):
+                    delay = self.backoff * 2 ** attempt
+                    logger.warning(f"Writing {len(records)} {kind} history rows failed, retrying in {delay}s: {e!r}")
+                    await asyncio.sleep(delay)
+                    continue
+                self.rows_dropped += len(records)
+                logger.error(f"Failed to write {len(records)} {kind} history rows: {e}", exc_info=True)
+                return
+
+    async def _write(self, kind: str, records: list[tuple]):
+        table = HISTORY_TABLES[kind]
+
+        engine = get_engine()
+        async with engine.begin() as conn:
+            # Rollups first: it opens the transaction the COPY below then joins
+            await upsert_rollups(conn, kind, records)
+
+            if self.use_copy and engine.dialect.driver == 'asyncpg':
+                raw_connection = await conn.get_raw_connection()
+                await raw_connection.driver_connection.copy_records_to_table(
+                    table.name,
+                    records=records,
+                    columns=HISTORY_COLUMNS,
+                )
+            else:
+                await conn.execute(
+                    insert(table),
+                    [dict(zip(HISTORY_COLUMNS, record)) for record in records]
+                )
+
+        logger.debug(f"Wrote {len(records)} rows to {table.name}.")
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
@@ -0,0 +1,36 @@
+# src/app/database/migrate_credentials.py
+"""
+Re-encrypt legacy RSA-OAEP credential rows with the envelope (AES-GCM) scheme.
+
+Runs in small transactions while the API keeps serving, readers understand both schemes:
+
+    python -m src.app.database.migrate_credentials test [batch_size] [pause_seconds]
+"""
+import asyncio, logging, sys
+
+from .crud import reencrypt_credentials_batch
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def migrate_credentials(batch_size: int = 100, pause: float = 0.5) -> int:
+    """Re-encrypt batches until no unlocked legacy row is left, returns the number of rows migrated"""
+    total = 0
+    while True:
+        migrated = await reencrypt_credentials_batch(batch_size=batch_size)
+        if migrated == 0:
+            break
+
+        total += migrated
+        logger.info(f"Re-encrypted {migrated} credential rows ({total} so far).")
+        await asyncio.sleep(pause)  # leave room for live traffic between batches
+
+    logger.info(f"Credential migration finished, {total} rows re-encrypted.")
+    return total
+
+
+if __name__ == "__main__":
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    pause = float(sys.argv[3]) if len(sys.argv) > 3 else 0.5
+    asyncio.run(migrate_credentials(batch_size=batch_size, pause=pause))
@@ -1,14 +1,13 @@
-from sqlalchemy import String, Float, DateTime, Text, ForeignKey, Column, func, Integer, Numeric, LargeBinary, Boolean
+from sqlalchemy import String, Float, DateTime, Text, ForeignKey, Column, func, Integer, Numeric, LargeBinary, Boolean, Index
 from sqlalchemy.dialects.postgresql import UUID as pgUUID, JSON
 from sqlalchemy.orm import relationship, declarative_base
-from cryptography.hazmat.primitives.asymmetric import padding
-from cryptography.hazmat.primitives import hashes
-from src.config import PRIVATE_KEY
+from src.app.security import decrypt_bytes, decrypt_credentials, RSA_SCHEME, CREDENTIAL_FIELDS
 import uuid
 import base64
 
 Base = declarative_base()
 
+
 class Users(Base):
     __tablename__ = "users"
 
@@ -77,7 +76,7 @@ class Account(Base):
     __tablename__ = "accounts"
 
     account_id = Column(String(255), primary_key=True)
-    user_id = Column(pgUUID(as_uuid=True), ForeignKey('users.id'), nullable=False)
+    user_id = Column(pgUUID(as_uuid=True), ForeignKey('users.id'), nullable=False, index=True)
     account_name = Column(String(255), nullable=False)
     type = Column(String(255), nullable=False)
     email = Column(String(255), nullable=True)
@@ -90,6 +89,7 @@ class Account(Base):
     spot_history = relationship("SpotHistory", back_populates="account", cascade="all, delete-orphan")
     futures_history = relationship("FuturesHistory", back_populates="account", cascade="all, delete-orphan")
     balance_history = relationship("BalanceAccountHistory", back_populates="account", cascade="all, delete-orphan")
+    balance_rollups = relationship("BalanceRollup", back_populates="account", cascade="all, delete-orphan")
 
     risk_management = relationship(
         "RiskManagement",
@@ -151,12 +151,14 @@ class UserCredentials(Base):
     __tablename__ = "user_credentials"
 
     id = Column(pgUUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    account_id = Column(String(255), ForeignKey('accounts.account_id'), nullable=False)
+    account_id = Column(String(255), ForeignKey('accounts.account_id'), nullable=False, index=True)
     exchange_name = Column(String(255), nullable=False)
     encrypted_apikey = Column(LargeBinary, nullable=True)
     encrypted_secret_key = Column(LargeBinary, nullable=True)
     encrypted_passphrase = Column(LargeBinary, nullable=True)
     oauth2_token = Column(LargeBinary, nullable=True)
+    encryption_scheme = Column(String(20), nullable=False, default=RSA_SCHEME, server_default=RSA_SCHEME) # 'rsa-oaep', 'aes-gcm'
+    wrapped_data_key = Column(LargeBinary, nullable=True) # RSA-wrapped AES key, only for 'aes-gcm' rows
 
     account = relationship("Account", back_populates="user_credentials")
 
@@ -172,49 +174,26 @@ class UserCredentials(Base):
     def set_encrypted_oauth2_token(self, encrypted_oauth2_token: str):
         self.oauth2_token = base64.b64decode(encrypted_oauth2_token.encode('utf-8'))
 
+    def set_wrapped_data_key(self, wrapped_data_key: str, encryption_scheme: str):
+        self.wrapped_data_key = base64.b64decode(wrapped_data_key.encode('utf-8'))
+        self.encryption_scheme = encryption_scheme
+
+    def _decrypt_field(self, field: str):
+        values = [getattr(self, f"encrypted_{name}") if name == field else None for name in CREDENTIAL_FIELDS]
+        decrypted = decrypt_credentials(self.account_id, self.encryption_scheme, self.wrapped_data_key, *values)
+        return decrypted[CREDENTIAL_FIELDS.index(field)]
+
     def get_apikey(self):
-        decrypted_apikey = PRIVATE_KEY.decrypt(
-            self.encrypted_apikey,
-            padding.OAEP(
-                mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                algorithm=hashes.SHA256(),
-                label=None
-            )
-        )
-        return decrypted_apikey.decode('utf-8')
+        return self._decrypt_field('apikey')
 
     def get_secret_key(self):
-        decrypted_secret_key = PRIVATE_KEY.decrypt(
-            self.encrypted_secret_key,
-            padding.OAEP(
-                mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                algorithm=hashes.SHA256(),
-                label=None
-            )
-        )
-        return decrypted_secret_key.decode('utf-8')
+        return self._decrypt_field('secret_key')
 
     def get_passphrase(self):
-        decrypted_passphrase = PRIVATE_KEY.decrypt(
-            self.encrypted_passphrase,
-            padding.OAEP(
-                mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                algorithm=hashes.SHA256(),
-                label=None
-            )
-        )
-        return decrypted_passphrase.decode('utf-8')
+        return self._decrypt_field('passphrase')
 
     def get_oauth2_token(self):
-        decrypted_oauth2_token = PRIVATE_KEY.decrypt(
-            self.oauth2_token,
-            padding.OAEP(
-                mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                algorithm=hashes.SHA256(),
-                label=None
-            )
-        )
-        return decrypted_oauth2_token.decode('utf-8')
+        return decrypt_bytes(self.oauth2_token)
 
 
 class SpotHistory(Base):
@@ -222,57 +201,99 @@ class SpotHistory(Base):
 
     id = Column(pgUUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     account_id = Column(String(255), ForeignKey('accounts.account_id'), nullable=False)
-    timestamp = Column(DateTime(timezone=True), default=func.now(), nullable=False)
+    timestamp = Column(DateTime(timezone=True), primary_key=True, default=func.now(), nullable=False)
     asset = Column(String(255), nullable=False)
     balance = Column(Float, nullable=False)
     usd_value = Column(Float, nullable=False)
-    eur_value = Column(Float, nullable=False)
-    gbp_value = Column(Float, nullable=False)
-    btc_value = Column(Float, nullable=False)
-    mxn_value = Column(Float, nullable=False)
+    eur_value = Column(Float, nullable=True)
+    gbp_value = Column(Float, nullable=True)
+    btc_value = Column(Float, nullable=True)
+    mxn_value = Column(Float, nullable=True)
 
     account = relationship("Account", back_populates="spot_history")
 
+    __table_args__ = (
+        # Charts read the latest rows of one account, served from the index alone
+        Index("ix_spot_history_account_id_timestamp", account_id, timestamp.desc(), postgresql_include=["balance", "usd_value"]),
+        {"postgresql_partition_by": "RANGE (timestamp)"}, # monthly partitions, see partitions.py
+    )
+
 
 class FuturesHistory(Base):
     __tablename__ = "futures_history"
 
     id = Column(pgUUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     account_id = Column(String(255), ForeignKey('accounts.account_id'), nullable=False)
-    timestamp = Column(DateTime(timezone=True), default=func.now(), nullable=False)
+    timestamp = Column(DateTime(timezone=True), primary_key=True, default=func.now(), nullable=False)
     asset = Column(String(255), nullable=False)
     balance = Column(Float, nullable=False)
     usd_value = Column(Float, nullable=False)
-    eur_value = Column(Float, nullable=False)
-    gbp_value = Column(Float, nullable=False)
-    btc_value = Column(Float, nullable=False)
-    mxn_value = Column(Float, nullable=False)
+    eur_value = Column(Float, nullable=True)
+    gbp_value = Column(Float, nullable=True)
+    btc_value = Column(Float, nullable=True)
+    mxn_value = Column(Float, nullable=True)
 
     account = relationship("Account", back_populates="futures_history")
 
+    __table_args__ = (
+        # Charts read the latest rows of one account, served from the index alone
+        Index("ix_futures_history_account_id_timestamp", account_id, timestamp.desc(), postgresql_include=["balance", "usd_value"]),
+        {"postgresql_partition_by": "RANGE (timestamp)"}, # monthly partitions, see partitions.py
+    )
+
 
 class BalanceAccountHistory(Base):
     __tablename__ = "balance_account_history"
 
     id = Column(pgUUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     account_id = Column(String(255), ForeignKey('accounts.account_id'), nullable=False)
-    timestamp = Column(DateTime(timezone=True), default=func.now(), nullable=False)
+    timestamp = Column(DateTime(timezone=True), primary_key=True, default=func.now(), nullable=False)
     asset = Column(String(255), nullable=False)
     balance = Column(Float, nullable=False)
     usd_value = Column(Float, nullable=False)
-    eur_value = Column(Float, nullable=False)
-    gbp_value = Column(Float, nullable=False)
-    btc_value = Column(Float, nullable=False)
-    mxn_value = Column(Float, nullable=False)
+    eur_value = Column(Float, nullable=True)
+    gbp_value = Column(Float, nullable=True)
+    btc_value = Column(Float, nullable=True)
+    mxn_value = Column(Float, nullable=True)
 
     account = relationship("Account", back_populates="balance_history")
 
+    __table_args__ = (
+        # Charts read the latest rows of one account, served from the index alone
+        Index("ix_balance_account_history_account_id_timestamp", account_id, timestamp.desc(), postgresql_include=["balance", "usd_value"]),
+        {"postgresql_partition_by": "RANGE (timestamp)"}, # monthly partitions, see partitions.py
+    )
+
+
+class BalanceRollup(Base):
+    __tablename__ = "balance_rollups"
+
+    account_id = Column(String(255), ForeignKey('accounts.account_id'), primary_key=True)
+    kind = Column(String(10), primary_key=True) # 'balance', 'spot', 'futures'
+    interval = Column(String(3), primary_key=True) # '1h', '4h', '1d', '1w'
+    bucket_start = Column(DateTime(timezone=True), primary_key=True)
+
+    open_balance = Column(Float, nullable=False)
+    high_balance = Column(Float, nullable=False)
+    low_balance = Column(Float, nullable=False)
+    close_balance = Column(Float, nullable=False)
+    open_usd_value = Column(Float, nullable=False)
+    high_usd_value = Column(Float, nullable=False)
+    low_usd_value = Column(Float, nullable=False)
+    close_usd_value = Column(Float, nullable=False)
+
+    first_timestamp = Column(DateTime(timezone=True), nullable=False)
+    last_timestamp = Column(DateTime(timezone=True), nullable=False)
+    samples = Column(Integer, nullable=False, default=0)
+
+    account = relationship("Account", back_populates="balance_rollups")
+
 
 class RiskManagement(Base):
     __tablename__ = "risk_management"
 
     id = Column(pgUUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    account_id = Column(String(255), ForeignKey('accounts.account_id'), nullable=False)
+    account_id = Column(String(255), ForeignKey('accounts.account_id'), nullable=False, index=True)
 
     max_drawdown = Column(Float, nullable=True)
     position_size_limit = Column(Float, nullable=True)
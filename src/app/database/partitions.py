@@ -0,0 +1,128 @@
+# src/app/database/partitions.py
+"""
+Monthly partitions of the history tables.
+
+Each table has one partition per month, named <table>_pYYYYMM, bounded at
+midnight UTC like the rollup buckets. Retention detaches and drops whole
+partitions instead of deleting rows.
+"""
+import logging
+from datetime import date, datetime, timezone
+
+from sqlalchemy import text
+
+from .database import get_engine
+from src.config import HISTORY_RETENTION_MONTHS, HISTORY_PARTITIONS_AHEAD
+
+logger = logging.getLogger(__name__)
+
+HISTORY_PARTITIONED_TABLES = ('balance_account_history', 'spot_history', 'futures_history')
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+def partition_month(table: str, name: str):
+    """Month a partition covers, None for anything not created by us"""
+    suffix = name[len(table) + 2:]
+    if not name.startswith(f"{table}_p") or len(suffix) != 6 or not suffix.isdigit():
+        return None
+    return date(int(suffix[:4]), int(suffix[4:]), 1)
+
+
+def month_bound(month: date) -> str:
+    """Partition bound literal, explicit UTC so it doesn't depend on the session TimeZone"""
+    return f"{month.isoformat()}T00:00:00+00"
+
+
+async def list_history_partitions(table: str) -> list[tuple[str, bool]]:
+    """(name, detach pending) of every partition of `table`, pending when a DETACH CONCURRENTLY was interrupted"""
+    async with get_engine().connect() as conn:
+        result = await conn.execute(
+            text("""
+                SELECT child.relname, pg_inherits.inhdetachpending
+                FROM pg_inherits
+                JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+                JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                WHERE parent.relname = :table
+                ORDER BY child.relname
+            """),
+            {"table": table}
+        )
+        return [(row.relname, row.inhdetachpending) for row in result]
+
+
+async def list_detached_history_partitions(table: str) -> list[str]:
+    """Former partitions of `table` already detached but never dropped (a failed DROP, a worker that died)"""
+    async with get_engine().connect() as conn:
+        result = await conn.execute(
+            text("""
+                SELECT relname
+                FROM pg_class
+                WHERE relkind = 'r' AND NOT relispartition AND relname LIKE :pattern
+                ORDER BY relname
+            """),
+            {"pattern": f"{table}_p%"}
+        )
+        return [row.relname for row in result]
+
+
+async def ensure_history_partitions(months_ahead: int = HISTORY_PARTITIONS_AHEAD):
+    """Create the partitions for the current month and the next `months_ahead` months"""
+    current_month = datetime.now(timezone.utc).date().replace(day=1)
+
+    async with get_engine().begin() as conn:
+        for table in HISTORY_PARTITIONED_TABLES:
+            for offset in range(months_ahead + 1):
+                month = add_months(current_month, offset)
+                await conn.execute(text(
+                    f'CREATE TABLE IF NOT EXISTS "{partition_name(table, month)}" PARTITION OF "{table}" '
+                    f"FOR VALUES FROM ('{month_bound(month)}') TO ('{month_bound(add_months(month, 1))}')"
+                ))
+
+
+async def drop_expired_history_partitions(retention_months: int = HISTORY_RETENTION_MONTHS) -> list[str]:
+    """
+    Detach and drop the partitions that only hold rows older than `retention_months`.
+    DETACH ... CONCURRENTLY doesn't block the snapshot writes, it can't run inside a transaction.
+    Each step picks up where an interrupted run stopped: a detach left pending is finalized and
+    tables already detached are dropped.
+    """
+    cutoff = add_months(datetime.now(timezone.utc).date().replace(day=1), -retention_months)
+
+    def expired(table: str, name: str) -> bool:
+        month = partition_month(table, name)
+        return month is not None and add_months(month, 1) <= cutoff
+
+    for table in HISTORY_PARTITIONED_TABLES:
+        for name, detach_pending in await list_history_partitions(table):
+            if not expired(table, name):
+                continue
+
+            async with get_engine().connect() as conn:
+                conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                mode = "FINALIZE" if detach_pending else "CONCURRENTLY"
+                await conn.execute(text(f'ALTER TABLE "{table}" DETACH PARTITION "{name}" {mode}'))
+
+    dropped = []
+    for table in HISTORY_PARTITIONED_TABLES:
+        for name in await list_detached_history_partitions(table):
+            if not expired(table, name):
+                continue
+
+            async with get_engine().begin() as conn:
+                await conn.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
+
+            logger.info(f"Dropped expired history partition {name}.")
+            dropped.append(name)
+
+    return dropped
+
+
+async def maintain_history_partitions() -> list[str]:
+    await ensure_history_partitions()
+    return await drop_expired_history_partitions()
@@ -0,0 +1,145 @@
+# src/app/database/rollups.py
+"""
+OHLC rollups of the snapshot history, per account, kind and chart interval.
+
+Buckets are aligned in UTC: 1h to the hour, 4h to 00/04/08/..., 1d to midnight and
+1w to Monday. They are updated in the same transaction that writes the raw rows.
+"""
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import case, delete, func, and_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from .database import get_engine
+from .models import BalanceRollup
+from src.config import ROLLUP_RETENTION_DAYS
+
+ROLLUP_INTERVALS = ('1h', '4h', '1d', '1w')
+
+# Points served per chart, keeps every history read a bounded index range scan
+ROLLUP_POINTS = {'1h': 168, '4h': 180, '1d': 365, '1w': 156}
+
+_rollups_table = BalanceRollup.__table__
+
+
+def bucket_start(timestamp: datetime, interval: str) -> datetime:
+    """Start of the UTC bucket `timestamp` falls into"""
+    timestamp = timestamp.astimezone(timezone.utc)
+    hour = timestamp.replace(minute=0, second=0, microsecond=0)
+
+    if interval == '1h':
+        return hour
+    if interval == '4h':
+        return hour.replace(hour=hour.hour - hour.hour % 4)
+
+    day = hour.replace(hour=0)
+    if interval == '1d':
+        return day
+    if interval == '1w':
+        return day - timedelta(days=day.weekday())
+
+    raise ValueError(f"Unknown rollup interval: {interval}")
+
+
+def aggregate_rollups(kind: str, records: list[tuple]) -> list[dict]:
+    """
+    Fold history records (id, account_id, timestamp, asset, balance, usd_value, ...)
+    into one OHLC row per (account, interval, bucket)
+    """
+    buckets: dict[tuple, dict] = {}
+
+    for record in sorted(records, key=lambda record: record[2]):
+        _, account_id, timestamp, _, balance, usd_value = record[:6]
+        usd_value = usd_value if usd_value is not None else 0.0
+
+        for interval in ROLLUP_INTERVALS:
+            key = (account_id, interval, bucket_start(timestamp, interval))
+            row = buckets.get(key)
+
+            if row is None:
+                buckets[key] = {
+                    "account_id": account_id,
+                    "kind": kind,
+                    "interval": interval,
+                    "bucket_start": key[2],
+                    "open_balance": balance,
+                    "high_balance": balance,
+                    "low_balance": balance,
+                    "close_balance": balance,
+                    "open_usd_value": usd_value,
+                    "high_usd_value": usd_value,
+                    "low_usd_value": usd_value,
+                    "close_usd_value": usd_value,
+                    "first_timestamp": timestamp,
+                    "last_timestamp": timestamp,
+                    "samples": 1,
+                }
+                continue
+
+            row["high_balance"] = max(row["high_balance"], balance)
+            row["low_balance"] = min(row["low_balance"], balance)
+            row["close_balance"] = balance
+            row["high_usd_value"] = max(row["high_usd_value"], usd_value)
+            row["low_usd_value"] = min(row["low_usd_value"], usd_value)
+            row["close_usd_value"] = usd_value
+            row["last_timestamp"] = timestamp
+            row["samples"] += 1
+
+    return list(buckets.values())
+
+
+# asyncpg takes at most 32767 bind parameters per statement, one per column of every VALUES row
+MAX_BIND_PARAMETERS = 32767
+
+
+async def upsert_rollups(conn: AsyncConnection, kind: str, records: list[tuple]):
+    """Merge a batch of freshly written history records into the rollup table"""
+    rows = aggregate_rollups(kind, records)
+    if not rows:
+        return
+
+    chunk_size = MAX_BIND_PARAMETERS // len(rows[0])
+    for start in range(0, len(rows), chunk_size):
+        await _upsert_rollup_rows(conn, rows[start:start + chunk_size])
+
+
+async def _upsert_rollup_rows(conn: AsyncConnection, rows: list[dict]):
+    stmt = pg_insert(_rollups_table).values(rows)
+    current, new = _rollups_table.c, stmt.excluded
+    is_earlier = new.first_timestamp < current.first_timestamp
+    is_later = new.last_timestamp >= current.last_timestamp
+
+    await conn.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[current.account_id, current.kind, current.interval, current.bucket_start],
+            set_={
+                "open_balance": case((is_earlier, new.open_balance), else_=current.open_balance),
+                "high_balance": func.greatest(current.high_balance, new.high_balance),
+                "low_balance": func.least(current.low_balance, new.low_balance),
+                "close_balance": case((is_later, new.close_balance), else_=current.close_balance),
+                "open_usd_value": case((is_earlier, new.open_usd_value), else_=current.open_usd_value),
+                "high_usd_value": func.greatest(current.high_usd_value, new.high_usd_value),
+                "low_usd_value": func.least(current.low_usd_value, new.low_usd_value),
+                "close_usd_value": case((is_later, new.close_usd_value), else_=current.close_usd_value),
+                "first_timestamp": func.least(current.first_timestamp, new.first_timestamp),
+                "last_timestamp": func.greatest(current.last_timestamp, new.last_timestamp),
+                "samples": current.samples + new.samples,
+            }
+        )
+    )
+
+
+async def trim_rollups():
+    """Drop fine-grained buckets older than their retention, coarse ones are kept"""
+    now = datetime.now(timezone.utc)
+    async with get_engine().begin() as conn:
+        for interval, days in ROLLUP_RETENTION_DAYS.items():
+            await conn.execute(
+                delete(_rollups_table).where(
+                    and_(
+                        _rollups_table.c.interval == interval,
+                        _rollups_table.c.bucket_start < now - timedelta(days=days)
+                    )
+                )
+            )
@@ -0,0 +1,96 @@
+from typing import Any, Optional
+import hashlib, json
+
+from src.config import OVERVIEW_VERSION_TTL
+from .utils import redis_client
+
+
+def version_of(value: Any) -> str:
+    """Content version of a JSON-able value, the same on every replica"""
+    encoded = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str).encode()
+    return hashlib.blake2b(encoded, digest_size=8).hexdigest()
+
+def etag_of(versions: dict[str, str]) -> str:
+    return f'"{version_of(versions)}"'
+
+def parse_versions(versions: Optional[str]) -> Optional[dict[str, str]]:
+    """`id:version,id:version` as sent by the client, None when it sent nothing"""
+    if versions is None:
+        return None
+    parsed = {}
+    for item in versions.split(","):
+        account_id, _, version = item.strip().rpartition(":")
+        if account_id and version:
+            parsed[account_id] = version
+    return parsed
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
+def _asset_key(asset: Any, index: int) -> str:
+    return str(asset.get("symbol", index)) if isinstance(asset, dict) else str(index)
+
+def version_accounts(accounts: list[dict]) -> dict:
+    """
+    Stamp every account with the version of its content and keep the version of each of its
+    assets, which later requests diff against.
+    """
+    asset_versions = {}
+    for account in accounts:
+        assets = account.get("assets") or []
+        asset_versions[account["id"]] = {_asset_key(asset, i): version_of(asset) for i, asset in enumerate(assets)}
+        account["version"] = version_of({key: value for key, value in account.items() if key != "version"})
+
+    return {
+        "accounts": accounts,
+        "asset_versions": asset_versions,
+        "versions": {account["id"]: account["version"] for account in accounts},
+    }
+
+async def remember_versions(overview: dict):
+    """Share the asset versions of this response, so any replica can diff against them"""
+    await redis_client.set_many(
+        {
+            f"overview:{account['id']}:{account['version']}": overview["asset_versions"][account["id"]]
+            for account in overview["accounts"]
+        },
+        ttl=OVERVIEW_VERSION_TTL
+    )
+
+async def build_delta(overview: dict, client_versions: dict[str, str]) -> dict:
+    """
+    Only what changed since the versions the client has: accounts it's missing or holds an
+    older version of, and within those just the changed assets when its version is still known.
+    """
+    changed = [account for account in overview["accounts"] if client_versions.get(account["id"]) != account["version"]]
+
+    known = [account for account in changed if account["id"] in client_versions]
+    previous = dict(zip(
+        (account["id"] for account in known),
+        await redis_client.get_many(f"overview:{account['id']}:{client_versions[account['id']]}" for account in known)
+    ))
+
+    accounts = []
+    for account in changed:
+        old_assets = previous.get(account["id"])
+        if old_assets is None:
+            accounts.append({**account, "base_version": None})
+            continue
+
+        new_assets = overview["asset_versions"][account["id"]]
+        assets = account.get("assets") or []
+        accounts.append({
+            **account,
+            "base_version": client_versions[account["id"]],
+            "assets": [asset for i, asset in enumerate(assets) if old_assets.get(_asset_key(asset, i)) != new_assets[_asset_key(asset, i)]],
+            "removed_assets": [key for key in old_assets if key not in new_assets],
+        })
+
+    return {
+        "versions": overview["versions"],
+        "accounts": accounts,
+        "removed": [account_id for account_id in client_versions if account_id not in overview["versions"]],
+    }
@@ -1,10 +1,7 @@
 import asyncio, sys
 from fastapi import FastAPI
 
-if len(sys.argv) > 1 and sys.argv[1] == "test":
-    from src.app.proxy import BrightProxy
-else:
-    from app.proxy import BrightProxy
+from src.app.proxy import BrightProxy
 
 class BinanceLayerConnection():
     """
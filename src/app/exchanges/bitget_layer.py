@@ -4,16 +4,16 @@ import hmac
 import time
 import json
 import httpx
-import sys
+import logging
 from typing import Dict
 
 
 from fastapi import HTTPException
 
-if len(sys.argv) > 1 and sys.argv[1] == "test":
-    from src.app.proxy import BrightProxy
-else:
-    from app.proxy import BrightProxy
+from src.app.proxy import BrightProxy
+from src.app.tracing import traced
+
+logger = logging.getLogger(__name__)
 
 class BitgetLayerConnection():
     def __init__(self, api_key, api_secret_key, passphrase, proxy: BrightProxy, ip: str) -> None:
@@ -32,6 +32,7 @@ class BitgetLayerConnection():
         )
         return base64.b64encode(mac.digest()).decode()
 
+    @traced("bitget.get_headers", exchange="bitget")
     def get_headers(self, method: str, request_path: str, query_params: dict, body_params: dict) -> dict:
         timestamp = str(int(time.time() * 1000))
         method = method.upper()
@@ -79,7 +80,7 @@ class BitgetLayerConnection():
         if response_data.get('msg') == 'success':
             return response_data.get('data', None)
         else:
-            print(response_data)
+            logger.warning("Bitget account information request failed", extra={"response": response_data})
             await self.proxy.remove_ip_blacklist(ip=self.ip)
             raise HTTPException(status_code=400, detail="An error ocurred, please try again later")
 
@@ -263,7 +264,7 @@ class BitgetLayerConnection():
 
             return result
         else:
-            print("An error ocurred: ",response_data)
+            logger.warning("Bitget balance request failed", extra={"response": response_data})
             return None
 
 async def main_test_bitget():
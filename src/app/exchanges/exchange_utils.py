@@ -1,6 +1,5 @@
 import asyncio, logging
 from typing import Optional
-from aiohttp import ClientSession, ClientError
 
 from fastapi import HTTPException
 
@@ -78,22 +77,14 @@ async def get_account_balance_(account_id, exchange, proxy: BrightProxy, apikey:
         current_balance_data = await bitget_account.account_balance()
         current_balance = current_balance_data['total']
 
-        # Attempt to get the 24h balance, fall back if not available
-        offset_hours = 24
-        previous_balance = None
+        # Balance 24 snapshots ago, or the oldest one we have if the history is shorter
+        balance_history = await get_balance_history(account_id=account_id, limit=25)
 
-        while offset_hours > 0:
-            balance_24h_data = await get_balance_history(account_id=account_id, limit=1, offset=offset_hours)
-            
-            if balance_24h_data.size > 0 and balance_24h_data[0][1] is not None:
-                previous_balance = balance_24h_data[0][1]
-                break
-            
-            offset_hours -= 1 
-
-        if previous_balance is None:
+        if balance_history.size < 2:
             raise ValueError("Could not retrieve balance history data even after reducing the offset.")
 
+        previous_balance = float(balance_history['balance'][min(24, balance_history.size - 1)])
+
         if previous_balance == 0:
             raise ValueError("Previous balance is zero, cannot calculate percentage change.")
 
@@ -126,30 +117,6 @@ async def get_account_balance_(account_id, exchange, proxy: BrightProxy, apikey:
 
         return current_balance_data
 
-async def get_asset_price_in_usd(asset: str) -> float:
-    """
-    Fetch the current price of an asset in USD from CoinGecko asynchronously using aiohttp.
-    """
-    url = "https://api.coingecko.com/api/v3/simple/price"
-    params = {"ids": asset.lower(), "vs_currencies": "usd"}
-    
-    try:
-        async with ClientSession() as session:
-            async with session.get(url, params=params) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return data.get(asset.lower(), {}).get("usd", 0.0)
-                else:
-                    print(f"Error: Received status code {response.status} for asset {asset}")
-                    return 0.0
-    except ClientError as e:
-        print(f"Network error fetching price for {asset}: {e}")
-        return 0.0
-    except Exception as e:
-        print(f"Unexpected error fetching price for {asset}: {e}")
-        return 0.0
-
-
 async def get_account_assets_(exchange, proxy: BrightProxy, apikey: Optional[str] = None, secret_key: Optional[str] = None, passphrase: Optional[str] = None, proxy_ip: Optional[str] = None):
     """Get account assets of spot, futures and margin accounts"""
     
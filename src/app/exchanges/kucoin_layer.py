@@ -4,15 +4,13 @@ import hmac
 import time
 import json
 import hashlib
-import sys
 from typing import Dict
 from fastapi import HTTPException
 from decimal import Decimal, InvalidOperation, ROUND_DOWN
 
-if len(sys.argv) > 1 and sys.argv[1] == "test":
-    from src.app.proxy import BrightProxy
-else:
-    from app.proxy import BrightProxy
+from src.app.proxy import BrightProxy
+from src.app.ratelimit import RateLimited
+from src.app.tracing import traced
 
 def format_decimal(value: Decimal, precision: Decimal) -> str:
     """
@@ -59,6 +57,7 @@ class KucoinLayerConnection:
             ).digest()
         ).decode()
 
+    @traced("kucoin.get_headers", exchange="kucoin")
     def get_headers(self, method: str, request_path: str, query_params: dict, body_params: dict) -> dict:
         timestamp = str(int(time.time() * 1000))
         method = method.upper()
@@ -143,6 +142,8 @@ class KucoinLayerConnection:
                     detail=f"API Error {error_code}: {error_msg}. Please try again later."
                 )
             
+        except RateLimited:
+            raise
         except Exception as e:
             raise HTTPException(
                 status_code=500,
@@ -164,6 +165,8 @@ class KucoinLayerConnection:
                 headers=headers,
                 ip=self.ip
             )
+        except RateLimited:
+            raise
         except Exception as e:
             # Log the exception
             avariable_ip = await self.proxy.get_machine_ip()
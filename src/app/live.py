@@ -0,0 +1,127 @@
+from datetime import datetime, timezone as tz
+from typing import Any, Optional
+import asyncio, logging
+
+from src.config import LIVE_COALESCE_SECONDS, LIVE_QUEUE_SIZE
+from .utils import RedisClient, redis_client
+
+logger = logging.getLogger(__name__)
+
+
+class Subscriber:
+    """
+    One live connection. Updates are merged per account for `window` seconds and then queued as a
+    single diff holding only the fields the client doesn't have yet. While the queue is full (the
+    client reads slower than we produce) nothing is queued, updates keep merging instead, so a
+    slow client costs one pending entry per account and never an unbounded backlog.
+    """
+    def __init__(self, user_id: str, window: float = LIVE_COALESCE_SECONDS, queue_size: int = LIVE_QUEUE_SIZE) -> None:
+        self.user_id = user_id
+        self.window = window
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._pending: dict[str, dict] = {}   # account_id -> fields changed since the last flush
+        self._sent: dict[str, dict] = {}      # account_id -> fields as the client has them
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+        self.updates = 0
+        self.diffs = 0
+        self.deferred_flushes = 0
+
+    def snapshot(self, accounts: dict[str, dict]) -> dict:
+        """First message of a connection, later diffs are relative to it"""
+        for account_id, fields in accounts.items():
+            self._sent[account_id] = dict(fields)
+        return {"type": "snapshot", "accounts": accounts, "at": _now()}
+
+    def push(self, account_id: str, fields: dict):
+        self.updates += 1
+        self._pending.setdefault(account_id, {}).update(fields)
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.window, self._flush)
+
+    def _flush(self):
+        self._flush_handle = None
+        if not self._pending:
+            return
+
+        if self.queue.full():
+            # Backpressure: keep merging until the client drained some diffs
+            self.deferred_flushes += 1
+            self._flush_handle = asyncio.get_running_loop().call_later(self.window, self._flush)
+            return
+
+        diff = {}
+        for account_id, fields in self._pending.items():
+            sent = self._sent.setdefault(account_id, {})
+            changed = {key: value for key, value in fields.items() if sent.get(key) != value}
+            if changed:
+                sent.update(changed)
+                diff[account_id] = changed
+        self._pending.clear()
+
+        if diff:
+            self.diffs += 1
+            self.queue.put_nowait({"type": "update", "accounts": diff, "at": _now()})
+
+    def close(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+
+class LiveHub:
+    """
+    Routes account updates to the live connections of their user.
+
+    Updates are published on Redis, so a change seen by a Celery worker or another replica reaches
+    every connection. They're also delivered locally right away, the echo from Redis is then
+    a no-op since the subscribers only send what changed.
+    """
+    CHANNEL = "live:accounts"
+
+    def __init__(self, redis: RedisClient = redis_client) -> None:
+        self.redis = redis
+        self._subscribers: dict[str, set[Subscriber]] = {}
+
+    def subscribe(self, user_id: Any) -> Subscriber:
+        subscriber = Subscriber(str(user_id))
+        self._subscribers.setdefault(subscriber.user_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscriber.close()
+        subscribers = self._subscribers.get(subscriber.user_id)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[subscriber.user_id]
+
+    def dispatch(self, message: dict):
+        for subscriber in self._subscribers.get(message["user_id"], ()):
+            subscriber.push(message["account_id"], message["fields"])
+
+    async def publish(self, user_id: Any, account_id: str, fields: dict):
+        """Send changed fields of an account (total, accounts, assets...) to every live connection of its user"""
+        message = {"user_id": str(user_id), "account_id": account_id, "fields": fields}
+        self.dispatch(message)
+        await self.redis.publish(self.CHANNEL, message)
+
+    async def listen(self):
+        """Deliver the updates of the other processes, run it as a background task"""
+        await self.redis.listen(self.CHANNEL, self.dispatch)
+
+    def stats(self) -> dict:
+        subscribers = [subscriber for subscribers in self._subscribers.values() for subscriber in subscribers]
+        return {
+            "users": len(self._subscribers),
+            "connections": len(subscribers),
+            "queued": sum(subscriber.queue.qsize() for subscriber in subscribers),
+            "deferred_flushes": sum(subscriber.deferred_flushes for subscriber in subscribers),
+        }
+
+
+def _now() -> str:
+    return datetime.now(tz.utc).isoformat()
+
+
+live_hub = LiveHub()
@@ -0,0 +1,45 @@
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from datetime import datetime, timezone as tz
+import logging, orjson
+
+from src.config import LOG_LEVEL, LOG_FORMAT
+
+# Attributes every LogRecord has, anything else came in through `extra=` and is logged as a field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and the `extra=` fields"""
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, tz.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return orjson.dumps(entry, default=str).decode()
+
+
+def configure_logging(level: str = LOG_LEVEL, log_format: str = LOG_FORMAT) -> QueueListener:
+    """
+    Route every log record through a queue: the caller only enqueues, a listener thread formats
+    and writes, so a slow stderr never blocks the event loop. Stop the returned listener on shutdown.
+    """
+    handler = logging.StreamHandler()
+    handler.setFormatter(
+        JsonFormatter() if log_format == "json"
+        else logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    )
+
+    queue = SimpleQueue()
+    listener = QueueListener(queue, handler, respect_handler_level=True)
+    listener.start()
+
+    root = logging.getLogger()
+    root.handlers = [QueueHandler(queue)]
+    root.setLevel(level)
+    return listener
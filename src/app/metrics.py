@@ -0,0 +1,167 @@
+from typing import Optional
+from urllib.parse import urlsplit
+from prometheus_client import CollectorRegistry, Counter, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.multiprocess import MultiProcessCollector
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+import os, re, time
+
+# Labels only ever hold route templates, exchange names, endpoint paths, proxy IPs and function
+# names, never user or account IDs, so the number of series stays bounded
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+DB_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+SNAPSHOT_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "API request latency per route template",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+
+EXCHANGE_REQUEST_DURATION = Histogram(
+    "exchange_request_duration_seconds", "Exchange call latency through curl_api, rate limit wait excluded",
+    ["exchange", "endpoint"], buckets=LATENCY_BUCKETS,
+)
+EXCHANGE_REQUEST_ERRORS = Counter(
+    "exchange_request_errors_total", "Exchange calls that raised or answered with an error status",
+    ["exchange", "endpoint", "reason"],
+)
+EXCHANGE_RATE_LIMIT_WAITS = Counter(
+    "exchange_rate_limit_waits_total", "Times a call slept for an exchange rate limit token", ["exchange"],
+)
+EXCHANGE_RATE_LIMIT_REJECTIONS = Counter(
+    "exchange_rate_limit_rejections_total", "Calls rejected with RateLimited after waiting EXCHANGE_RATE_MAX_WAIT", ["exchange"],
+)
+PROXY_REQUEST_DURATION = Histogram(
+    "proxy_request_duration_seconds", "curl_api latency per BrightData proxy IP",
+    ["proxy_ip"], buckets=LATENCY_BUCKETS,
+)
+
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds", "Duration of a crud function, session and transaction included",
+    ["function", "engine"], buckets=DB_BUCKETS,
+)
+DB_QUERY_ERRORS = Counter(
+    "db_query_errors_total", "crud functions that raised", ["function", "engine"],
+)
+
+SNAPSHOT_DURATION = Histogram(
+    "snapshot_run_duration_seconds", "Duration of a whole hourly asset snapshot run", buckets=SNAPSHOT_BUCKETS,
+)
+SNAPSHOT_ACCOUNT_DURATION = Histogram(
+    "snapshot_account_duration_seconds", "Duration of one account's snapshot, retries included",
+    ["exchange"], buckets=LATENCY_BUCKETS,
+)
+SNAPSHOT_ACCOUNTS = Counter(
+    "snapshot_accounts_total", "Accounts processed by the snapshot task", ["exchange", "outcome"],
+)
+SNAPSHOT_RETRIES = Counter(
+    "snapshot_retries_total", "Snapshot attempts retried after a failure", ["exchange"],
+)
+
+
+_ID_SEGMENT = re.compile(r"^(?=.*\d)[\w.-]{8,}$|^\d+$")
+
+def exchange_endpoint(url: str) -> tuple[str, str]:
+    """(exchange, endpoint path) labels of a curl_api URL, id-like path segments folded to ':id'"""
+    from .ratelimit import EXCHANGE_HOSTS
+
+    parts = urlsplit(url)
+    exchange = EXCHANGE_HOSTS.get(parts.hostname or "", "other")
+    if exchange == "other":
+        return exchange, "other"
+    segments = [":id" if _ID_SEGMENT.match(segment) else segment for segment in parts.path.split("/")]
+    return exchange, "/".join(segments) or "/"
+
+
+class MetricsMiddleware:
+    """Latency of every HTTP request, labelled with the matched route template instead of the raw path"""
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.labels(
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=f"{status // 100}xx",
+            ).observe(time.perf_counter() - start)
+
+
+class PoolCollector:
+    """Connection pool gauges of this process' engines, read at scrape time"""
+    GAUGES = {
+        "checked_out": "Connections in use",
+        "checked_in": "Idle connections in the pool",
+        "saturation": "Checked out connections over pool_size + max_overflow",
+        "checkout_timeouts": "Checkouts that gave up after DB_POOL_TIMEOUT",
+        "checkout_errors": "Checkouts that failed to connect (refused, authentication, DNS)",
+        "checkout_wait_max_ms": "Longest checkout wait",
+        "connections": "Open connections",
+        "connection_age_max_s": "Age of the oldest open connection",
+    }
+
+    def collect(self):
+        from .database import database
+
+        if database._engines is None:  # nothing connected yet, don't build engines for a scrape
+            return
+        families = {
+            name: GaugeMetricFamily(f"db_pool_{name}", description, labels=["engine"])
+            for name, description in self.GAUGES.items()
+        }
+        for engine, status in database.pool_status().items():
+            for name, family in families.items():
+                if status.get(name) is not None:
+                    family.add_metric([engine], float(status[name]))
+        yield from families.values()
+
+
+_pool_collector: Optional[PoolCollector] = None
+
+
+def metrics_registry() -> CollectorRegistry:
+    """
+    This process' registry, or with PROMETHEUS_MULTIPROC_DIR set (several uvicorn workers) one
+    aggregating the metric files of every worker. Pool gauges then only cover the scraped process.
+    """
+    global _pool_collector
+    if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        if _pool_collector is None:
+            _pool_collector = PoolCollector()
+            REGISTRY.register(_pool_collector)
+        return REGISTRY
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry)
+    registry.register(PoolCollector())
+    return registry
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Text exposition of metrics_registry() and its content type"""
+    return generate_latest(metrics_registry()), CONTENT_TYPE_LATEST
+
+
+def observe_exchange_call(url: str, ip: Optional[str], seconds: float, error: Optional[str] = None):
+    """Record one curl_api call, `error` is a short reason ('timeout', 'http_5xx'...) when it failed"""
+    exchange, endpoint = exchange_endpoint(url)
+    EXCHANGE_REQUEST_DURATION.labels(exchange=exchange, endpoint=endpoint).observe(seconds)
+    PROXY_REQUEST_DURATION.labels(proxy_ip=ip or "direct").observe(seconds)
+    if error is not None:
+        EXCHANGE_REQUEST_ERRORS.labels(exchange=exchange, endpoint=endpoint, reason=error).inc()
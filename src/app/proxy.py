@@ -4,19 +4,19 @@ import asyncio
 import hashlib
 import base64
 import httpx
-import sys
 import json
 import random
+import time
 from typing import Optional, Literal
 from fastapi import HTTPException
+from opentelemetry import trace
 import logging
 
-if len(sys.argv) > 1 and sys.argv[1] == "test":
-    from src.config import BRIGHTDATA_API_TOKEN
-    from src.app.database.crud import get_used_ips
-else:
-    from config import BRIGHTDATA_API_TOKEN
-    from app.database.crud import get_used_ips
+from src.config import BRIGHTDATA_API_TOKEN
+from src.app.database.crud import get_used_ips
+from src.app.ratelimit import exchange_rate_limiter
+from src.app.metrics import observe_exchange_call, exchange_endpoint
+from src.app.tracing import HttpxTraceHook, traced, span, tracing_enabled
 
 logger = logging.getLogger(__name__)
 
@@ -89,6 +89,7 @@ class BrightProxy:
             except httpx.RequestError as e:
                 return {"error": str(e)}
             
+    @traced("curl_api")
     async def curl_api(
         self,
         url: str,
@@ -104,6 +105,18 @@ class BrightProxy:
         Uses a single proxy for both HTTP and HTTPS traffic by creating
         an AsyncHTTPTransport and specifying `proxy=...`.
         """
+        exchange, endpoint = exchange_endpoint(url)
+        current_span = trace.get_current_span()
+        current_span.set_attributes({"exchange": exchange, "exchange.endpoint": endpoint, "http.request.method": method, "proxy.ip": ip or "direct"})
+
+        # Exchange calls wait for a token of their API key + proxy IP bucket, RateLimited when none comes
+        with span("ratelimit.wait", exchange=exchange):
+            await exchange_rate_limiter.throttle(url, headers, ip)
+
+        # Child spans for the proxy connect, CONNECT tunnel, TLS and the exchange's response
+        extensions = {"trace": HttpxTraceHook()} if tracing_enabled() else None
+
+        start = time.perf_counter()
         try:
             proxy_url = (
                 f"http://brd-customer-{self.customer_id}-zone-{self.zones[0]}"
@@ -114,16 +127,19 @@ class BrightProxy:
 
             async with httpx.AsyncClient(transport=transport) as client:
                 if method == "GET":
-                    response = await client.get(url, params=body, headers=headers)
+                    response = await client.get(url, params=body, headers=headers, extensions=extensions)
                 elif method == "POST":
-                    response = await client.post(url, json=body, headers=headers)
+                    response = await client.post(url, json=body, headers=headers, extensions=extensions)
                 elif method == "PUT":
-                    response = await client.put(url, json=body, headers=headers)
+                    response = await client.put(url, json=body, headers=headers, extensions=extensions)
                 elif method == "DELETE":
-                    response = await client.delete(url, json=body, headers=headers)
+                    response = await client.delete(url, json=body, headers=headers, extensions=extensions)
                 else:
                     raise ValueError(f"Unsupported HTTP method: {method}")
-                
+
+                observe_exchange_call(url, ip, time.perf_counter() - start, error=f"http_{response.status_code // 100}xx" if response.status_code >= 400 else None)
+                current_span.set_attribute("http.response.status_code", response.status_code)
+
                 try:
                     return response.json()
                 except ValueError:
@@ -133,9 +149,10 @@ class BrightProxy:
                     }
         except Exception as e:
             logger.error(f"Error during curl_api: {e}", exc_info=True)
+            observe_exchange_call(url, ip, time.perf_counter() - start, error="timeout" if isinstance(e, httpx.TimeoutException) else type(e).__name__)
             
             if str(e).startswith('401'):
-                machine_ip = await self.get_machine_ip(); print(machine_ip)
+                machine_ip = await self.get_machine_ip()
                 await self.remove_ip_blacklist(machine_ip)
                 await self.set_whitlist_ip(machine_ip)
                 raise HTTPException(status_code=401, detail="Your IP address has been blacklisted, reload again the page to see your response")
@@ -0,0 +1,168 @@
+from typing import Optional
+from urllib.parse import urlsplit
+import asyncio, hashlib, logging, math, time
+
+from src.config import EXCHANGE_RATE_LIMITS, EXCHANGE_RATE_PREFETCH, EXCHANGE_RATE_PREFETCH_TTL, EXCHANGE_RATE_MAX_WAIT
+from .utils import RedisClient, redis_client
+from .metrics import EXCHANGE_RATE_LIMIT_WAITS, EXCHANGE_RATE_LIMIT_REJECTIONS
+
+logger = logging.getLogger(__name__)
+
+EXCHANGE_HOSTS = {
+    "api.bitget.com": "bitget",
+    "api.kucoin.com": "kucoin",
+    "api-futures.kucoin.com": "kucoin",
+    "api.binance.com": "binance",
+    "www.okx.com": "okx",
+}
+
+API_KEY_HEADERS = ("ACCESS-KEY", "KC-API-KEY", "X-MBX-APIKEY", "OK-ACCESS-KEY")
+
+
+class RateLimited(Exception):
+    """No token of an exchange bucket within EXCHANGE_RATE_MAX_WAIT. The API answers 429, the snapshot task retries"""
+    def __init__(self, exchange: str, retry_after: float) -> None:
+        super().__init__(f"Rate limit of {exchange} reached, try again shortly")
+        self.exchange = exchange
+        self.retry_after = retry_after
+
+# KEYS[1] bucket hash, ARGV rate per second, burst, tokens wanted -> {granted, ms until the next token}
+# Refills from the Redis clock, so every replica and worker agrees on the time
+TOKEN_BUCKET = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local wanted = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'at')
+local tokens = tonumber(bucket[1]) or burst
+local at = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - at) * rate)
+
+local granted = math.min(wanted, math.floor(tokens))
+tokens = tokens - granted
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'at', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+
+local wait = 0
+if granted == 0 then
+    wait = math.ceil((1 - tokens) / rate * 1000)
+end
+return {granted, wait}
+"""
+
+
+class ExchangeRateLimiter:
+    """
+    Token buckets per exchange + API key + proxy IP, shared through Redis by the API replicas
+    and the Celery workers.
+
+    A process takes up to `prefetch` tokens per round trip and spends them locally, so most calls
+    never touch Redis. Unused tokens expire after `prefetch_ttl`, which bounds how far a process
+    holding them can push the others past the limit. Without Redis, each process falls back to a
+    local bucket with the same limits.
+    """
+    def __init__(
+            self,
+            limits: dict[str, tuple[float, int]] = EXCHANGE_RATE_LIMITS,
+            prefetch: int = EXCHANGE_RATE_PREFETCH,
+            prefetch_ttl: float = EXCHANGE_RATE_PREFETCH_TTL,
+            max_wait: float = EXCHANGE_RATE_MAX_WAIT,
+            redis: RedisClient = redis_client,
+        ) -> None:
+        self.limits = limits
+        self.prefetch = prefetch
+        self.prefetch_ttl = prefetch_ttl
+        self.max_wait = max_wait
+        self.redis = redis
+        self._prefetched: dict[str, tuple[int, float]] = {}   # bucket -> (tokens, expires_at)
+        self._fallback: dict[str, tuple[float, float]] = {}   # bucket -> (tokens, updated_at)
+        self._locks: dict[str, asyncio.Lock] = {}
+
+        self.local_grants = 0
+        self.round_trips = 0
+        self.fallback_grants = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.rejections = 0
+
+    @staticmethod
+    def bucket(exchange: str, apikey: str, ip: Optional[str]) -> str:
+        # The API key itself never goes to Redis
+        digest = hashlib.blake2b(apikey.encode(), digest_size=8).hexdigest()
+        return f"ratelimit:{exchange}:{digest}:{ip or 'direct'}"
+
+    async def throttle(self, url: str, headers: Optional[dict], ip: Optional[str]):
+        """Wait for a token if `url` is a rate limited exchange call, see curl_api"""
+        exchange = EXCHANGE_HOSTS.get(urlsplit(url).hostname or "")
+        apikey = next((headers[header] for header in API_KEY_HEADERS if headers and headers.get(header)), None)
+        if exchange is None or apikey is None or exchange not in self.limits:
+            return
+        await self.acquire(exchange, apikey, ip)
+
+    async def acquire(self, exchange: str, apikey: str, ip: Optional[str]):
+        """Take one token, waiting up to `max_wait` for it. Raises RateLimited past that"""
+        rate, burst = self.limits[exchange]
+        bucket = self.bucket(exchange, apikey, ip)
+        deadline = time.monotonic() + self.max_wait
+
+        if self._take_prefetched(bucket):
+            return
+
+        # One coroutine per bucket talks to Redis, the rest queue here and spend what it prefetched
+        async with self._locks.setdefault(bucket, asyncio.Lock()):
+            while True:
+                if self._take_prefetched(bucket):
+                    return
+
+                granted, wait = await self._request(bucket, rate, burst, min(self.prefetch, burst))
+                if granted:
+                    self._prefetched[bucket] = (granted - 1, time.monotonic() + self.prefetch_ttl)
+                    return
+
+                if time.monotonic() + wait > deadline:
+                    self.rejections += 1
+                    EXCHANGE_RATE_LIMIT_REJECTIONS.labels(exchange=exchange).inc()
+                    raise RateLimited(exchange, wait)
+
+                self.waits += 1
+                EXCHANGE_RATE_LIMIT_WAITS.labels(exchange=exchange).inc()
+                self.wait_seconds += wait
+                await asyncio.sleep(wait)
+
+    def _take_prefetched(self, bucket: str) -> bool:
+        tokens, expires_at = self._prefetched.get(bucket, (0, 0.0))
+        if tokens <= 0 or time.monotonic() >= expires_at:
+            return False
+        self._prefetched[bucket] = (tokens - 1, expires_at)
+        self.local_grants += 1
+        return True
+
+    async def _request(self, bucket: str, rate: float, burst: int, wanted: int) -> tuple[int, float]:
+        """(tokens granted, seconds until the next one) from Redis, or the local fallback bucket"""
+        result = await self.redis.run_script(TOKEN_BUCKET, [bucket], [rate, burst, wanted])
+        if result is not None:
+            self.round_trips += 1
+            return int(result[0]), int(result[1]) / 1000
+
+        now = time.monotonic()
+        tokens, updated_at = self._fallback.get(bucket, (float(burst), now))
+        tokens = min(burst, tokens + (now - updated_at) * rate)
+        granted = min(wanted, math.floor(tokens))
+        self._fallback[bucket] = (tokens - granted, now)
+        self.fallback_grants += granted
+        return granted, 0.0 if granted else (1 - (tokens - granted)) / rate
+
+    def stats(self) -> dict:
+        return {
+            "local_grants": self.local_grants,
+            "round_trips": self.round_trips,
+            "fallback_grants": self.fallback_grants,
+            "waits": self.waits,
+            "wait_seconds": self.wait_seconds,
+            "rejections": self.rejections,
+        }
+
+
+exchange_rate_limiter = ExchangeRateLimiter()
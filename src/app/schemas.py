@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr, UUID4
-from typing import Optional, Literal, List
+from pydantic import BaseModel, EmailStr, UUID4, Field
+from typing import Any, Optional, Literal, List, Dict, Union
 from src.config import AVARIABLE_EXCHANGES
 
 
@@ -39,6 +39,78 @@ class TransferAssetsBase(BaseModel):
     to_: str
     amount: float
 
+"""Overview"""
+# Response models of the hot dashboard routes. With a response_model FastAPI validates and
+# writes the JSON in pydantic-core, skipping jsonable_encoder (see scripts/benchmarks/serialization.py)
+class AccountBalance(BaseModel):
+    id: str
+    total: float
+    change_24h: float = Field(alias="24h_change")
+    change_24h_percentage: float = Field(alias="24h_change_percentage")
+    exchange: Optional[str] = None
+    account_name: Optional[str] = None
+    accounts: Dict[str, float]
+    stale: bool
+    as_of: Optional[str] = None  # time of the stored snapshot served when the exchange didn't answer
+
+class BalanceOverviewResponse(BaseModel):
+    total: float
+    change_24h: float = Field(alias="24h_change")
+    change_24h_percentage: float = Field(alias="24h_change_percentage")
+    currency: str = "usd"  # of every amount, UserConfiguration.currency
+    partial: bool
+    accounts: List[AccountBalance]
+
+class BalancePoint(BaseModel):
+    timestamp: str
+    open: float
+    high: float
+    low: float
+    close: float
+    usd_open: float
+    usd_high: float
+    usd_low: float
+    usd_close: float
+
+class BalanceColumns(BaseModel):
+    """Columnar layout of the same points, one array per field"""
+    timestamp: List[str]
+    open: List[float]
+    high: List[float]
+    low: List[float]
+    close: List[float]
+    usd_open: List[float]
+    usd_high: List[float]
+    usd_low: List[float]
+    usd_close: List[float]
+
+class BalanceHistoryResponse(BaseModel):
+    interval: str
+    accounts: Dict[str, Union[List[BalancePoint], BalanceColumns]]
+
+class AssetsHistoryResponse(BaseModel):
+    interval: str
+    accounts: Dict[str, Dict[Literal['spot', 'futures'], Union[List[BalancePoint], BalanceColumns]]]
+
+class AccountOverview(BaseModel):
+    id: str
+    account_name: Optional[str] = None
+    exchange_name: Optional[str] = None
+    assets: Optional[List[Dict[str, Any]]] = None  # shape differs per exchange
+    balance: Optional[Dict[str, Any]] = None
+    currency: Optional[str] = None  # of the assets' `value`
+    version: str
+
+class AccountOverviewChange(AccountOverview):
+    base_version: Optional[str] = None  # None: the whole account, else only assets changed since this version
+    removed_assets: Optional[List[str]] = None
+
+class AccountOverviewDelta(BaseModel):
+    versions: Dict[str, str]
+    accounts: List[AccountOverviewChange]
+    removed: List[str]
+
+
 """Operations"""
 class TradeRequest(BaseModel):
     user_ids: List[UUID4]
@@ -1,13 +1,21 @@
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from fastapi.security import OAuth2PasswordBearer
 from fastapi import HTTPException, Depends
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
 from datetime import datetime, timedelta
-from typing import Annotated
+from typing import Annotated, Optional
 from uuid import UUID
-import base64, jwt
+import asyncio, base64, hashlib, os, time, jwt
 
-from src.config import PUBLIC_KEY, PRIVATE_KEY, JWT_SECRET_KEY
+from src.config import (
+    PUBLIC_KEY, PRIVATE_KEY, JWT_SECRET_KEY, CRYPTO_EXECUTOR, CRYPTO_WORKERS, DATA_KEY_CACHE_SIZE, DATA_KEY_CACHE_TTL,
+    JWT_CACHE_SIZE, JWT_CACHE_TTL, AUTH_CONTEXT_CACHE_SIZE, AUTH_CONTEXT_CACHE_TTL
+)
+from src.app.cache import TTLCache
+from src.app.utils import redis_client
+from src.app.tracing import traced
 
 ALGORITHM = "HS256"
 TOKEN_EXPIRE_DAYS = 30
@@ -25,10 +33,23 @@ def encode_session_token(user_id: str):
     return token
 
 
+# Tokens whose signature was already verified: digest -> (user_id, exp). Failures are never cached
+jwt_cache = TTLCache(maxsize=JWT_CACHE_SIZE, ttl=JWT_CACHE_TTL)
+
 def decode_session_token(token: str):
+    cache_key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    cached = jwt_cache.get(cache_key)
+    if cached is not None and cached[1] > time.time():
+        return cached[0]
+
     try:
         payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[ALGORITHM])
         user_id = payload.get("sub")
+
+        expires_at = payload.get("exp")
+        if expires_at is not None:
+            # Never outlive the token itself
+            jwt_cache.set(cache_key, (user_id, expires_at), ttl=min(JWT_CACHE_TTL, expires_at - time.time()))
         return user_id
     except jwt.ExpiredSignatureError:
         raise HTTPException(
@@ -60,20 +81,48 @@ async def get_current_active_user(
     user_id = current_user_credentials  
     return user_id
 
+# user_id -> (user_id, proxy_ip, apikey, secret_key, passphrase, exchange) of the main account.
+# Per process, the short TTL bounds how long another worker can serve an old main account.
+# Only the metadata (main account ID, proxy IP) is shared through Redis, decrypted keys never leave the process
+auth_context_cache = TTLCache(maxsize=AUTH_CONTEXT_CACHE_SIZE, ttl=AUTH_CONTEXT_CACHE_TTL)
+
+def invalidate_auth_context(user_id: Optional[str] = None):
+    """Forget the cached main account context of one user, or of every user (shared entries then expire on their own)"""
+    if user_id is None:
+        auth_context_cache.clear()
+    else:
+        auth_context_cache.pop(str(user_id))
+        redis_client.delete_soon(f"main-account:{user_id}")
+
+def auth_cache_stats() -> dict:
+    return {"jwt": jwt_cache.stats(), "auth_context": auth_context_cache.stats(), "redis": redis_client.stats()}
+
 async def get_current_active_account(
         current_user_credentials: Annotated[tuple[dict, str], Depends(get_user_id)]
 ):
     """Get user and all its credentials for its main account"""
     from src.app.database.crud import get_main_account, get_account_credentials
 
-    # Get main account
     user_id = current_user_credentials
-    main_account_id, proxy_ip = await get_main_account(user_id=user_id)
-    
+    context = auth_context_cache.get(str(user_id))
+    if context is not None:
+        return context
+
+    # Get main account, another replica may have looked it up already
+    main_account = await redis_client.get(f"main-account:{user_id}")
+    if main_account is None:
+        main_account = await get_main_account(user_id=user_id)
+        if main_account is None:
+            raise HTTPException(status_code=404, detail="Main account not found")
+        await redis_client.set(f"main-account:{user_id}", list(main_account), ttl=AUTH_CONTEXT_CACHE_TTL)
+    main_account_id, proxy_ip = main_account
+
     # Get account credentials
     account_api_keys = await get_account_credentials(account_id=main_account_id)
 
-    return user_id, proxy_ip, account_api_keys['apikey'], account_api_keys['secret_key'], account_api_keys['passphrase'], account_api_keys['exchange_name']
+    context = (user_id, proxy_ip, account_api_keys['apikey'], account_api_keys['secret_key'], account_api_keys['passphrase'], account_api_keys['exchange'])
+    auth_context_cache.set(str(user_id), context)
+    return context
 
 # - - - - - ENCRYPTION - - - - - 
 def encrypt_data(plain_text: str) -> str:
@@ -89,15 +138,154 @@ def encrypt_data(plain_text: str) -> str:
     return base64.b64encode(encrypted).decode('utf-8')
 
 def decrypt_data(encrypted_data: str) -> str:
-    decrypt_data = PRIVATE_KEY.decrypt(
-        base64.b64decode(encrypted_data.encode('utf8')),
+    return decrypt_bytes(base64.b64decode(encrypted_data.encode('utf8')))
+
+def decrypt_bytes(encrypted_value: Optional[bytes]) -> Optional[str]:
+    """Decrypt a raw RSA-OAEP ciphertext (as stored in the database), None stays None"""
+    if encrypted_value is None:
+        return None
+
+    decrypted_value = PRIVATE_KEY.decrypt(
+        encrypted_value,
         padding.OAEP(
             mgf=padding.MGF1(algorithm=hashes.SHA256()),
             algorithm=hashes.SHA256(),
             label=None
         )
     )
-    return decrypt_data.decode('utf-8')
+    return decrypted_value.decode('utf-8')
+
+
+def encrypt_fields(*plain_texts: Optional[str]) -> tuple:
+    """Encrypt several fields at once, None stays None"""
+    return tuple(encrypt_data(text) if text else None for text in plain_texts)
+
+def decrypt_fields(*encrypted_values: Optional[bytes]) -> tuple:
+    """Decrypt several raw credential columns at once, None stays None"""
+    return tuple(decrypt_bytes(value) for value in encrypted_values)
+
+
+# - - - - - ENVELOPE ENCRYPTION - - - - - 
+# 'rsa-oaep': every field is its own RSA-OAEP ciphertext (legacy rows)
+# 'aes-gcm': a per-row AES-256 data key wrapped with PUBLIC_KEY, fields stored as nonce || AES-GCM ciphertext
+RSA_SCHEME = 'rsa-oaep'
+ENVELOPE_SCHEME = 'aes-gcm'
+CREDENTIAL_FIELDS = ('apikey', 'secret_key', 'passphrase')
+NONCE_SIZE = 12
+
+# Unwrapped data keys, in memory only, keyed by a digest of the wrapped key
+data_key_cache = TTLCache(maxsize=DATA_KEY_CACHE_SIZE, ttl=DATA_KEY_CACHE_TTL)
+
+def _field_aad(account_id: str, field: str) -> bytes:
+    """Bind each ciphertext to its row and column so fields can't be swapped around"""
+    return f"{account_id}:{field}".encode('utf-8')
+
+def unwrap_data_key(wrapped_data_key: bytes) -> bytes:
+    """RSA-unwrap a data key, or take it from the cache"""
+    cache_key = hashlib.blake2b(wrapped_data_key, digest_size=16).digest()
+    data_key = data_key_cache.get(cache_key)
+    if data_key is None:
+        data_key = PRIVATE_KEY.decrypt(
+            wrapped_data_key,
+            padding.OAEP(
+                mgf=padding.MGF1(algorithm=hashes.SHA256()),
+                algorithm=hashes.SHA256(),
+                label=None
+            )
+        )
+        data_key_cache.set(cache_key, data_key)
+    return data_key
+
+def encrypt_credentials_envelope(account_id: str, *plain_texts: Optional[str]) -> tuple:
+    """
+    Encrypt the credential fields of one account under a fresh data key.
+    Returns (wrapped_data_key, *encrypted_fields) as base64 strings, None stays None.
+    """
+    data_key = AESGCM.generate_key(bit_length=256)
+    aesgcm = AESGCM(data_key)
+
+    wrapped_data_key = PUBLIC_KEY.encrypt(
+        data_key,
+        padding.OAEP(
+            mgf=padding.MGF1(algorithm=hashes.SHA256()),
+            algorithm=hashes.SHA256(),
+            label=None
+        )
+    )
+
+    encrypted_fields = []
+    for field, text in zip(CREDENTIAL_FIELDS, plain_texts):
+        if not text:
+            encrypted_fields.append(None)
+            continue
+        nonce = os.urandom(NONCE_SIZE)
+        encrypted = nonce + aesgcm.encrypt(nonce, text.encode('utf-8'), _field_aad(account_id, field))
+        encrypted_fields.append(base64.b64encode(encrypted).decode('utf-8'))
+
+    return (base64.b64encode(wrapped_data_key).decode('utf-8'), *encrypted_fields)
+
+def decrypt_credentials(account_id: str, encryption_scheme: Optional[str], wrapped_data_key: Optional[bytes], *encrypted_values: Optional[bytes]) -> tuple:
+    """Decrypt the raw credential columns of one row, whichever scheme it was stored with"""
+    if encryption_scheme != ENVELOPE_SCHEME:
+        return decrypt_fields(*encrypted_values)
+
+    aesgcm = AESGCM(unwrap_data_key(wrapped_data_key))
+    decrypted = []
+    for field, value in zip(CREDENTIAL_FIELDS, encrypted_values):
+        if value is None:
+            decrypted.append(None)
+            continue
+        plain = aesgcm.decrypt(value[:NONCE_SIZE], value[NONCE_SIZE:], _field_aad(account_id, field))
+        decrypted.append(plain.decode('utf-8'))
+    return tuple(decrypted)
+
+
+# - - - - - CRYPTO EXECUTOR - - - - - 
+_crypto_executor: Optional[Executor] = None
+
+def get_crypto_executor() -> Executor:
+    """Bounded pool for the CPU-bound RSA calls, created lazily so every process gets its own"""
+    global _crypto_executor
+    if _crypto_executor is None:
+        if CRYPTO_EXECUTOR == 'process':
+            _crypto_executor = ProcessPoolExecutor(max_workers=CRYPTO_WORKERS)
+        else:
+            _crypto_executor = ThreadPoolExecutor(max_workers=CRYPTO_WORKERS, thread_name_prefix="crypto")
+    return _crypto_executor
+
+def shutdown_crypto_executor():
+    global _crypto_executor
+    if _crypto_executor is not None:
+        _crypto_executor.shutdown(wait=False, cancel_futures=True)
+        _crypto_executor = None
+
+async def run_crypto(func, *args):
+    """Run a crypto function on the crypto pool without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_crypto_executor(), func, *args)
+
+async def encrypt_data_async(plain_text: str) -> str:
+    return await run_crypto(encrypt_data, plain_text)
+
+async def decrypt_data_async(encrypted_data: str) -> str:
+    return await run_crypto(decrypt_data, encrypted_data)
+
+async def encrypt_fields_async(*plain_texts: Optional[str]) -> tuple:
+    """Encrypt all fields of one account in a single dispatch"""
+    return await run_crypto(encrypt_fields, *plain_texts)
+
+@traced("crypto.decrypt_fields")
+async def decrypt_fields_async(*encrypted_values: Optional[bytes]) -> tuple:
+    """Decrypt all fields of one account in a single dispatch"""
+    return await run_crypto(decrypt_fields, *encrypted_values)
+
+async def encrypt_credentials_envelope_async(account_id: str, *plain_texts: Optional[str]) -> tuple:
+    return await run_crypto(encrypt_credentials_envelope, account_id, *plain_texts)
+
+@traced("crypto.decrypt_credentials")
+async def decrypt_credentials_async(account_id: str, encryption_scheme: Optional[str], wrapped_data_key: Optional[bytes], *encrypted_values: Optional[bytes]) -> tuple:
+    """Decrypt one account's credential row in a single dispatch"""
+    return await run_crypto(decrypt_credentials, account_id, encryption_scheme, wrapped_data_key, *encrypted_values)
 
 
 def security_testing():
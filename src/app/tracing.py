@@ -0,0 +1,118 @@
+from contextlib import contextmanager
+from functools import wraps
+from typing import Optional, Sequence
+from opentelemetry import trace
+from opentelemetry.trace import Status, StatusCode
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider, ReadableSpan
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter, SpanExporter, SpanExportResult
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+import inspect, logging, threading
+
+from src.config import TRACING_EXPORTER, TRACING_FILE, TRACING_SAMPLE_RATIO
+
+logger = logging.getLogger(__name__)
+
+# Spans are no-ops until configure_tracing installs a provider. FastAPI's own telemetry uses
+# the same global provider for the route, dependency and serialization spans
+tracer = trace.get_tracer("fundy")
+
+
+class JsonLinesSpanExporter(SpanExporter):
+    """One OTLP-style JSON span per line, appended to `path`, for offline analysis"""
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        lines = "".join(span.to_json(indent=None) + "\n" for span in spans)
+        try:
+            with self._lock, open(self.path, "a") as file:
+                file.write(lines)
+        except OSError as e:
+            logger.warning(f"Could not write spans to {self.path}: {e}")
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        pass
+
+
+def _exporter(name: str) -> SpanExporter:
+    if name == "file":
+        return JsonLinesSpanExporter(TRACING_FILE)
+    if name == "console":
+        return ConsoleSpanExporter()
+    if name == "otlp":
+        # Optional package, endpoint and headers come from the standard OTEL_EXPORTER_OTLP_* variables
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter()
+    raise ValueError(f"Unknown TRACING_EXPORTER: {name}")
+
+
+def configure_tracing(service_name: str, exporter: str = TRACING_EXPORTER, sample_ratio: float = TRACING_SAMPLE_RATIO) -> Optional[TracerProvider]:
+    """
+    Install the tracer provider of this process, once at startup. Spans are batched and exported
+    from a background thread. Returns None when TRACING_EXPORTER is 'none'.
+    """
+    if exporter == "none":
+        return None
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": service_name}),
+        sampler=ParentBased(TraceIdRatioBased(sample_ratio)),
+    )
+    provider.add_span_processor(BatchSpanProcessor(_exporter(exporter)))
+    trace.set_tracer_provider(provider)
+    return provider
+
+
+def tracing_enabled() -> bool:
+    return isinstance(trace.get_tracer_provider(), TracerProvider)
+
+
+def traced(name: str, **attributes):
+    """Run the decorated function, sync or async, in a span called `name`"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def wrapper(*args, **kwargs):
+                with tracer.start_as_current_span(name, attributes=attributes):
+                    return await func(*args, **kwargs)
+        else:
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with tracer.start_as_current_span(name, attributes=attributes):
+                    return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Child span of the current one, for blocks that aren't a whole function"""
+    with tracer.start_as_current_span(name, attributes=attributes) as current:
+        yield current
+
+
+class HttpxTraceHook:
+    """
+    httpx `trace` extension turning httpcore's connection events into child spans: TCP connect to
+    the proxy, the CONNECT tunnel, TLS through it and the wait for the exchange's response headers.
+    """
+    def __init__(self) -> None:
+        self._spans = {}
+
+    async def __call__(self, event_name: str, info: dict):
+        name, _, phase = event_name.rpartition(".")
+        if phase == "started":
+            self._spans[name] = tracer.start_span(f"http.{name.split('.')[-1]}")
+            return
+
+        started = self._spans.pop(name, None)
+        if started is None:
+            return
+        if phase == "failed":
+            started.set_status(Status(StatusCode.ERROR, str(info.get("exception", ""))))
+        started.end()
+
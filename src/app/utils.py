@@ -1,5 +1,17 @@
-import hashlib
-import json
+from contextlib import asynccontextmanager
+from datetime import datetime, date
+from decimal import Decimal
+from typing import Any, Awaitable, Callable, Iterable, Optional
+from uuid import UUID
+import asyncio, hashlib, json, logging, time, uuid
+
+from redis.exceptions import RedisError
+import redis.asyncio as aioredis
+import msgpack
+
+from src.config import REDIS_URL, REDIS_NAMESPACE, REDIS_SOCKET_TIMEOUT, REDIS_LOCK_TTL, REDIS_LOCK_WAIT
+
+logger = logging.getLogger(__name__)
 
 
 def generate_id(string: str):
@@ -9,8 +21,269 @@ def generate_id(string: str):
     return unique_id
 
 
+def _pack_default(value: Any):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (Decimal, UUID)):
+        return str(value)
+    raise TypeError(f"Can't encode {type(value).__name__} for Redis")
+
+def pack(value: Any) -> bytes:
+    return msgpack.packb(value, use_bin_type=True, default=_pack_default)
+
+def unpack(data: Optional[bytes]) -> Any:
+    return None if data is None else msgpack.unpackb(data, raw=False)
+
+
 class RedisClient:
-    pass
+    """
+    Async Redis shared by every API replica and worker.
+
+    Keys are namespaced (`<namespace>:<key>`) and always written with a TTL, values are msgpack.
+    Redis is a cache here, never the source of truth: when it's unreachable reads miss, writes
+    are dropped and single_flight just runs the loader.
+    """
+    # After a failure Redis is skipped for this long instead of timing out on every call
+    RETRY_AFTER = 5.0
+    # Only the holder of the lock (same token) may release it
+    _RELEASE_LOCK = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+    def __init__(self, url: str = REDIS_URL, namespace: str = REDIS_NAMESPACE) -> None:
+        self.url = url
+        self.namespace = namespace
+        self._redis: Optional[aioredis.Redis] = None
+        self._scripts: dict[str, Any] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._background: set[asyncio.Task] = set()
+        self._down_until = 0.0
+
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.lock_waits = 0
+
+    @property
+    def redis(self) -> aioredis.Redis:
+        """Connection pool of the running loop, rebuilt if a different loop shows up"""
+        loop = asyncio.get_running_loop()
+        if self._redis is None or self._loop is not loop:
+            self._redis = aioredis.from_url(
+                self.url,
+                socket_timeout=REDIS_SOCKET_TIMEOUT,
+                socket_connect_timeout=REDIS_SOCKET_TIMEOUT,
+            )
+            self._scripts = {}
+            self._loop = loop
+        return self._redis
+
+    def key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self._down_until
+
+    def _failed(self, action: str, error: Exception):
+        self.errors += 1
+        self._down_until = time.monotonic() + self.RETRY_AFTER
+        logger.warning(f"Redis {action} failed, skipping it for {self.RETRY_AFTER}s: {error}")
+
+    # - - - VALUES - - -
+    async def get(self, key: str) -> Any:
+        if not self.available:
+            return None
+        try:
+            value = unpack(await self.redis.get(self.key(key)))
+        except RedisError as e:
+            self._failed("get", e)
+            return None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def get_many(self, keys: Iterable[str]) -> list[Any]:
+        keys = list(keys)
+        if not keys or not self.available:
+            return [None] * len(keys)
+        try:
+            values = [unpack(value) for value in await self.redis.mget([self.key(key) for key in keys])]
+        except RedisError as e:
+            self._failed("mget", e)
+            return [None] * len(keys)
+        found = sum(value is not None for value in values)
+        self.hits += found
+        self.misses += len(values) - found
+        return values
+
+    async def set(self, key: str, value: Any, ttl: float):
+        await self.set_many({key: value}, ttl)
+
+    async def set_many(self, values: dict[str, Any], ttl: float):
+        """One round trip for every key"""
+        if not values or not self.available:
+            return
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key, value in values.items():
+                    pipe.set(self.key(key), pack(value), px=max(int(ttl * 1000), 1))
+                await pipe.execute()
+        except RedisError as e:
+            self._failed("set", e)
+
+    async def hget(self, key: str, field: str) -> Any:
+        if not self.available:
+            return None
+        try:
+            value = unpack(await self.redis.hget(self.key(key), field))
+        except RedisError as e:
+            self._failed("hget", e)
+            return None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def hset(self, key: str, field: str, value: Any, ttl: float):
+        """Set one field and push the TTL of the whole hash out to `ttl`"""
+        if not self.available:
+            return
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.hset(self.key(key), field, pack(value))
+                pipe.pexpire(self.key(key), max(int(ttl * 1000), 1))
+                await pipe.execute()
+        except RedisError as e:
+            self._failed("hset", e)
+
+    async def delete(self, *keys: str):
+        if not keys or not self.available:
+            return
+        try:
+            await self.redis.unlink(*(self.key(key) for key in keys))
+        except RedisError as e:
+            self._failed("delete", e)
+
+    async def run_script(self, script: str, keys: list[str], args: list[Any]) -> Any:
+        """EVALSHA a Lua script (loaded on first use) on namespaced `keys`, None when Redis is unavailable"""
+        if not self.available:
+            return None
+        try:
+            if script not in self._scripts:
+                self._scripts[script] = self.redis.register_script(script)
+            return await self._scripts[script](keys=[self.key(key) for key in keys], args=args)
+        except RedisError as e:
+            self._failed("script", e)
+            return None
+
+    def delete_soon(self, *keys: str):
+        """delete() from sync code running on the loop, e.g. an after_commit hook"""
+        try:
+            task = asyncio.get_running_loop().create_task(self.delete(*keys))
+        except RuntimeError:
+            return  # no loop, nothing was cached from here either
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    # - - - COORDINATION - - -
+    @asynccontextmanager
+    async def lock(self, key: str, ttl: float = REDIS_LOCK_TTL):
+        """Yield True to the one caller across replicas that holds `key`, False to the others"""
+        lock_key, token = f"lock:{key}", uuid.uuid4().hex
+        acquired = None  # Redis is down, nobody can coordinate
+        if self.available:
+            try:
+                acquired = bool(await self.redis.set(self.key(lock_key), token, nx=True, px=int(ttl * 1000)))
+            except RedisError as e:
+                self._failed("lock", e)
+
+        try:
+            yield acquired is not False
+        finally:
+            if acquired:
+                await self.run_script(self._RELEASE_LOCK, [lock_key], [token]) # expires after `ttl` anyway
+
+    async def single_flight(
+            self,
+            key: str,
+            loader: Callable[[], Awaitable[Any]],
+            read: Callable[[], Awaitable[Any]],
+            write: Callable[[Any], Awaitable[None]],
+            wait: float = REDIS_LOCK_WAIT,
+        ) -> Any:
+        """
+        Run `loader` on one replica at a time for `key` and `write` its result. The other replicas
+        poll `read` until that result shows up (not None), and load it themselves after `wait`.
+        """
+        async with self.lock(key) as holder:
+            if holder:
+                value = await loader()
+                await write(value)
+                return value
+
+        self.lock_waits += 1
+        deadline, delay = time.monotonic() + wait, 0.02
+        while time.monotonic() < deadline:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.25)
+            value = await read()
+            if value is not None:
+                return value
+
+        logger.warning(f"Gave up waiting on the holder of {key}, loading it here")
+        return await loader()
+
+    # - - - PUB/SUB - - -
+    async def publish(self, channel: str, message: Any):
+        if not self.available:
+            return
+        try:
+            await self.redis.publish(self.key(channel), pack(message))
+        except RedisError as e:
+            self._failed("publish", e)
+
+    async def listen(self, channel: str, handler: Callable[[Any], None]):
+        """Call `handler` with every message of `channel` until cancelled, reconnecting on errors"""
+        # Own connection without a read timeout, it sits idle until something is published
+        client = aioredis.from_url(self.url, socket_connect_timeout=REDIS_SOCKET_TIMEOUT)
+        try:
+            while True:
+                try:
+                    async with client.pubsub(ignore_subscribe_messages=True) as pubsub:
+                        await pubsub.subscribe(self.key(channel))
+                        async for message in pubsub.listen():
+                            # A bad message (other deploy, old schema) is skipped, it mustn't end the subscription
+                            try:
+                                handler(unpack(message["data"]))
+                            except Exception as e:
+                                logger.error(f"Skipped a message on {channel}, its handler failed: {e!r}")
+                except RedisError as e:
+                    logger.warning(f"Redis subscription to {channel} failed, retrying in {self.RETRY_AFTER}s: {e}")
+                    await asyncio.sleep(self.RETRY_AFTER)
+        finally:
+            await client.aclose()
+
+    async def close(self):
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "namespace": self.namespace,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "lock_waits": self.lock_waits,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+# Shared by the API process, see SWRCache(shared=...) and security.get_current_active_account
+redis_client = RedisClient()
 
 
 
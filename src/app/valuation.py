@@ -0,0 +1,146 @@
+from typing import Mapping, NamedTuple, Optional, Sequence
+from aiohttp import ClientSession, ClientError, ClientTimeout
+import logging, time
+import numpy as np
+
+from src.config import PRICE_SNAPSHOT_TTL
+from .cache import TTLCache
+from .utils import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Columns of every valuation, in the order of the history tables' *_value columns
+CURRENCIES = ("usd", "eur", "gbp", "btc", "mxn")
+
+# CoinGecko ids of the coins we price. Exchange balances come in USDT, anything else is a spot holding
+COINGECKO_IDS = {
+    "USDT": "tether",
+    "USDC": "usd-coin",
+    "DAI": "dai",
+    "BTC": "bitcoin",
+    "ETH": "ethereum",
+    "BNB": "binancecoin",
+    "SOL": "solana",
+    "XRP": "ripple",
+    "DOGE": "dogecoin",
+    "ADA": "cardano",
+    "TRX": "tron",
+    "TON": "the-open-network",
+    "LTC": "litecoin",
+    "BGB": "bitget-token",
+    "KCS": "kucoin-shares",
+    "OKB": "okb",
+}
+
+COINGECKO_URL = "https://api.coingecko.com/api/v3/simple/price"
+
+
+class PriceSnapshot(NamedTuple):
+    """Value of one unit of each coin in each of CURRENCIES, NaN where CoinGecko had no price"""
+    coins: dict[str, int]     # symbol -> row of `prices`
+    prices: np.ndarray        # (coins, currencies)
+    taken_at: float
+
+
+def snapshot_from_quotes(quotes: Mapping[str, Mapping[str, float]], taken_at: float) -> PriceSnapshot:
+    """PriceSnapshot of a CoinGecko /simple/price answer ({id: {currency: price}})"""
+    coins = {symbol: row for row, symbol in enumerate(COINGECKO_IDS)}
+    prices = np.array([
+        [quotes.get(coingecko_id, {}).get(currency, np.nan) for currency in CURRENCIES]
+        for coingecko_id in COINGECKO_IDS.values()
+    ], dtype=np.float64)
+    return PriceSnapshot(coins, prices, taken_at)
+
+
+async def _fetch_quotes() -> Optional[dict]:
+    """Every coin in every currency, one CoinGecko call"""
+    params = {"ids": ",".join(COINGECKO_IDS.values()), "vs_currencies": ",".join(CURRENCIES)}
+    try:
+        async with ClientSession(timeout=ClientTimeout(total=10)) as session:
+            async with session.get(COINGECKO_URL, params=params) as response:
+                if response.status == 200:
+                    return {"quotes": await response.json(), "taken_at": time.time()}
+                logger.warning("CoinGecko price snapshot request failed", extra={"status": response.status})
+    except (ClientError, TimeoutError) as e:
+        logger.warning("Network error fetching the CoinGecko price snapshot", extra={"error": str(e)})
+    return None
+
+
+_snapshots = TTLCache(maxsize=1, ttl=PRICE_SNAPSHOT_TTL)
+_last_snapshot: Optional[PriceSnapshot] = None
+
+
+async def get_price_snapshot() -> PriceSnapshot:
+    """
+    Current prices, fetched at most once per PRICE_SNAPSHOT_TTL across the replicas and workers.
+    When CoinGecko fails the previous snapshot is kept, without one every price is NaN.
+    """
+    global _last_snapshot
+    snapshot = _snapshots.get("prices")
+    if snapshot is not None:
+        return snapshot
+
+    async def write(loaded: Optional[dict]):
+        if loaded is not None:
+            await redis_client.set("prices:snapshot", loaded, ttl=PRICE_SNAPSHOT_TTL)
+
+    loaded = await redis_client.get("prices:snapshot")
+    if loaded is None:
+        loaded = await redis_client.single_flight("prices:snapshot", _fetch_quotes, lambda: redis_client.get("prices:snapshot"), write)
+
+    if loaded is not None:
+        snapshot = snapshot_from_quotes(loaded["quotes"], loaded["taken_at"])
+        _last_snapshot = snapshot
+    else:
+        snapshot = _last_snapshot or snapshot_from_quotes({}, time.time())
+
+    _snapshots.set("prices", snapshot)
+    return snapshot
+
+
+def value_holdings(holdings: Sequence[Mapping[str, float]], snapshot: PriceSnapshot) -> np.ndarray:
+    """
+    Value of each holding ({symbol: amount}) in every currency, shape (holdings, CURRENCIES).
+    All holdings go into one amounts matrix valued with a single product against the snapshot.
+    A holding with a coin we can't price is NaN, in the currencies that price is missing for.
+    """
+    rows, columns, amounts = [], [], []
+    unknown, unpriced = set(), []
+    for row, holding in enumerate(holdings):
+        for symbol, amount in holding.items():
+            column = snapshot.coins.get(symbol.upper())
+            if column is None:
+                unknown.add(symbol)
+                unpriced.append(row)
+                continue
+            rows.append(row)
+            columns.append(column)
+            amounts.append(amount)
+
+    if unknown:
+        logger.debug("Holdings without a CoinGecko id left out of the valuation", extra={"coins": sorted(unknown)})
+
+    matrix = np.zeros((len(holdings), len(snapshot.coins)), dtype=np.float64)
+    np.add.at(matrix, (rows, columns), np.asarray(amounts, dtype=np.float64))
+
+    missing = np.isnan(snapshot.prices)
+    values = matrix @ np.where(missing, 0.0, snapshot.prices)
+    values[(matrix != 0) @ missing] = np.nan
+    values[unpriced] = np.nan
+    return values
+
+
+def currency_column(currency: Optional[str]) -> int:
+    """Column of `currency` in a valuation, USD for anything we don't value in"""
+    currency = (currency or "usd").lower()
+    return CURRENCIES.index(currency) if currency in CURRENCIES else 0
+
+
+def as_float(value: float) -> Optional[float]:
+    """Python float of a valuation cell, None for NaN"""
+    return None if np.isnan(value) else float(value)
+
+
+def asset_amount(asset: Mapping) -> float:
+    """Units of an exchange asset entry, free and held alike"""
+    return sum(float(asset.get(field) or 0) for field in ("available", "frozen", "locked"))
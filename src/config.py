@@ -20,6 +20,47 @@ if BASE_DIR.startswith('/home/mrpau') or HOSTNAME == 'mamadocomputer':
 else:
     DOMAIN = os.getenv('TEST_DOMAIN', None)
 
+# Exchange fan-out per request: accounts queried at once, and seconds the whole fan-out may take
+# before the accounts still pending (queued or in flight) are served from their last stored snapshot
+EXCHANGE_FANOUT_CONCURRENCY = int(os.getenv('EXCHANGE_FANOUT_CONCURRENCY', 8))
+EXCHANGE_ACCOUNT_TIMEOUT = float(os.getenv('EXCHANGE_ACCOUNT_TIMEOUT', 5))
+
+# Outbound exchange rate limits as (requests per second, burst), one token bucket per
+# exchange + API key + proxy IP shared by the API replicas and the Celery workers
+EXCHANGE_RATE_LIMITS = {
+    'bitget': (float(os.getenv('BITGET_RATE_LIMIT', 10)), int(os.getenv('BITGET_RATE_BURST', 10))),
+    'kucoin': (float(os.getenv('KUCOIN_RATE_LIMIT', 10)), int(os.getenv('KUCOIN_RATE_BURST', 30))),
+    'binance': (float(os.getenv('BINANCE_RATE_LIMIT', 20)), int(os.getenv('BINANCE_RATE_BURST', 40))),
+    'okx': (float(os.getenv('OKX_RATE_LIMIT', 10)), int(os.getenv('OKX_RATE_BURST', 20))),
+}
+# Tokens a process takes from Redis per round trip, and how long it may hold on to unused ones
+EXCHANGE_RATE_PREFETCH = int(os.getenv('EXCHANGE_RATE_PREFETCH', 4))
+EXCHANGE_RATE_PREFETCH_TTL = float(os.getenv('EXCHANGE_RATE_PREFETCH_TTL', 1))
+# Longest a request waits for a token before giving up (a 429 from the API, a retry in the snapshot task)
+EXCHANGE_RATE_MAX_WAIT = float(os.getenv('EXCHANGE_RATE_MAX_WAIT', 10))
+
+# Coin prices and FX rates (CoinGecko), one snapshot shared by every replica and worker for this long
+PRICE_SNAPSHOT_TTL = float(os.getenv('PRICE_SNAPSHOT_TTL', 60))
+
+# Response compression: bodies from COMPRESSION_MIN_SIZE bytes are compressed when the client
+# accepts it, from COMPRESSION_THREAD_SIZE bytes in a worker thread instead of on the event loop
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_THREAD_SIZE = int(os.getenv('COMPRESSION_THREAD_SIZE', 64 * 1024))
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', 5))
+
+# LOGGING
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')  # 'json' or 'text'
+
+# METRICS: Celery workers serve their own /metrics on this port (0 disables it), the API on /metrics
+CELERY_METRICS_PORT = int(os.getenv('CELERY_METRICS_PORT', 9101))
+
+# TRACING: 'none', 'file' (JSON lines in TRACING_FILE), 'console' or 'otlp' (OTEL_EXPORTER_OTLP_* variables)
+TRACING_EXPORTER = os.getenv('TRACING_EXPORTER', 'none')
+TRACING_FILE = os.getenv('TRACING_FILE', 'traces.jsonl')
+TRACING_SAMPLE_RATIO = float(os.getenv('TRACING_SAMPLE_RATIO', 1.0))
+
 # DATABASE
 
 if BASE_DIR.startswith('/home/ububtu'):
@@ -31,8 +72,69 @@ DB_NAME = os.getenv('DB_NAME', 'db-name')
 DB_USER = os.getenv('DB_USER', 'db-user')
 DB_PASS = os.getenv('DB_PASS', 'db-pass')
 
+# Connection pool of every engine (primary and each replica), per process
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 20))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+
+# 'direct' caches prepared statements per connection, 'pgbouncer' is safe behind
+# PgBouncer in transaction mode (no statement cache, unique statement names, no client pool)
+DB_CONNECTION_MODE = os.getenv('DB_CONNECTION_MODE', 'direct')
+DB_STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', 500))
+DB_COMPILED_CACHE_SIZE = int(os.getenv('DB_COMPILED_CACHE_SIZE', 1000))
+
+# Read replicas, comma separated hosts. Empty sends every read to DB_HOST
+DB_REPLICA_HOSTS = [host.strip() for host in os.getenv('DB_REPLICA_HOSTS', '').split(',') if host.strip()]
+# Seconds a user's reads stay on the primary after one of their writes
+REPLICA_READ_AFTER_WRITE_SECONDS = float(os.getenv('REPLICA_READ_AFTER_WRITE_SECONDS', 5))
+
+# Hourly snapshot history writer
+HISTORY_FLUSH_ROWS = int(os.getenv('HISTORY_FLUSH_ROWS', 3000))
+HISTORY_FLUSH_INTERVAL = float(os.getenv('HISTORY_FLUSH_INTERVAL', 5))
+HISTORY_USE_COPY = os.getenv('HISTORY_USE_COPY', 'true').lower() == 'true'
+# A flush failing on a transient error (connection lost, pool timeout, server restarting) is
+# retried this many times, waiting HISTORY_FLUSH_BACKOFF seconds doubling each time, before its rows are dropped
+HISTORY_FLUSH_RETRIES = int(os.getenv('HISTORY_FLUSH_RETRIES', 3))
+HISTORY_FLUSH_BACKOFF = float(os.getenv('HISTORY_FLUSH_BACKOFF', 0.5))
+
+# History tables are partitioned by month, retention drops whole partitions
+HISTORY_RETENTION_MONTHS = int(os.getenv('HISTORY_RETENTION_MONTHS', 18))
+HISTORY_PARTITIONS_AHEAD = int(os.getenv('HISTORY_PARTITIONS_AHEAD', 3))
+
+# Chart rollups, days kept per fine-grained interval (1d and 1w are kept)
+ROLLUP_RETENTION_DAYS = {
+    '1h': int(os.getenv('ROLLUP_1H_RETENTION_DAYS', 30)),
+    '4h': int(os.getenv('ROLLUP_4H_RETENTION_DAYS', 180)),
+}
+
+# History exports, rows fetched per server-side cursor round trip
+HISTORY_STREAM_FETCH_SIZE = int(os.getenv('HISTORY_STREAM_FETCH_SIZE', 2000))
+
+# Dashboard responses (balance overview, accounts overview, assets list): served as is while
+# fresh, served stale while one background refresh runs, loaded inline after that
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 10000))
+RESPONSE_CACHE_FRESH_SECONDS = float(os.getenv('RESPONSE_CACHE_FRESH_SECONDS', 15))
+RESPONSE_CACHE_STALE_SECONDS = float(os.getenv('RESPONSE_CACHE_STALE_SECONDS', 120))
+# Accounts overview delta sync: how long the asset versions of a past response are remembered,
+# a client with an older version gets the whole account again
+OVERVIEW_VERSION_TTL = float(os.getenv('OVERVIEW_VERSION_TTL', 3600))
+
+# Live portfolio updates (SSE / WebSocket): changes within the window go out as one diff,
+# at most LIVE_QUEUE_SIZE diffs wait per connection and a send may block for LIVE_SEND_TIMEOUT
+LIVE_COALESCE_SECONDS = float(os.getenv('LIVE_COALESCE_SECONDS', 0.5))
+LIVE_QUEUE_SIZE = int(os.getenv('LIVE_QUEUE_SIZE', 32))
+LIVE_SEND_TIMEOUT = float(os.getenv('LIVE_SEND_TIMEOUT', 10))
+LIVE_HEARTBEAT_SECONDS = float(os.getenv('LIVE_HEARTBEAT_SECONDS', 15))
+
 # REDIS
-REDIS_URL = 'redis://redis:6379/0'
+REDIS_URL = os.getenv('REDIS_URL', 'redis://redis:6379/0')
+# Prefix of every key the API writes, so environments can share one server
+REDIS_NAMESPACE = os.getenv('REDIS_NAMESPACE', 'mexc')
+REDIS_SOCKET_TIMEOUT = float(os.getenv('REDIS_SOCKET_TIMEOUT', 1))
+# Cross-replica single-flight: how long a lock holder may load, how long the others wait for its result
+REDIS_LOCK_TTL = float(os.getenv('REDIS_LOCK_TTL', 10))
+REDIS_LOCK_WAIT = float(os.getenv('REDIS_LOCK_WAIT', 5))
 
 
 # SECURITY
@@ -55,4 +157,20 @@ PUBLIC_KEY = load_public_key('security/public_key.pem')
 PRIVATE_KEY = load_private_key('security/private_key.pem')
 JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'your-jwt-secret-key')
 
+# Decrypted exchange credentials, kept in memory only
+CREDENTIALS_CACHE_SIZE = int(os.getenv('CREDENTIALS_CACHE_SIZE', 4096))
+CREDENTIALS_CACHE_TTL = float(os.getenv('CREDENTIALS_CACHE_TTL', 300))
+DATA_KEY_CACHE_SIZE = int(os.getenv('DATA_KEY_CACHE_SIZE', 4096))
+DATA_KEY_CACHE_TTL = float(os.getenv('DATA_KEY_CACHE_TTL', 900))
+
+# Verified session tokens and per-user auth context (main account + credentials)
+JWT_CACHE_SIZE = int(os.getenv('JWT_CACHE_SIZE', 16384))
+JWT_CACHE_TTL = float(os.getenv('JWT_CACHE_TTL', 300))
+AUTH_CONTEXT_CACHE_SIZE = int(os.getenv('AUTH_CONTEXT_CACHE_SIZE', 4096))
+AUTH_CONTEXT_CACHE_TTL = float(os.getenv('AUTH_CONTEXT_CACHE_TTL', 30))
+
+# RSA work runs on a bounded pool instead of the event loop ('thread' or 'process')
+CRYPTO_EXECUTOR = os.getenv('CRYPTO_EXECUTOR', 'thread')
+CRYPTO_WORKERS = int(os.getenv('CRYPTO_WORKERS', min(4, os.cpu_count() or 1)))
+
 AVARIABLE_EXCHANGES = ['bitget', 'binance', 'okx', 'kucoin']
\ No newline at end of file
@@ -1,15 +1,26 @@
-from typing import Annotated, Optional
+from typing import Annotated, Literal, Optional, List, Union
 from datetime import datetime, timedelta, timezone as tz
 from decimal import Decimal
-import asyncio, json
+import asyncio, csv, io, json, logging, math
+import numpy as np
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Response, Depends, Query, Request
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Response, Depends, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 
+from src.app.logs import configure_logging
 from src.app.database import crud
-from src.app.database.database import get_all_tables
-from src.app.security import encrypt_data, get_current_active_user, get_current_active_account
+from src.app.cache import SWRCache
+from src.app.compression import CompressionMiddleware
+from src.app.metrics import MetricsMiddleware, render_metrics
+from src.app.tracing import configure_tracing
+from src.app.valuation import CURRENCIES, get_price_snapshot, value_holdings, currency_column, asset_amount, as_float
+from src.app.utils import redis_client
+from src.app.live import live_hub
+from src.app.ratelimit import RateLimited
+from src.app.delta import version_accounts, remember_versions, build_delta, parse_versions, etag_of, etag_matches
+from src.app.database.database import get_all_tables, get_engines, pool_status, dispose_engines
+from src.app.security import encrypt_credentials_envelope_async, decode_session_token, get_current_active_user, get_current_active_account
 from src.app.schemas import (
     RegisterUser,
     LoginUser,
@@ -17,13 +28,27 @@ from src.app.schemas import (
     CloseTradeRequest,
     ScheduledTradeRequest,
     SetRiskManagementRequest,
-    TransferAssetsBase
+    TransferAssetsBase,
+    BalanceOverviewResponse,
+    BalanceHistoryResponse,
+    AssetsHistoryResponse,
+    AccountOverview,
+    AccountOverviewDelta,
 )
 from src.app.proxy import BrightProxy
 from src.app.exchanges.bitget_layer import BitgetLayerConnection
 from src.app.exchanges.exchange_utils import validate_account, get_account_balance_, get_account_assets_, get_spot_assets_
 
-from src.config import DOMAIN
+from src.config import (
+    DOMAIN, EXCHANGE_FANOUT_CONCURRENCY, EXCHANGE_ACCOUNT_TIMEOUT,
+    RESPONSE_CACHE_SIZE, RESPONSE_CACHE_FRESH_SECONDS, RESPONSE_CACHE_STALE_SECONDS,
+    LIVE_SEND_TIMEOUT, LIVE_HEARTBEAT_SECONDS
+)
+
+log_listener = configure_logging()
+# Before FastAPI(), its native telemetry picks up the global tracer provider
+tracer_provider = configure_tracing("fundy-api")
+logger = logging.getLogger(__name__)
 
 app = FastAPI(
     title="Multi-Exchange Connector API",
@@ -45,8 +70,51 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Age", "X-Cache", "ETag"],
+)
+# br/gzip for the large overview and history payloads
+app.add_middleware(CompressionMiddleware)
+# Outermost, so route latency includes compression
+app.add_middleware(MetricsMiddleware)
+
+@app.exception_handler(RateLimited)
+async def rate_limited_handler(request: Request, exc: RateLimited):
+    return JSONResponse(status_code=429, content={"detail": str(exc)}, headers={"Retry-After": str(math.ceil(exc.retry_after))})
+
+# Dashboard responses keyed by (user, account, view), dropped on trades and transfers.
+# Shared through Redis so the replicas don't each hit the exchanges for the same user
+response_cache = SWRCache(
+    maxsize=RESPONSE_CACHE_SIZE,
+    fresh_ttl=RESPONSE_CACHE_FRESH_SECONDS,
+    stale_ttl=RESPONSE_CACHE_STALE_SECONDS,
+    shared=redis_client,
 )
 
+
+async def cached_response(response: Response, user_id: str, account_id: str, view: str, loader):
+    """Serve `view` from the response cache, Age tells the frontend how old it is"""
+    value, age, state = await response_cache.get((str(user_id), account_id, view), loader)
+    response.headers["Age"] = str(int(age))
+    response.headers["X-Cache"] = state
+    return value
+
+listener_tasks = set()
+
+@app.on_event("startup")
+async def listen_for_invalidations():
+    for listener in (response_cache.listen(), live_hub.listen()):
+        listener_tasks.add(asyncio.create_task(listener))
+
+@app.on_event("shutdown")
+async def close_database_pools():
+    for task in listener_tasks:
+        task.cancel()
+    await dispose_engines()
+    await redis_client.close()
+    if tracer_provider is not None:
+        tracer_provider.shutdown()  # exports the spans still batched
+    log_listener.stop()
+
 # ------------------------------------------------------------------------------
 # AUTHENTICATION (Public - Accessible from Frontend)
 # ------------------------------------------------------------------------------
@@ -55,12 +123,7 @@ async def add_new_account(
     user_id: Annotated[tuple[dict, str], Depends(get_current_active_user)],
     request_body: RegisterUser,
     response: Response,
-    request: Request
 ):
-    boddy = await request.body()
-
-    print("the boddy -> ", boddy)
-
     proxy = await BrightProxy.create()
 
     # Get available accounts
@@ -90,13 +153,18 @@ async def add_new_account(
     )
 
     # Add user credentials
+    wrapped_data_key, encrypted_apikey, encrypted_secretkey, encrypted_passphrase = await encrypt_credentials_envelope_async(
+        account_id, request_body.apikey, request_body.secret_key, request_body.passphrase
+    )
     await crud.add_user_credentials(
         account_id=account_id,
-        encrypted_apikey=encrypt_data(request_body.apikey) if request_body.apikey else None,
-        encrypted_secretkey=encrypt_data(request_body.secret_key) if request_body.secret_key else None,
-        encrypted_passphrase=encrypt_data(request_body.passphrase) if request_body.passphrase else None,
+        encrypted_apikey=encrypted_apikey,
+        encrypted_secretkey=encrypted_secretkey,
+        encrypted_passphrase=encrypted_passphrase,
+        wrapped_data_key=wrapped_data_key,
         exchange=request_body.exchange,
     )
+    await response_cache.invalidate(user_id)
 
     response.set_cookie(
         key="accounts",
@@ -151,124 +219,209 @@ async def refresh_token():
 # Balance
 #
 
-@app.get("/balance/overview/{account_id}", description="### Get an overview of the balance of all accounts", tags=["Balance"])
-async def get_balance_overview(user_id: Annotated[tuple[dict, str], Depends(get_current_active_user)], account_id: Optional[str] = "all"):
+async def _account_balance_or_stale(account, proxy: BrightProxy, semaphore: asyncio.Semaphore, deadline: float) -> Optional[dict]:
+    """
+    Live balance of one account by `deadline` (loop time), queueing for the semaphore included.
+    On timeout or error, the last stored snapshot marked as stale, None when there's neither.
+    """
+    error = None
+    try:
+        if account.exchange is None:
+            raise HTTPException(status_code=404, detail="Credentials not found")
+
+        async with asyncio.timeout_at(deadline), semaphore:
+            balance = await get_account_balance_(
+                account_id=account.account_id,
+                exchange=account.exchange,
+                proxy=proxy,
+                apikey=account.apikey,
+                secret_key=account.secret_key,
+                passphrase=account.passphrase,
+                proxy_ip=account.proxy_ip,
+            )
+
+        if not isinstance(balance, dict) or "total" not in balance or "accounts" not in balance:
+            raise ValueError(f"Invalid balance response for account {account.account_id}")
+
+        result = {
+            "id": account.account_id,
+            "total": balance["total"],
+            "24h_change": balance.get("24h_change") or 0.0,
+            "24h_change_percentage": balance.get("24h_change_percentage") or 0.0,
+            "exchange": account.exchange,
+            "account_name": account.account_name,
+            "accounts": {k: float(v) for k, v in balance["accounts"].items()},
+            "stale": False,
+        }
+        await live_hub.publish(account.user_id, account.account_id, {
+            "total": float(result["total"]),
+            "24h_change": float(result["24h_change"]),
+            "24h_change_percentage": float(result["24h_change_percentage"]),
+            "accounts": result["accounts"],
+        })
+        return result
+    except asyncio.TimeoutError:
+        error = f"no response within the {EXCHANGE_ACCOUNT_TIMEOUT}s fan-out deadline"
+    except Exception as e:
+        error = str(e)
+
+    logger.warning("Live balance unavailable, serving the last snapshot", extra={"account_id": account.account_id, "error": error})
+
+    try:
+        last_snapshot = await crud.get_balance_history(account_id=account.account_id, limit=1)
+    except Exception as e:
+        # The overview stays partial: this account is left out instead of failing the whole response
+        logger.error("Last snapshot unavailable, leaving the account out", extra={"account_id": account.account_id, "error": str(e)})
+        return None
+    if last_snapshot.size == 0:
+        return None
+
+    return {
+        "id": account.account_id,
+        "total": float(last_snapshot["balance"][0]),
+        "24h_change": 0.0,
+        "24h_change_percentage": 0.0,
+        "exchange": account.exchange,
+        "account_name": account.account_name,
+        "accounts": {},
+        "stale": True,
+        "as_of": f"{last_snapshot['timestamp'][0]}Z",
+    }
+
+
+@app.get("/balance/overview/{account_id}", description="### Get an overview of the balance of all accounts", tags=["Balance"], response_model=BalanceOverviewResponse)
+async def get_balance_overview(user_id: Annotated[tuple[dict, str], Depends(get_current_active_user)], response: Response, account_id: Optional[str] = "all"):
+    return await cached_response(
+        response, user_id, account_id, "balance-overview",
+        lambda: _load_balance_overview(user_id, account_id)
+    )
+
+async def _load_balance_overview(user_id: str, account_id: str) -> dict:
     proxy = await BrightProxy.create()
 
-    # Fetch user accounts
-    accounts = await crud.get_accounts(user_id=user_id)
+    # Fetch user accounts together with their credentials
+    accounts = await crud.get_accounts_with_credentials(user_id=user_id)
 
     if not accounts:
         raise HTTPException(status_code=404, detail="The user doesn't have any account associated.")
 
     # Filter accounts if a specific account ID is provided
     if account_id != "all":
-        accounts = [acc for acc in accounts if acc["id"] == account_id]
+        accounts = [acc for acc in accounts if acc.account_id == account_id]
         if not accounts:
             raise HTTPException(status_code=404, detail=f"No account found with ID: {account_id}")
 
-    # Fetch account balances
-    final_result = {
-        "total": Decimal("0.0"),
-        "24h_change": Decimal("0.0"),
-        "24h_change_percentage": Decimal("0.0"),
-        "accounts": []
+    # All exchanges at once, bounded, under one deadline: what isn't back by then is served stale
+    semaphore = asyncio.Semaphore(EXCHANGE_FANOUT_CONCURRENCY)
+    deadline = asyncio.get_running_loop().time() + EXCHANGE_ACCOUNT_TIMEOUT
+    results = await asyncio.gather(
+        *(_account_balance_or_stale(account, proxy, semaphore, deadline) for account in accounts)
+    )
+    results = [result for result in results if result is not None]
+
+    # Exchanges report USDT: totals, changes and sub-accounts of every account valued in one pass
+    currency, prices = await asyncio.gather(crud.get_user_currency(user_id=user_id), get_price_snapshot())
+    column = currency_column(currency)
+    holdings = [
+        {"USDT": amount}
+        for result in results
+        for amount in (result["total"], result["24h_change"], *result["accounts"].values())
+    ]
+    values = value_holdings(holdings, prices)[:, column]
+
+    if np.isnan(values).any():
+        logger.warning("No price for the display currency, serving USD", extra={"currency": currency})
+        currency = "usd"
+    else:
+        values = iter(values.tolist())
+        for result in results:
+            result["total"], result["24h_change"] = next(values), next(values)
+            result["accounts"] = {name: next(values) for name in result["accounts"]}
+        currency = CURRENCIES[column]
+
+    # Aggregate once, in Decimal
+    total = sum((Decimal(str(result["total"])) for result in results), Decimal("0.0"))
+    change = sum((Decimal(str(result["24h_change"])) for result in results), Decimal("0.0"))
+    change_percentage = sum((Decimal(str(result["24h_change_percentage"])) for result in results), Decimal("0.0"))
+
+    for result in results:
+        result["total"] = float(result["total"])
+        result["24h_change"] = float(result["24h_change"])
+        result["24h_change_percentage"] = float(result["24h_change_percentage"])
+
+    return {
+        "total": float(total),
+        "24h_change": float(change),
+        "24h_change_percentage": float(change_percentage),
+        "currency": currency,
+        "partial": any(result["stale"] for result in results),
+        "accounts": results  # List of individual account details
     }
 
-    print(accounts)
-    for account in accounts:
-            try:
-                account_information = await crud.get_account(account_id=account["id"])
-                credentials = await crud.get_account_credentials(account_id=account["id"])
-
-                # Current account balance
-                balance = await get_account_balance_(
-                    account_id=account["id"],
-                    exchange=credentials.get("exchange"),
-                    proxy=proxy,
-                    apikey=credentials.get("apikey"),
-                    secret_key=credentials.get("secret_key"),
-                    passphrase=credentials.get("passphrase"),
-                    proxy_ip=account_information.get("proxy_ip"),
-                )
-                
-                print("the balance -> ",balance)
-
-                if not isinstance(balance, dict) or "total" not in balance or "accounts" not in balance:
-                    raise ValueError(f"Invalid balance response for account {account['id']}")
-
-                # Update total balance
-                current_total = Decimal(str(balance["total"]))
-                final_result["total"] += current_total
-
-                # Update 24h change
-                if "24h_change" in balance and balance["24h_change"] is not None:
-                    final_result["24h_change"] += Decimal(str(balance["24h_change"]))
-
-                if "24h_change_percentage" in balance and balance["24h_change_percentage"] is not None:
-                    final_result["24h_change_percentage"] += Decimal(str(balance["24h_change_percentage"]))
-
-                # Store account-specific data
-                final_result["accounts"].append({
-                    "id": account["id"],
-                    "total": float(balance["total"]),
-                    "24h_change": float(balance.get("24h_change", 0.0)),
-                    "24h_change_percentage": float(balance.get("24h_change_percentage", 0.0)),
-                    "exchange": credentials.get("exchange", "unknown"),
-                    "account_name": account_information.get('account_name', 'unknown'),
-                    "accounts": {k: float(v) for k, v in balance["accounts"].items()}
-                })
-            except Exception as e:
-                print("Error getting account balance for account ", account["id"], e)
-
-    response = {
-        "total": float(final_result["total"]),
-        "24h_change": float(final_result["24h_change"]),
-        "24h_change_percentage": float(final_result["24h_change_percentage"]),
-        "accounts": final_result["accounts"]  # List of individual account details
-    }
 
-    print("final return ",response)
+async def _user_account_ids(user_id: str, account_id: str) -> list[str]:
+    """Account IDs the user owns, filtered to `account_id` unless it is all"""
+    accounts = await crud.get_accounts(user_id=user_id)
 
-    return  response
+    if not accounts:
+        raise HTTPException(status_code=404, detail="The user doesn't have any account associated.")
 
+    account_ids = [account["id"] for account in accounts]
+    if account_id == "all":
+        return account_ids
 
-@app.get("/balance/history/{account_id}/{interval}", description="### Get total assets of all accounts", tags=["Balance"])
-async def get_balance_history(account_id: str, interval: Optional[str] = "1d"):
-    proxy = await BrightProxy.create()
+    if account_id not in account_ids:
+        raise HTTPException(status_code=404, detail=f"No account found with ID: {account_id}")
+    return [account_id]
 
 
-    return {}
+@app.get("/balance/history/{account_id}/{interval}", description="### Get total assets of all accounts", tags=["Balance"], response_model=BalanceHistoryResponse)
+async def get_balance_history(
+    user_id: Annotated[tuple[dict, str], Depends(get_current_active_user)],
+    account_id: str,
+    interval: str = "1d",
+    layout: Annotated[Literal["rows", "columns"], Query(description="`columns`: one array per field instead of one object per point")] = "rows",
+):
+    account_ids = await _user_account_ids(user_id, account_id)
+
+    # Served from the pre-aggregated rollups, never from the raw hourly rows
+    history = await crud.get_balance_rollups(account_ids=account_ids, interval=interval, kind="balance", layout=layout)
+
+    return {"interval": interval, "accounts": history}
 
 #
 # Assets
 #
 
 @app.get("/assets/list/{account_id}", description="### Retrive a list of assets per exchange", tags=["Assets"])
-async def get_assets_overview(user_id: Annotated[tuple[str, str], Depends(get_current_active_user)], account_id: Optional[str] = "all"):
+async def get_assets_overview(user_id: Annotated[tuple[str, str], Depends(get_current_active_user)], response: Response, account_id: Optional[str] = "all"):
+    return await cached_response(
+        response, user_id, account_id, "assets-list",
+        lambda: _load_assets_overview(user_id, account_id)
+    )
+
+async def _load_assets_overview(user_id: str, account_id: str) -> dict:
     proxy = await BrightProxy.create()
 
-    accounts = await crud.get_accounts(user_id=user_id)
+    accounts = await crud.get_accounts_with_credentials(user_id=user_id)
 
     if account_id != "all":
-        accounts = [acc for acc in accounts if acc["id"] == account_id]
+        accounts = [acc for acc in accounts if acc.account_id == account_id]
         if not accounts:    
             raise HTTPException(status_code=404, detail=f"No account found with ID: {account_id}")
 
     
     for account in accounts:
-        credentials = await crud.get_account_credentials(account_id=account["id"])
-        if not credentials:
-            raise HTTPException(status_code=404, detail=f"No credentials found for account {account['id']}")
+        if account.exchange is None:
+            raise HTTPException(status_code=404, detail=f"No credentials found for account {account.account_id}")
         
         assets_account = await get_account_assets_(
-            account_id=account["id"],
-            exchange=credentials["exchange"],
+            exchange=account.exchange,
             proxy=proxy,
-            apikey=credentials["apikey"],
-            secret_key=credentials["secret_key"],
-            passphrase=credentials["passphrase"],            
-            proxy_ip=account["proxy_ip"]
+            apikey=account.apikey,
+            secret_key=account.secret_key,
+            passphrase=account.passphrase,            
+            proxy_ip=account.proxy_ip
         )
         
 
@@ -276,12 +429,74 @@ async def get_assets_overview(user_id: Annotated[tuple[str, str], Depends(get_cu
 
     return {}
 
-@app.get("/assets/history/{user_id}/{account}", description="### Get historical asset data for the chart", tags=["Assets"])
-async def get_assets_history(account: str, user_id: Annotated[tuple[str, str], Depends(get_current_active_user)]):
-    proxy = await BrightProxy.create()
+@app.get("/assets/history/{user_id}/{account}", description="### Get historical asset data for the chart", tags=["Assets"], response_model=AssetsHistoryResponse)
+async def get_assets_history(
+    account: str,
+    user_id: Annotated[tuple[str, str], Depends(get_current_active_user)],
+    interval: str = "1d",
+    layout: Annotated[Literal["rows", "columns"], Query(description="`columns`: one array per field instead of one object per point")] = "rows",
+):
+    account_ids = await _user_account_ids(user_id, account)
 
+    spot, futures = await asyncio.gather(
+        crud.get_balance_rollups(account_ids=account_ids, interval=interval, kind="spot", layout=layout),
+        crud.get_balance_rollups(account_ids=account_ids, interval=interval, kind="futures", layout=layout),
+    )
 
-    return {}
+    return {
+        "interval": interval,
+        "accounts": {account_id: {"spot": spot[account_id], "futures": futures[account_id]} for account_id in account_ids}
+    }
+
+HISTORY_EXPORT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+async def _encode_history(account_ids: list[str], kinds: list[str], file_format: str, since: datetime):
+    """Render history chunks as they come off the cursor, one chunk of text per yield"""
+    header = ("kind", *crud.HISTORY_EXPORT_COLUMNS)
+
+    if file_format == "csv":
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(header)
+        yield buffer.getvalue()
+
+    for kind in kinds:
+        async for rows in crud.stream_history(kind, account_ids, since=since):
+            buffer = io.StringIO()
+            if file_format == "csv":
+                csv.writer(buffer).writerows((kind, row[0], row[1].isoformat(), *row[2:]) for row in rows)
+            else:
+                for row in rows:
+                    record = dict(zip(header, (kind, *row)))
+                    record["timestamp"] = row[1].isoformat()
+                    buffer.write(json.dumps(record))
+                    buffer.write("\n")
+            yield buffer.getvalue()
+
+
+@app.get("/history/export/{account_id}", description="### Export the raw balance, spot and futures history as CSV or NDJSON", tags=["Assets"])
+async def export_history(
+    user_id: Annotated[tuple[str, str], Depends(get_current_active_user)],
+    account_id: str,
+    kind: str = "all",
+    file_format: str = Query("csv", alias="format"),
+    days: int = Query(365, ge=1),
+):
+    account_ids = await _user_account_ids(user_id, account_id)
+
+    kinds = ["balance", "spot", "futures"] if kind == "all" else [kind]
+    if any(k not in ("balance", "spot", "futures") for k in kinds):
+        raise HTTPException(status_code=400, detail=f"Invalid history kind {kind}")
+    if file_format not in HISTORY_EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid format {file_format}, use csv or ndjson")
+
+    since = datetime.now(tz.utc) - timedelta(days=days)
+    filename = f"history-{account_id}-{kind}.{file_format}"
+
+    return StreamingResponse(
+        _encode_history(account_ids, kinds, file_format, since),
+        media_type=HISTORY_EXPORT_FORMATS[file_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
 
 #
 # 3) GENERIC ROUTE for all accounts under {user_id}
@@ -299,62 +514,181 @@ async def set_main_account(
     account_id: str,
     user_info: Annotated[tuple[dict, str], Depends(get_current_active_user)],
 ):
-    proxy = await BrightProxy.create()
-    # Logic to set main account
-    return {}
+    await crud.set_main_account(user_id=user_info, account_id=account_id)
+
+    return {"account_id": account_id, "message": "Main account updated"}
 
 @app.post("/accounts/transfer-assets", description="### Transfer assets between accounts", tags=["Account Management"])
 async def transfer_assets(user_id: str, reqiest_boddy: TransferAssetsBase):
     # Needed fiels: client_id, currency, from (payament account), to (receiving account), amount
+    await response_cache.invalidate(user_id)
 
     return {}
 
-@app.get("/accounts/overview",description="### Get overview of all accounts",tags=["Account Management"])
-async def get_account_overview(user_id: Annotated[tuple[dict, str], Depends(get_current_active_user)]):
+@app.get("/accounts/overview",description="### Get overview of all accounts",tags=["Account Management"], response_model=Union[List[AccountOverview], AccountOverviewDelta])
+async def get_account_overview(
+    user_id: Annotated[tuple[dict, str], Depends(get_current_active_user)],
+    request: Request,
+    response: Response,
+    versions: Annotated[Optional[str], Query(description="`id:version,...` of the accounts the client has, only changes come back")] = None,
+):
+    overview = await cached_response(
+        response, user_id, "all", "accounts-overview",
+        lambda: _load_account_overview(user_id)
+    )
+
+    etag = etag_of(overview["versions"])
+    response.headers["ETag"] = etag
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return Response(status_code=304, headers={key: response.headers[key] for key in ("ETag", "Age", "X-Cache")})
+
+    client_versions = parse_versions(versions)
+    if client_versions is None:
+        return overview["accounts"]
+    return await build_delta(overview, client_versions)
+
+async def _load_account_overview(user_id: str) -> dict:
     proxy = await BrightProxy.create()
 
-    accounts = await crud.get_accounts_detailed(user_id=user_id)
+    accounts = await crud.get_accounts_with_credentials(user_id=user_id)
+    accounts = [account for account in accounts if account.exchange is not None]
 
    
     if not accounts:
-        return []
+        return version_accounts([])
 
-    async def process_account(account):
+    async def process_account(account: crud.AccountCredentialsRow):
         assets = await get_spot_assets_(
-            exchange=account["exchange"],
+            exchange=account.exchange,
             proxy=proxy,
-            apikey=account["apikey"],
-            secret_key=account["secret_key"],
-            passphrase=account["passphrase"],
-            proxy_ip=account["proxy_ip"]
+            apikey=account.apikey,
+            secret_key=account.secret_key,
+            passphrase=account.passphrase,
+            proxy_ip=account.proxy_ip
         )
 
         balance = await get_account_balance_(
-            account_id=account["id"],
-            exchange=account["exchange"],
+            account_id=account.account_id,
+            exchange=account.exchange,
             proxy=proxy,
-            apikey=account["apikey"],
-            secret_key=account["secret_key"],
-            passphrase=account["passphrase"],
-            proxy_ip=account["proxy_ip"]
+            apikey=account.apikey,
+            secret_key=account.secret_key,
+            passphrase=account.passphrase,
+            proxy_ip=account.proxy_ip
         )
 
+        await live_hub.publish(account.user_id, account.account_id, {"assets": assets})
+
         return {
-            "id": account["id"],
-            "account_name": account["account_name"],
-            "exchange_name": account["exchange"],
+            "id": account.account_id,
+            "account_name": account.account_name,
+            "exchange_name": account.exchange,
             "assets": assets,
             "balance": balance
         }
 
     # Use asyncio.gather to concurrently process all accounts
-    final_overview = await asyncio.gather(
-        *(process_account(account) for account in accounts)
+    final_overview, currency, prices = await asyncio.gather(
+        asyncio.gather(*(process_account(account) for account in accounts)),
+        crud.get_user_currency(user_id=user_id),
+        get_price_snapshot(),
+    )
+
+    # Every asset of every account valued in the display currency in one pass, None when unpriced
+    column = currency_column(currency)
+    assets = [asset for account in final_overview for asset in account["assets"] or []]
+    values = value_holdings([{asset["symbol"]: asset_amount(asset)} for asset in assets], prices)[:, column]
+    for asset, value in zip(assets, values):
+        asset["value"] = as_float(value)
+    for account in final_overview:
+        account["currency"] = CURRENCIES[column]
+
+    # Versions are computed once per load, every cached hit and delta reuses them
+    overview = version_accounts(list(final_overview))
+    await remember_versions(overview)
+
+    return overview
+
+
+# ------------------------------------------------------------------------------
+# LIVE UPDATES (Public - Accessible from Frontend)
+# ------------------------------------------------------------------------------
+async def _live_snapshot(user_id: str) -> dict[str, dict]:
+    """Last stored balance of every account, the state the live diffs start from"""
+    accounts = await crud.get_accounts(user_id=user_id)
+    snapshots = await asyncio.gather(
+        *(crud.get_balance_history(account_id=account["id"], limit=1) for account in accounts)
     )
 
+    state = {}
+    for account, snapshot in zip(accounts, snapshots):
+        fields = {"account_name": account["account_name"]}
+        if snapshot.size:
+            fields.update(total=float(snapshot["balance"][0]), as_of=f"{snapshot['timestamp'][0]}Z")
+        state[account["id"]] = fields
+    return state
+
+def _sse_event(message: dict) -> str:
+    return f"event: {message['type']}\ndata: {json.dumps(message)}\n\n"
+
+
+@app.get("/live/sse", description="### Live balance and asset diffs of every account, as Server-Sent Events", tags=["Live"])
+async def live_updates_sse(user_id: Annotated[tuple[dict, str], Depends(get_current_active_user)], request: Request):
+    subscriber = live_hub.subscribe(user_id)
+    try:
+        snapshot = subscriber.snapshot(await _live_snapshot(user_id))
+    except BaseException:
+        live_hub.unsubscribe(subscriber)
+        raise
+
+    async def events():
+        try:
+            yield _sse_event(snapshot)
+            while True:
+                try:
+                    message = await asyncio.wait_for(subscriber.queue.get(), LIVE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": ping\n\n"
+                    continue
+                yield _sse_event(message)
+        finally:
+            live_hub.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
-    return final_overview
+@app.websocket("/live/ws")
+async def live_updates_ws(websocket: WebSocket, access_token: str):
+    # Browsers can't set headers on a WebSocket, the session token comes in the query string
+    try:
+        user_id = decode_session_token(access_token)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+
+    await websocket.accept()
+    subscriber = live_hub.subscribe(user_id)
+    try:
+        await websocket.send_json(subscriber.snapshot(await _live_snapshot(user_id)))
+        while True:
+            try:
+                message = await asyncio.wait_for(subscriber.queue.get(), LIVE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                message = {"type": "ping"}
+            # A client that stops reading is dropped instead of holding updates forever
+            await asyncio.wait_for(websocket.send_json(message), LIVE_SEND_TIMEOUT)
+    except asyncio.TimeoutError:
+        await websocket.close(code=1013)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        live_hub.unsubscribe(subscriber)
 
 
 # ------------------------------------------------------------------------------
@@ -364,6 +698,8 @@ async def get_account_overview(user_id: Annotated[tuple[dict, str], Depends(get_
 async def open_trades(request_body: TradeRequest):
     proxy = await BrightProxy.create()
     # Logic to open trades
+    for user_id in request_body.user_ids:
+        await response_cache.invalidate(user_id)
     return {"message": "Trades opened successfully"}
 
 
@@ -371,6 +707,8 @@ async def open_trades(request_body: TradeRequest):
 async def close_trades(request_body: CloseTradeRequest):
     proxy = await BrightProxy.create()
     # Logic to close trades
+    for user_id in request_body.user_ids:
+        await response_cache.invalidate(user_id)
     return {"message": "Trades closed successfully"}
 
 
@@ -378,6 +716,8 @@ async def close_trades(request_body: CloseTradeRequest):
 async def schedule_multiple_trades(request_body: ScheduledTradeRequest, background_tasks: BackgroundTasks):
     proxy = await BrightProxy.create()
     # Logic to schedule trades
+    for user_id in request_body.user_ids:
+        await response_cache.invalidate(user_id)
     return {"message": "Trades scheduled successfully"}
 
 
@@ -406,6 +746,20 @@ async def get_spot_assets():
     return {}
 
 
+# ------------------------------------------------------------------------------
+# STATUS (Internal - Accessed by APIs in the same VPC)
+# ------------------------------------------------------------------------------
+@app.get("/status/database", description="### Connection pool usage of the primary and replica engines", tags=["Status"])
+async def get_database_status():
+    return {"pools": pool_status(), "replicas": len(get_engines().replicas)}
+
+
+@app.get("/metrics", description="### Prometheus metrics: route, exchange, proxy and DB latency, pool saturation", tags=["Status"])
+async def get_metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)